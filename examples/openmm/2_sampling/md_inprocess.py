@@ -0,0 +1,45 @@
+from simtk.openmm import app
+from simtk import unit
+import simtk.openmm as mm
+
+# For mmengine: openmm_inprocess, the OpenMM python file must define:
+# 1. reportInterval, the number of steps between sampled geometries
+# 2. createSimulation(prmtop, platform), which builds the Simulation
+# 3. sample(simulation, reporter), which equilibrates and then samples
+# createSimulation is called once per cycle, and sample once per conformer
+# with the positions of that conformer already set.
+
+# Sample geometries every 10 ps
+reportInterval = 10000
+
+def createSimulation(prmtop, platform):
+    # Create OpenMM system
+    system = prmtop.createSystem(nonbondedMethod=app.NoCutoff, nonbondedCutoff=1*unit.nanometer, removeCMMotion=True, constraints=None, rigidWater=True)
+    integrator = mm.LangevinIntegrator(30*unit.kelvin, 1.0/unit.picosecond, 0.001*unit.picoseconds)
+    integrator.setConstraintTolerance(1e-05)
+
+    # Add spherical, harmonic restraining potential
+    force = mm.CustomExternalForce('k*max(0, r-0.563)^2; r=sqrt(x*x+y*y+z*z)')
+    force.addGlobalParameter("k", 10.0*unit.kilocalories_per_mole/unit.angstroms**2)
+    system.addForce(force)
+    for i in range(system.getNumParticles()):
+        force.addParticle(i,[])
+
+    # Fix one molecule in the center of the system
+    system.setParticleMass(0, 1e10)
+
+    return app.Simulation(prmtop.topology, system, integrator, platform)
+
+def sample(simulation, reporter):
+    # Minimize system
+    simulation.minimizeEnergy()
+
+    # Equilibrate system
+    simulation.context.setVelocitiesToTemperature(30 * unit.kelvin)
+    for i in range(10):
+        simulation.integrator.setTemperature(30 * (i+1) * unit.kelvin)
+        simulation.step(10000)
+
+    # Run sampling dynamics
+    simulation.reporters.append(reporter)
+    simulation.step(900000)
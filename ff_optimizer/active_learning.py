@@ -1,8 +1,7 @@
 import os
 from copy import deepcopy
-from multiprocessing import Pool
+from multiprocessing import Pool, current_process
 from pathlib import Path
-from random import sample
 from shutil import copytree, rmtree
 
 import numpy as np
@@ -12,8 +11,9 @@ try:
 except:
     pass
 
-from . import utils
+from . import selection, utils
 from .inputs import Input
+from .leapcache import LeapCache, runTleap
 from .model import AbstractModel, Model
 
 # from time import perf_counter
@@ -88,6 +88,43 @@ def sanderEnergyForce(geometry):
     return [energy.tot, force]
 
 
+def computeShardStar(inp):
+    """
+    Helper function for multiprocessing energy and force evaluation.
+
+    Args:
+        inp (tuple): Model index, index of the first geometry, parameter
+            topology file, and geometries of the shard.
+
+    Returns:
+        tuple: Model index, index of the first geometry, energies, and forces.
+    """
+    k, start, prmtop, geometries = inp
+    energies, forces = computeShard(prmtop, geometries)
+    return k, start, energies, forces
+
+
+def computeShard(prmtop, geometries):
+    """
+    Compute energies and forces of a shard of geometries with one prmtop.
+    Each call opens its own sander context, so shards can be evaluated in
+    separate processes.
+
+    Args:
+        prmtop (Path): Path to the parameter topology file.
+        geometries (list): List of flattened geometries.
+
+    Returns:
+        tuple: Array of energies and array of forces (one row per geometry).
+    """
+    energies = np.empty(len(geometries), dtype=np.float32)
+    forces = np.empty((len(geometries), len(geometries[0])), dtype=np.float32)
+    with sander.setup(str(prmtop), geometries[0], None, sander.gas_input()):
+        for i, geometry in enumerate(geometries):
+            energies[i], forces[i, :] = sanderEnergyForce(geometry)
+    return energies, forces
+
+
 class ActiveLearningModel(AbstractModel):
     """
     Main class for active learning model, inheriting from AbstractModel.
@@ -149,7 +186,7 @@ class ActiveLearningModel(AbstractModel):
             inp (Input): Input object containing configuration parameters.
         """
         os.chdir(inp.optdir)
-        os.system(f"tleap -f setup.leap > leap.out")
+        runTleap("setup.leap", self.leapCache)
         self.prmtop = None
         for f in os.listdir():
             if f.endswith(".prmtop"):
@@ -185,6 +222,12 @@ class ActiveLearningModel(AbstractModel):
         self.home = os.getcwd()
         self.nmodels = inp.activelearning
         self.nthreads = min(os.cpu_count(), self.nmodels)
+        self.evalWorkers = os.cpu_count()
+        self.strategy = selection.getStrategy(inp.alstrategy)
+        if inp.leapcache is None:
+            self.leapCache = None
+        else:
+            self.leapCache = LeapCache(inp.leapcache)
         self.models = []
         self.trainGeometries = None
         self.validGeometries = None
@@ -284,27 +327,37 @@ class ActiveLearningModel(AbstractModel):
         dirs = ["train"]
         for k in range(1, self.nmodels):
             dirs.append(f"valid_{str(k)}")
+        # The sets collected for each model are disjoint, so all of them are
+        # evaluated with every prmtop at once and each selection below only
+        # slices this cycle's evaluation matrix
+        geometries = []
+        offsets = [0]
         for k in range(self.nmodels):
-            geometries = self.collectAll(i, k)
-            energies, forces = self.computeAll(geometries, prmtops)
+            geometries += self.collectAll(i, k)
+            offsets.append(len(geometries))
+        allEnergies, allForces = self.computeAll(geometries, prmtops)
+        for k in range(self.nmodels):
+            start, end = offsets[k], offsets[k + 1]
+            energies = allEnergies[:, start:end]
+            forces = allForces[:, start:end, :]
             if self.trainGeometries == self.validGeometries:
                 geometryIndices = self.chooseGeometries(
-                    energies, forces, self.trainGeometries
+                    energies, forces, self.trainGeometries, geometries[start:end]
                 )
-                newGeometries = [geometries[i] for i in geometryIndices]
+                newGeometries = [geometries[start + i] for i in geometryIndices]
                 for j in range(self.nmodels):
                     self.writeGeoms(
                         newGeometries, os.path.join(sampleDirs[j], dirs[j - k])
                     )
             else:
                 geometryIndices = self.chooseGeometries(
-                    energies, forces, self.trainGeometries
+                    energies, forces, self.trainGeometries, geometries[start:end]
                 )
-                trainGeometries = [geometries[i] for i in geometryIndices]
+                trainGeometries = [geometries[start + i] for i in geometryIndices]
                 geometryIndices = self.chooseGeometries(
-                    energies, forces, self.validGeometries
+                    energies, forces, self.validGeometries, geometries[start:end]
                 )
-                validGeometries = [geometries[i] for i in geometryIndices]
+                validGeometries = [geometries[start + i] for i in geometryIndices]
                 for j in range(self.nmodels):
                     if j == k:
                         self.writeGeoms(
@@ -327,21 +380,9 @@ class ActiveLearningModel(AbstractModel):
             list: List of energy and force results.
         """
         with sander.setup(prmtop, geometries[0], None, sander.gas_input()):
-            # parallel code
-            # paraStart = perf_counter()
-            # with multiprocessing.Pool(None) as pool:
-            #    results = pool.map(sanderEnergyForce,geometries,2)
-            # paraEnd = perf_counter()
-
-            # serial code
             results = []
             for i in range(len(geometries)):
                 results.append(sanderEnergyForce(geometries[i]))
-            # serEnd = perf_counter()
-            # paraTime = paraEnd - paraStart
-            # serTime = serEnd - paraEnd
-            # print(paraTime, serTime)
-
         return results
 
     def collectAll(self, i, j):
@@ -380,9 +421,11 @@ class ActiveLearningModel(AbstractModel):
                 for f in os.listdir():
                     if f.endswith(".nc"):
                         ncs.append(f)
-                self.symbols = utils.getSymbolsFromPrmtop(os.path.join("..", prmtop))
-                for nc in ncs:
-                    utils.convertNCtoXYZs(nc, self.symbols)
+                symbols = utils.getSymbolsFromPrmtop(os.path.join("..", prmtop))
+                self.symbols = [symbol for symbol in symbols if symbol != "X"]
+                if len(ncs) > 0:
+                    coords = [utils.readNCGeometries(nc, symbols) for nc in ncs]
+                    utils.writeGeometries(np.concatenate(coords), self.symbols)
                 os.chdir(currentDir)
             tempGeoms = self.collectGeometries(sampleDir)
             if self.trainGeometries is None and k == j:
@@ -403,74 +446,89 @@ class ActiveLearningModel(AbstractModel):
         Returns:
             list: List of collected geometries.
         """
-        geometries = []
-        for f in os.listdir(sampleDir):
-            if ".xyz" in f:
-                fPath = os.path.join(sampleDir, f)
-                if self.symbols is None:
-                    geometry, self.symbols = utils.readXYZ(fPath, readSymbols=True)
-                    geometries.append(geometry)
-                else:
-                    geometries.append(utils.readXYZ(fPath))
-                os.remove(fPath)
-        return geometries
+        store = utils.getGeometryStorePath(sampleDir)
+        if store.is_file():
+            xyzs = [store]
+        else:
+            xyzs = utils.getXYZs(sampleDir)
+        geometries, symbols = utils.readGeometries(sampleDir)
+        if self.symbols is None and len(symbols) > 0:
+            self.symbols = symbols
+        for f in xyzs:
+            os.remove(f)
+        return list(geometries.values())
 
     def computeAll(self, geometries, prmtops):
         """
-        Compute energies and forces for all models.
+        Compute energies and forces for all models. The geometries are split
+        into shards, and every (prmtop, shard) pair is evaluated in a pool of
+        worker processes, each with its own sander context.
 
         Args:
             geometries (list): List of geometries.
             prmtops (list): List of paths to parameter topology files.
 
         Returns:
-            tuple: Tuple containing arrays of energies and forces.
-        """
-        energies = []
-        forces = []
-        allEnergies = []
-        allForces = []
-        for prmtop in prmtops:
-            results = self.computeEnergyForce(geometries, prmtop)
-            for result in results:
-                energies.append(result[0])
-                forces.append(result[1])
-            allEnergies.append(energies)
-            allForces.append(forces)
-            energies = []
-            forces = []
-
-        allEnergies = np.asarray(allEnergies, dtype=np.float32)
-        allForces = np.asarray(allForces, dtype=np.float32)
+            tuple: Tuple containing arrays of energies and forces, of shapes
+                (models, geometries) and (models, geometries, 3N).
+        """
+        allEnergies = np.empty((len(prmtops), len(geometries)), dtype=np.float32)
+        allForces = np.empty(
+            (len(prmtops), len(geometries), len(geometries[0])), dtype=np.float32
+        )
+        tasks = self.getShards(geometries, prmtops)
+        # Pool workers can't have children
+        if len(tasks) > 1 and not current_process().daemon:
+            with Pool(min(self.evalWorkers, len(tasks))) as p:
+                results = p.imap_unordered(computeShardStar, tasks)
+                for k, start, energies, forces in results:
+                    allEnergies[k, start : start + len(energies)] = energies
+                    allForces[k, start : start + len(energies), :] = forces
+        else:
+            for k, start, energies, forces in map(computeShardStar, tasks):
+                allEnergies[k, start : start + len(energies)] = energies
+                allForces[k, start : start + len(energies), :] = forces
 
         return allEnergies, allForces
 
-    def chooseGeometries(self, energies, forces, geomsNeeded):
+    def getShards(self, geometries, prmtops):
         """
-        Choose geometries based on force spread.
+        Split the energy and force evaluations into tasks for the workers.
+        Each prmtop gets enough shards of the geometries to keep all
+        workers busy.
+
+        Args:
+            geometries (list): List of geometries.
+            prmtops (list): List of paths to parameter topology files.
+
+        Returns:
+            list: Tuples of model index, index of the first geometry,
+                parameter topology file, and geometries of the shard.
+        """
+        nshards = -(-max(self.evalWorkers, 1) // len(prmtops))
+        nshards = max(min(nshards, len(geometries)), 1)
+        bounds = np.linspace(0, len(geometries), nshards + 1).astype(int)
+        tasks = []
+        for k, prmtop in enumerate(prmtops):
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                tasks.append((k, int(start), prmtop, geometries[start:end]))
+        return tasks
+
+    def chooseGeometries(self, energies, forces, geomsNeeded, geometries=None):
+        """
+        Choose geometries with the selection strategy set by alstrategy.
 
         Args:
             energies (np.ndarray): Array of energies.
             forces (np.ndarray): Array of forces.
             geomsNeeded (int): Number of geometries needed.
+            geometries (list, optional): Geometries the energies and forces
+                belong to. Defaults to None.
 
         Returns:
             list: Indices of chosen geometries.
         """
-        if self.nmodels == 2:
-            # energySpread = np.abs(energies[0,:] - energies[1,:])
-            forceSpread = np.linalg.norm(forces[0, :, :] - forces[1, :, :], axis=1)
-        else:
-            # energySpread = np.std(energies, axis=1)
-            forceSpread = np.linalg.norm(np.std(forces, axis=0), axis=1)
-        # For now, we only consider spread in forces
-        indices = list(np.argsort(forceSpread))
-        # Grab half of geometries by spread criterion; other half randomly
-        newGeoms = [indices[-k] for k in range(1, int((geomsNeeded + 1) / 2) + 1)]
-        newGeoms += sample(
-            indices[: energies.shape[1] - len(newGeoms)], geomsNeeded - len(newGeoms)
-        )
-        return newGeoms
+        return self.strategy.choose(energies, forces, geomsNeeded, geometries)
 
     def writeGeoms(self, geometries, dest):
         """
@@ -480,7 +538,4 @@ class ActiveLearningModel(AbstractModel):
             geometries (list): List of geometries to write.
             dest (Path): Destination folder path.
         """
-        for i in range(1, len(geometries) + 1):
-            utils.writeXYZ(
-                geometries[i - 1], self.symbols, os.path.join(dest, f"{str(i)}.xyz")
-            )
+        utils.writeGeometries(geometries, self.symbols, dest)
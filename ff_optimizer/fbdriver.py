@@ -0,0 +1,202 @@
+import logging
+import os
+import sys
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+
+import numpy as np
+
+
+class OptParser:
+    def __init__(self):
+        """
+        Parse the results of a ForceBalance optimization from its output,
+        one line at a time.
+        """
+        self.inInitialParams = False
+        self.inFinalParams = False
+        self.inFinalObj = False
+        self.params = []
+        self.initialParams = []
+        self.labels = []
+        self.obj = None
+        self.status = -1
+
+    def feed(self, line: str):
+        """
+        Parse a line of output.
+
+        Args:
+            line (str): The line.
+        """
+        if "-------" in line:
+            self.inFinalParams = False
+            self.inInitialParams = False
+        if self.inFinalParams:
+            if "=======" not in line:
+                splitLine = line.split()
+                self.params.append(splitLine[2])
+                self.labels.append(splitLine[5])
+        if self.inInitialParams:
+            if "=======" not in line:
+                self.initialParams.append(line.split()[2])
+        if self.inFinalObj:
+            self.obj = float(line.split()[5])
+            self.inFinalObj = False
+        if "Final physical parameters" in line:
+            self.inFinalParams = True
+        if "Starting parameter indices" in line:
+            self.inInitialParams = True
+        if "Final objective function" in line:
+            self.inFinalObj = True
+        if "Optimization Converged" in line:
+            self.status = 0
+        if "Maximum number of optimization steps reached" in line:
+            self.status = 2
+
+    def getResults(self) -> tuple:
+        """
+        Get the results parsed so far.
+
+        Returns:
+            tuple: The optimization status (0 if converged, 2 if the maximum
+                number of steps was reached, -1 otherwise) and a dict of the
+                objective function ("obj", if found), final parameters
+                ("params"), their labels ("labels"), and initial parameters
+                ("initialParams").
+        """
+        results = {}
+        if self.obj is not None:
+            results["obj"] = self.obj
+        results["params"] = np.asarray(self.params, dtype=np.float32)
+        results["labels"] = list(self.labels)
+        results["initialParams"] = np.asarray(self.initialParams, dtype=np.float32)
+        return self.status, results
+
+
+class ValidParser:
+    def __init__(self):
+        """
+        Parse the objective function of a ForceBalance single-point
+        evaluation from its output, one line at a time.
+        """
+        self.obj = None
+
+    def feed(self, line: str):
+        """
+        Parse a line of output.
+
+        Args:
+            line (str): The line.
+        """
+        if self.obj is None and "Objective Function Single Point" in line:
+            self.obj = float(line.split()[6])
+
+
+class ForceBalanceLog(logging.Handler):
+    def __init__(self, stream, parsers: list):
+        """
+        Logging handler which writes ForceBalance's log to a file as it is
+        produced and passes each complete line to parsers, so results are
+        available without keeping or re-reading the log.
+
+        Args:
+            stream: Open file to write the log to.
+            parsers (list): Objects with a feed(line) method.
+        """
+        super().__init__(logging.INFO)
+        self.stream = stream
+        self.parsers = parsers
+        self.partial = ""
+
+    def emit(self, record: logging.LogRecord):
+        """
+        Write a log record and parse its complete lines.
+
+        Args:
+            record (logging.LogRecord): The record.
+        """
+        message = record.getMessage()
+        self.stream.write(message)
+        self.stream.flush()
+        # Split lines the way reading the file back would
+        lines = (self.partial + message).splitlines(keepends=True)
+        self.partial = ""
+        if len(lines) > 0 and not lines[-1].endswith(("\n", "\r")):
+            self.partial = lines.pop()
+        for line in lines:
+            self.feedLine(line)
+
+    def feedLine(self, line: str):
+        """
+        Pass a line to every parser. A line a parser can't read is skipped,
+        as long as the others can.
+
+        Args:
+            line (str): The line.
+        """
+        for parser in self.parsers:
+            try:
+                parser.feed(line)
+            except (ValueError, IndexError):
+                pass
+
+    def close(self):
+        """
+        Parse any incomplete last line.
+        """
+        if len(self.partial) > 0:
+            self.feedLine(self.partial)
+            self.partial = ""
+        super().close()
+
+
+def runForceBalance(inp: str, out: str, err: str = None) -> tuple:
+    """
+    Run ForceBalance in this process with the given input file. ForceBalance
+    is imported the first time this is called; its force field, objective
+    function, and optimizer are then built directly, as ForceBalance.py
+    does. The log is streamed to out as it is written, and stdin is closed
+    so ForceBalance never waits at a prompt.
+
+    Args:
+        inp (str): Input file for ForceBalance.
+        out (str): File to write the log to.
+        err (str, optional): File to write stderr and tracebacks to. Defaults
+            to None, in which case they are written to out.
+
+    Returns:
+        tuple: OptParser and ValidParser holding the results.
+    """
+    from forcebalance.forcefield import FF
+    from forcebalance.objective import Objective
+    from forcebalance.optimizer import Optimizer
+    from forcebalance.output import logger
+    from forcebalance.parser import parse_inputs
+
+    optParser = OptParser()
+    validParser = ValidParser()
+    stdin = sys.stdin
+    with open(out, "w") as outFile, open(err or os.devnull, "w") as errFile:
+        if err is None:
+            errFile = outFile
+        handler = ForceBalanceLog(outFile, [optParser, validParser])
+        logger.addHandler(handler)
+        try:
+            sys.stdin = open(os.devnull, "r")
+            with redirect_stdout(outFile), redirect_stderr(errFile):
+                # ForceBalance.py raises on all floating point errors
+                with np.errstate(all="raise"):
+                    options, targetOptions = parse_inputs(inp)
+                    forcefield = FF(options)
+                    objective = Objective(options, targetOptions, forcefield)
+                    optimizer = Optimizer(options, objective, forcefield)
+                    optimizer.Run()
+        except Exception:
+            errFile.write(traceback.format_exc())
+        finally:
+            sys.stdin.close()
+            sys.stdin = stdin
+            logger.removeHandler(handler)
+            handler.close()
+    return optParser, validParser
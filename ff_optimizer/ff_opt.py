@@ -8,7 +8,7 @@ from typing import get_type_hints
 
 import typer
 
-from ff_optimizer import active_learning, inputs, model
+from ff_optimizer import active_learning, inputs, model, multi_system
 from ff_optimizer import setup as st
 
 app = typer.Typer()
@@ -75,6 +75,8 @@ def print_manual():
 def createModel(inp):
     if inp.activelearning > 1:
         ffModel = active_learning.ActiveLearningModel(inp)
+    elif inp.systems is not None:
+        ffModel = multi_system.MultiSystemModel(inp)
     else:
         ffModel = model.Model(inp)
     return ffModel
@@ -125,11 +127,17 @@ def optimize(input_file: str):
             continue
 
         mmStart = perf_counter()
-        ffModel.doMMSampling(i)
-        mmEnd = perf_counter()
-        mmTime = mmEnd - mmStart
+        if inp.pipeline:
+            # QM time is only the time QM calculations run past MM sampling
+            ffModel.doPipelinedSampling(i)
+            mmTime = ffModel.mmTime
+            mmEnd = mmStart + mmTime
+        else:
+            ffModel.doMMSampling(i)
+            mmEnd = perf_counter()
+            mmTime = mmEnd - mmStart
 
-        ffModel.doQMCalculations(i)
+            ffModel.doQMCalculations(i)
         qmEnd = perf_counter()
         qmTime = qmEnd - mmEnd
 
@@ -1,5 +1,6 @@
 import errno
 import os
+from copy import deepcopy
 from dataclasses import dataclass, field
 from os import strerror
 from pathlib import Path
@@ -82,6 +83,23 @@ class Input:
         """
         },
     )
+    systems: list = field(
+        default=None,
+        metadata={
+            "comment": """
+        List of folders, one per system (e.g. molecule), for fitting
+        one set of parameters to several systems in a single run.
+        Each folder contains its own dynamicsdir, optdir and
+        sampledir (with the same names as above). The system's
+        optdir only needs conf.pdb and setup.leap; the top-level
+        optdir holds the ForceBalance inputs and the force field
+        files of all systems. Each system is sampled and has its QM
+        calculations run separately, with MM and QM work of all
+        systems sharing worker pools, and all systems' targets
+        (named {system}_train_{i}, etc.) are fit together.
+        """
+        },
+    )
     coors: str = field(
         default="coors.xyz",
         metadata={
@@ -160,14 +178,33 @@ class Input:
         each model generates a large set of candidate points. For
         each set of candidates, every model evaluates forces.
         Uncertainty (standard deviation) in the forces is computed
-        for each set. Half the geometries chosen for QM
-        calculations have the highest uncertainty of the set, and
-        the other half are sampled randomly. These sets become the
+        for each set. The geometries chosen for QM calculations
+        are selected according to alstrategy. These sets become the
         training set for the model which did the MM MD, and a
         validation set for the other models.
         """
         },
     )
+    alstrategy: str = field(
+        default="mixed",
+        metadata={
+            "comment": """
+        Specifies how active learning chooses geometries for QM
+        calculations. Options are "mixed", "force", "energy",
+        "atom", and "kcenter".
+        If "mixed", half the geometries have the highest
+        uncertainty in the forces and the other half are sampled
+        randomly.
+        If "force", "energy", or "atom", the geometries with the
+        highest uncertainty in the forces, the energy, or the
+        force on any single atom are chosen.
+        If "kcenter", geometries are chosen one at a time among
+        those with high uncertainty in the forces, favoring ones
+        far from those already chosen, so that near-duplicate
+        geometries are not all selected.
+        """
+        },
+    )
     maxcycles: int = field(
         default=30,
         metadata={
@@ -176,13 +213,25 @@ class Input:
         """
         },
     )
+    pipeline: bool = field(
+        default=False,
+        metadata={
+            "comment": """
+        If true, overlap the QM calculations of each cycle with its MM
+        sampling. QM calculations for a dataset start as soon as its
+        MM sampling is finished, and the validation sets are evaluated
+        with the previous parameters as soon as their QM calculations
+        are done. Has no effect with active learning.
+        """
+        },
+    )
     # MM-specific parameters
     mmengine: str = field(
         default="amber",
         metadata={
             "comment": """
          specifies which software will run MM MD. Options are
-        "amber" and "openmm".
+        "amber", "openmm", and "openmm_inprocess".
         If "amber", provided MD input files must be valid inputs
         for sander/pmemd/pmemd.cuda. The number of frames sampled
         from the dynamics is determined by nstlim / ntwx.
@@ -197,6 +246,42 @@ class Input:
             to the script. The coordinates in this netcdf file will
             be passed to the QM engine to augment the dataset.
         An example can be found in examples/openmm/2_sampling.
+        If "openmm_inprocess", OpenMM is run within ff_optimizer.
+        The system is built once per cycle and reused for every
+        conformer, and sampled geometries are kept in memory.
+        Provided MD input files must be python scripts which
+        define:
+        1. reportInterval, the number of steps between sampled
+            geometries
+        2. createSimulation(prmtop, platform), which returns an
+            openmm.app.Simulation for the given AmberPrmtopFile
+            and Platform (None for OpenMM's default)
+        3. sample(simulation, reporter), which equilibrates from
+            the current positions and runs the sampling dynamics
+            with reporter appended to simulation.reporters
+        An example can be found in examples/openmm/2_sampling.
+        """
+        },
+    )
+    openmmplatform: str = field(
+        default=None,
+        metadata={
+            "comment": """
+        Name of the OpenMM platform (e.g. "CUDA", "CPU", or
+        "Reference") used by the "openmm_inprocess" MM engine. By
+        default, OpenMM picks the fastest available platform.
+        """
+        },
+    )
+    openmmreplicas: int = field(
+        default=1,
+        metadata={
+            "comment": """
+        Number of conformers the "openmm_inprocess" MM engine
+        integrates at once. Each replica has its own OpenMM Context
+        and runs in its own thread, sharing one System. For small
+        molecules, running many replicas together keeps the CPU
+        busy where a single one is dominated by per-step overhead.
         """
         },
     )
@@ -236,23 +321,131 @@ class Input:
         """
         },
     )
+    mmworkers: int = field(
+        default=1,
+        metadata={
+            "comment": """
+        Specifies how many MM MD trajectories to run concurrently.
+        Trajectories from all datasets in a cycle share one pool of
+        workers. If GPUs are available, each worker is pinned to one
+        of them through CUDA_VISIBLE_DEVICES.
+        """
+        },
+    )
     # QM-specific parameters
     qmengine: str = field(
         default="chemcloud",
         metadata={
             "comment": """
         Specifies which qmengine to use to run QM calculations.
-        Options are "chemcloud", "slurm", and "debug".
+        Options are "chemcloud", "slurm", "tcserver", and "debug".
         If "chemcloud", options are read from a valid TeraChem input
         file (tc_template.in) and sent to chemcloud.
         If "queue", a sbatch_template.sh file must be provided. This
         file allows the QM TeraChem calculations to be run by a
         SLURM scheduler.                                            
+        If "tcserver", TeraChem is run locally as persistent servers,
+        one per device in tcdevices, which are reused for every
+        calculation. Requires tcpb.
         If "debug", TeraChem will be run locally, one job at a time.
         """
         },
     )
+    qmworkers: int = field(
+        default=1,
+        metadata={
+            "comment": """
+        Number of processes used to read the results of QM
+        calculations (TeraChem outputs, geometries and ESP files)
+        before they are written for ForceBalance.
+        """
+        },
+    )
+    tcdevices: str = field(
+        default="0",
+        metadata={
+            "comment": """
+        Devices (GPU IDs, separated by commas) to run TeraChem servers
+        on if qmengine is "tcserver". One server is started on each.
+        """
+        },
+    )
+    tcport: int = field(
+        default=11111,
+        metadata={
+            "comment": """
+        Port of the first TeraChem server if qmengine is "tcserver".
+        The server on the i-th device listens on tcport + i.
+        """
+        },
+    )
+    tcservercommand: str = field(
+        default="terachem -s {port}",
+        metadata={
+            "comment": """
+        Command which starts a TeraChem server if qmengine is
+        "tcserver". {port} is replaced by the port of the server, and
+        {device} by its device, which is also set as
+        CUDA_VISIBLE_DEVICES.
+        """
+        },
+    )
     # opt-specific parameters
+    fbworkers: int = field(
+        default=1,
+        metadata={
+            "comment": """
+        Maximum number of ForceBalance validation set evaluations to
+        run at once. The evaluations in a cycle are independent, so
+        this mainly helps when using several validation sets.
+        """
+        },
+    )
+    fbinprocess: bool = field(
+        default=False,
+        metadata={
+            "comment": """
+        If true, run ForceBalance inside the ff-opt process instead
+        of launching ForceBalance.py for every optimization and
+        evaluation. Results are read as the log is written rather
+        than from the output files. In-process evaluations run one
+        at a time, so fbworkers is ignored.
+        """
+        },
+    )
+    targetcache: bool = field(
+        default=False,
+        metadata={
+            "comment": """
+        If true, cache the objective function of each validation
+        target at each set of parameters. Validation evaluations
+        then only run ForceBalance on targets which haven't been
+        evaluated with the same parameters before, e.g. only on the
+        newest target when evaluating with the previous or initial
+        parameters.
+        """
+        },
+    )
+    targetwindow: int = field(
+        default=0,
+        metadata={
+            "comment": """
+        If greater than 0, only the targets from this many of the
+        most recent cycles are used for training. Older targets are
+        aged out, so the cost of each optimization stops growing.
+        The initial training target (if any) is always used.
+        """
+        },
+    )
+    targetsample: int = field(
+        default=0,
+        metadata={
+            "comment": """
+        Number of aged-out training targets (see targetwindow) to
+        randomly sample back into each optimization.
+        """
+        },
+    )
     resppriors: int = field(
         default=0,
         metadata={
@@ -361,6 +554,18 @@ class Input:
         """
         },
     )
+    slurmarray: bool = field(
+        default=False,
+        metadata={
+            "comment": """
+        If true, submit all QM calculations in a cycle as a single
+        Slurm job array instead of one job per geometry, and track
+        completion with squeue and sacct queries on that job only.
+        Tasks which fail are resubmitted with the backup TeraChem
+        input file (up to retries times).
+        """
+        },
+    )
     opt0: str = field(
         default="opt_0.in",
         metadata={
@@ -394,10 +599,63 @@ class Input:
         default=1,
         metadata={
             "comment": """
-        Number of times failed calculations on ChemCloud are retried.
+        Number of times failed calculations on ChemCloud (or in a
+        Slurm job array, or on TeraChem servers) are retried.
         Changing to more than one may help with semi-reliable connections,
         and changing to 0 disables retrying calculations with the backup
-        TeraChem input file.
+        TeraChem input file. Each job is retried individually.
+        """
+        },
+    )
+    batchesinflight: int = field(
+        default=4,
+        metadata={
+            "comment": """
+        Maximum number of batches of calculations submitted to ChemCloud
+        at once. Results from each batch are written as soon as it
+        finishes, and failed jobs are resubmitted right away.
+        """
+        },
+    )
+    qmcache: str = field(
+        default=None,
+        metadata={
+            "comment": """
+        Directory for a persistent cache of QM results. If provided,
+        geometries which have already been computed with the same
+        TeraChem settings (in this or any other run using the same
+        cache) are not recomputed.
+        """
+        },
+    )
+    qmcachesize: float = field(
+        default=10.0,
+        metadata={
+            "comment": """
+        Maximum size of the QM cache in GB. Least recently used
+        results are removed once the cache grows beyond this size.
+        """
+        },
+    )
+    leapcache: str = field(
+        default=None,
+        metadata={
+            "comment": """
+        Directory for a persistent cache of tleap builds. If
+        provided, prmtop and inpcrd files are only built by tleap
+        if the leap script, coordinates, or force field files have
+        changed since they were last built with the same cache.
+        """
+        },
+    )
+    patchprmtop: bool = field(
+        default=False,
+        metadata={
+            "comment": """
+        If true, build the prmtop for MM sampling by patching the
+        parameters of the previous tleap build instead of running
+        tleap, as long as only parameter values have changed. Falls
+        back to tleap if the topology changes.
         """
         },
     )
@@ -480,6 +738,38 @@ class Input:
             self.dynamicsdir = Path(self.dynamicsdir).absolute()
         self.optdir = Path(self.optdir).absolute()
         self.sampledir = Path(self.sampledir).absolute()
+        if self.systems is not None:
+            self.systems = [Path(system).absolute() for system in self.systems]
+        if self.qmcache:
+            self.qmcache = Path(self.qmcache).absolute()
+        if self.leapcache:
+            self.leapcache = Path(self.leapcache).absolute()
+
+    def getSystemInput(self, system: Path) -> "Input":
+        """
+        Get the input for one of several systems, with dynamicsdir, optdir
+        and sampledir inside the system's folder.
+
+        Args:
+            system (Path): Path to the system's folder.
+
+        Returns:
+            Input: Input object for the system.
+
+        Raises:
+            FileNotFoundError: If required files or directories are missing.
+        """
+        system = Path(system).absolute()
+        inp = deepcopy(self)
+        inp.systems = None
+        inp.optdir = system / self.optdir.name
+        inp.sampledir = system / self.sampledir.name
+        if self.dynamicsdir:
+            inp.dynamicsdir = system / Path(self.dynamicsdir).name
+        if not self.skipchecks:
+            checkDirectory(inp.optdir, ["conf.pdb", "setup.leap"])
+            inp.checkSystemFiles()
+        return inp
 
     def setupDynamicsFolder(self):
         """
@@ -502,8 +792,23 @@ class Input:
         Raises:
             FileNotFoundError: If required files or directories are missing.
         """
+        if self.systems is not None:
+            checkDirectory(self.optdir, [self.opt0, self.valid0])
+            for system in self.systems:
+                self.getSystemInput(system)
+            return
         optFiles = ["conf.pdb", "setup.leap", self.opt0, self.valid0]
         checkDirectory(self.optdir, optFiles)
+        self.checkSystemFiles()
+
+    def checkSystemFiles(self):
+        """
+        Check for the existence of the files needed to sample one system
+        and run its QM calculations.
+
+        Raises:
+            FileNotFoundError: If required files or directories are missing.
+        """
         dynamicsFiles = []
         if self.conformers:
             dynamicsFiles.append(self.conformers)
@@ -540,14 +845,26 @@ class Input:
             raise ValueError(
                 "Stride for creating initial data from dynamics must be at least 1"
             )
-        qmengines = ["chemcloud", "slurm", "debug"]
+        qmengines = ["chemcloud", "slurm", "tcserver", "debug"]
         if self.qmengine not in qmengines:
             raise ValueError(f"QMEngine {self.qmengine} has not been implemented")
-        mmengines = ["amber", "openmm"]
+        mmengines = ["amber", "openmm", "openmm_inprocess"]
         if self.mmengine not in mmengines:
             raise ValueError(f"MMEngine {self.mmengine} is not implemented")
         if self.conformersperset < 1:
             raise ValueError("Must be at least one conformer per set")
+        if self.mmworkers < 1:
+            raise ValueError("Must use at least one MM worker")
+        if self.fbworkers < 1:
+            raise ValueError("Must use at least one ForceBalance worker")
+        if self.openmmreplicas < 1:
+            raise ValueError("Must use at least one OpenMM replica")
+        if self.qmworkers < 1:
+            raise ValueError("Must use at least one QM worker")
+        if self.targetwindow < 0:
+            raise ValueError("Target window must be nonnegative")
+        if self.targetsample < 0:
+            raise ValueError("Number of sampled targets must be nonnegative")
         if self.start is not None:
             if self.start < 0:
                 raise ValueError(f"Start frame {self.start} must be > 0")
@@ -570,9 +887,38 @@ class Input:
                     raise ValueError(
                         f"End frame {self.end} must be >= split frame {self.split}"
                     )
+        if self.batchsize < 1:
+            raise ValueError("ChemCloud batch size must be at least 1")
+        if self.batchesinflight < 1:
+            raise ValueError("Must allow at least one ChemCloud batch in flight")
+        if self.retries < 0:
+            raise ValueError("Number of retries must be non-negative")
+        if len(self.tcdevices.replace(",", " ").split()) == 0:
+            raise ValueError("Must run TeraChem servers on at least one device")
+        if self.tcport < 1 or self.tcport > 65535:
+            raise ValueError(f"TeraChem server port {self.tcport} is not valid")
+        if "{port}" not in self.tcservercommand:
+            raise ValueError("TeraChem server command must contain {port}")
+        if self.systems is not None:
+            if len(self.systems) == 0:
+                raise ValueError("Must provide at least one system")
+            names = [Path(system).name for system in self.systems]
+            if len(set(names)) < len(names):
+                raise ValueError("System folders must have different names")
+            if self.activelearning > 1:
+                raise ValueError(
+                    "Active learning is not supported for multiple systems"
+                )
+            if self.resppriors != 0:
+                raise ValueError("RESP priors are not supported for multiple systems")
+        if self.qmcachesize <= 0:
+            raise ValueError("QM cache size must be positive")
         if self.resp > 1 or self.resp < 0:
             raise ValueError("RESP weight must be in [0, 1]")
         if self.nvalids < 1:
             raise ValueError("Must use at least one validation set (for now)")
         if self.activelearning < 1:
             raise ValueError("Must have at least one model")
+        alstrategies = ["mixed", "force", "energy", "atom", "kcenter"]
+        if self.alstrategy not in alstrategies:
+            raise ValueError(f"Selection strategy {self.alstrategy} is not implemented")
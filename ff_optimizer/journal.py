@@ -0,0 +1,97 @@
+import json
+import os
+from pathlib import Path
+from time import time
+
+
+class CycleJournal:
+    def __init__(self, path: str | Path):
+        """
+        Initialize an append-only journal of the stages completed in each
+        optimization cycle. Each line of the file is a JSON record of one
+        stage of one cycle, holding its results (objective values,
+        parameters, labels) and timings. Later records of the same stage
+        and cycle replace earlier ones, so a stage rerun after a restart
+        simply appends a new record.
+
+        Args:
+            path (str or Path): Path to the journal file.
+        """
+        self.path = Path(path).absolute()
+        self.records = {}
+        self.load()
+
+    def load(self):
+        """
+        Read all records in the journal file, if it exists. A partially
+        written last line (e.g. from a crash) is ignored.
+        """
+        self.records = {}
+        if not self.path.is_file():
+            return
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self.records[(record["cycle"], record["stage"])] = record
+
+    def record(self, cycle: int, stage: str, **data) -> dict:
+        """
+        Append a record of a completed stage to the journal.
+
+        Args:
+            cycle (int): The cycle number.
+            stage (str): Name of the stage, e.g. "opt" or "valid".
+            **data: JSON-serializable results of the stage.
+
+        Returns:
+            dict: The record.
+        """
+        record = {"cycle": cycle, "stage": stage, "timestamp": time()}
+        record.update(data)
+        line = json.dumps(record) + "\n"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # A single write to a file opened for appending keeps concurrent
+        # records from interleaving
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode())
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self.records[(cycle, stage)] = record
+        return record
+
+    def get(self, cycle: int, stage: str) -> dict:
+        """
+        Get the record of a stage.
+
+        Args:
+            cycle (int): The cycle number.
+            stage (str): Name of the stage.
+
+        Returns:
+            dict: The latest record of the stage, or None if the stage
+                hasn't been completed.
+        """
+        return self.records.get((cycle, stage), None)
+
+    def isImported(self) -> bool:
+        """
+        Check whether every record was imported from the output files of a
+        previous run, rather than recorded as its stage completed.
+
+        Returns:
+            bool: True if all records (if any) were imported.
+        """
+        return all(record.get("imported", False) for record in self.records.values())
+
+    def clear(self):
+        """
+        Remove all records, e.g. when starting a new optimization.
+        """
+        self.records = {}
+        if self.path.is_file():
+            os.remove(self.path)
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from shutil import copyfile, rmtree
+
+from . import utils
+
+
+def readLeapScript(leap: str) -> list:
+    """
+    Split a leap script into lines of tokens.
+
+    Args:
+        leap (str): Path to the leap script.
+
+    Returns:
+        list: Tokens of each line.
+    """
+    lines = []
+    with open(leap, "r") as f:
+        for line in f.readlines():
+            tokens = line.replace("=", " ").split()
+            lines.append([token.strip("\"'") for token in tokens])
+    return lines
+
+
+def getLeapOutputs(leap: str) -> list:
+    """
+    Get the files written by saveamberparm in a leap script.
+
+    Args:
+        leap (str): Path to the leap script.
+
+    Returns:
+        list: Names of the prmtop and inpcrd files.
+    """
+    outputs = []
+    for tokens in readLeapScript(leap):
+        if len(tokens) >= 4 and tokens[0].lower() == "saveamberparm":
+            outputs += tokens[2:4]
+    return outputs
+
+
+class LeapCache:
+    def __init__(self, cacheDir: str | Path):
+        """
+        Initialize an on-disk cache of tleap builds. Builds are keyed by a
+        hash of the leap script and the contents of every file it refers to
+        (e.g. conf.pdb, frcmod and mol2 files), so unchanged force fields
+        are never rebuilt. The cache can be shared between cycles, restarts,
+        and models.
+
+        Args:
+            cacheDir (str or Path): Directory holding the cache.
+        """
+        self.cacheDir = Path(cacheDir).absolute()
+        self.cacheDir.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def getKey(self, leap: str) -> str:
+        """
+        Get the cache key of a leap script in the current directory.
+
+        Args:
+            leap (str): Path to the leap script.
+
+        Returns:
+            str: Hex digest identifying the build.
+        """
+        outputs = getLeapOutputs(leap)
+        h = hashlib.sha256()
+        with open(leap, "rb") as f:
+            h.update(f.read())
+        # Hash the contents of every input file the script refers to
+        for tokens in readLeapScript(leap):
+            for token in tokens:
+                if token in outputs or not os.path.isfile(token):
+                    continue
+                h.update(token.encode())
+                with open(token, "rb") as f:
+                    h.update(hashlib.sha256(f.read()).digest())
+        return h.hexdigest()
+
+    def getEntry(self, key: str) -> Path:
+        """
+        Get the directory of a cache entry.
+
+        Args:
+            key (str): Cache key.
+
+        Returns:
+            Path: Directory holding the build for key.
+        """
+        return self.cacheDir / key[:2] / key
+
+    def load(self, leap: str) -> bool:
+        """
+        Copy a cached build of a leap script into the current directory,
+        along with its leap.out. Files are copied rather than hard-linked,
+        since tleap overwrites its outputs in place.
+
+        Args:
+            leap (str): Path to the leap script.
+
+        Returns:
+            bool: True if the build was in the cache, False otherwise.
+        """
+        outputs = getLeapOutputs(leap)
+        if len(outputs) == 0:
+            return False
+        entry = self.getEntry(self.getKey(leap))
+        try:
+            for f in outputs + ["leap.out"]:
+                copyfile(entry / f, f)
+            with open(entry / "symbols.json", "r") as f:
+                symbols = json.load(f)
+        except OSError:
+            self.misses += 1
+            return False
+        utils.storePrmtopSymbols(outputs[0], symbols)
+        self.hits += 1
+        return True
+
+    def store(self, leap: str):
+        """
+        Store the build of a leap script in the current directory, along
+        with the atomic symbols of its prmtop.
+
+        Args:
+            leap (str): Path to the leap script.
+        """
+        outputs = getLeapOutputs(leap)
+        if len(outputs) == 0:
+            return
+        for f in outputs + ["leap.out"]:
+            if not os.path.isfile(f):
+                return
+        entry = self.getEntry(self.getKey(leap))
+        if entry.is_dir():
+            return
+        symbols = utils.getSymbolsFromPrmtop(outputs[0])
+        # Write into a temporary directory first so that other processes
+        # sharing the cache never see a partial entry
+        tmp = entry.parent / f".{entry.name}.{os.getpid()}"
+        try:
+            tmp.mkdir(parents=True, exist_ok=True)
+            for f in outputs + ["leap.out"]:
+                copyfile(f, tmp / f)
+            with open(tmp / "symbols.json", "w") as f:
+                json.dump(symbols, f)
+            os.rename(tmp, entry)
+        except OSError:
+            pass
+        if tmp.is_dir():
+            rmtree(tmp, ignore_errors=True)
+
+    def report(self) -> str:
+        """
+        Summarize the cache statistics.
+
+        Returns:
+            str: Hits and misses.
+        """
+        return f"Tleap cache: {self.hits} hits, {self.misses} misses"
+
+
+def runTleap(leap: str = "setup.leap", cache: LeapCache = None):
+    """
+    Run tleap on a leap script in the current directory, unless its build
+    is already in the cache. The build is only cached if tleap succeeds.
+
+    Args:
+        leap (str, optional): Name of the leap script. Defaults to "setup.leap".
+        cache (LeapCache, optional): Cache of tleap builds. Defaults to None.
+    """
+    if cache is not None:
+        if cache.load(leap):
+            print(cache.report())
+            return
+        # Outputs left by an earlier build must not be cached as this one
+        for f in getLeapOutputs(leap):
+            if os.path.isfile(f):
+                os.remove(f)
+    status = os.system(f"tleap -f {leap} > leap.out")
+    if cache is not None:
+        if status == 0:
+            cache.store(leap)
+        print(cache.report())
@@ -1,12 +1,167 @@
+import importlib.util
 import os
+import queue
 import subprocess
+from multiprocessing import Pool, Queue, current_process
+from multiprocessing.pool import ThreadPool
 from pathlib import Path
 from random import randint
 from shutil import copyfile, which
 
 import GPUtil
+import numpy as np
+import openmm as mm
+from openmm import app, unit
 
 from . import utils
+from .leapcache import LeapCache, runTleap
+from .prmtoppatch import PrmtopTemplate
+
+
+def runTrajectoryStar(inp):
+    """
+    Helper function for multiprocessing MM sampling of single conformers.
+
+    Args:
+        inp (tuple): Arguments for runTrajectoryParallel.
+
+    Returns:
+        Path: The folder the trajectory was run in.
+    """
+    return runTrajectoryParallel(*inp)
+
+
+def runTrajectoryParallel(engine, folder, frame, mdin):
+    """
+    Run the MM trajectory for one conformer in a pool worker.
+
+    Args:
+        engine (MMEngine): The MM engine to run the trajectory with.
+        folder (Path): Absolute path of the folder to run the trajectory in.
+        frame (int): Index of the conformer to sample from.
+        mdin (str): Input file for the sampling process.
+
+    Returns:
+        Path: The folder the trajectory was run in.
+    """
+    os.chdir(folder)
+    engine.runTrajectory(frame, mdin)
+    return folder
+
+
+def sampleFolders(jobs: list, p: Pool, markFinished: bool = True):
+    """
+    Run the trajectories of several folders in a pool of workers. The jobs
+    may belong to different MM engines (e.g. one per system), which then
+    share the pool. Each folder's trajectories are collected into its
+    geometry store by its engine as soon as all of them are done.
+
+    Args:
+        jobs (list): List of (engine, absolute folder path, frames, mdin)
+            tuples.
+        p (Pool): Pool of workers.
+        markFinished (bool): Whether to write MMFinished.txt in each
+            folder once it is done.
+    """
+    home = Path.cwd()
+    tasks = []
+    remaining = {}
+    folderJobs = {}
+    for engine, folder, frames, mdin in jobs:
+        remaining[folder] = len(frames)
+        folderJobs[folder] = (engine, frames)
+        for frame in frames:
+            tasks.append((engine, folder, frame, mdin))
+    for folder in p.imap_unordered(runTrajectoryStar, tasks):
+        remaining[folder] -= 1
+        if remaining[folder] > 0:
+            continue
+        engine, frames = folderJobs[folder]
+        os.chdir(folder)
+        engine.convertTrajectories(frames)
+        if markFinished:
+            engine.writeMMFinished()
+        os.chdir(home)
+
+
+def getAllGPUs(default: list) -> list:
+    """
+    Get the IDs of all idle GPUs, for pinning MM workers.
+
+    Args:
+        default (list): IDs to fall back on if GPUs can't be queried.
+
+    Returns:
+        list: List of GPU IDs.
+    """
+    try:
+        return GPUtil.getAvailable(maxLoad=0.1, limit=len(GPUtil.getGPUs()))
+    except:
+        return default
+
+
+def pinDevice(devices: Queue):
+    """
+    Pool initializer which pins each worker to a single GPU.
+
+    Args:
+        devices (Queue): Queue of device IDs, one per worker.
+    """
+    os.environ["CUDA_VISIBLE_DEVICES"] = str(devices.get())
+
+
+def loadScript(path: Path):
+    """
+    Import a Python script as a module, without running it as __main__.
+
+    Args:
+        path (Path): Path to the script.
+
+    Returns:
+        module: The imported script.
+    """
+    spec = importlib.util.spec_from_file_location(f"mdin_{Path(path).stem}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class GeometryReporter:
+    def __init__(self, interval: int, atoms: list):
+        """
+        OpenMM reporter which keeps sampled geometries in memory.
+
+        Args:
+            interval (int): Number of steps between frames.
+            atoms (list): Indices of the atoms to keep (i.e. not dummy atoms).
+        """
+        self.interval = interval
+        self.atoms = atoms
+        self.frames = []
+
+    def describeNextReport(self, simulation: app.Simulation) -> dict:
+        """
+        Tell OpenMM when the next frame is due and what it needs.
+
+        Args:
+            simulation (app.Simulation): The simulation being reported on.
+
+        Returns:
+            dict: Steps until the next report and the required state data.
+        """
+        steps = self.interval - simulation.currentStep % self.interval
+        return {"steps": steps, "periodic": None, "include": ["positions"]}
+
+    def report(self, simulation: app.Simulation, state: mm.State):
+        """
+        Store the current geometry.
+
+        Args:
+            simulation (app.Simulation): The simulation being reported on.
+            state (mm.State): The current state of the simulation.
+        """
+        positions = state.getPositions(asNumpy=True).value_in_unit(unit.angstrom)
+        self.frames.append(np.asarray(positions[self.atoms], dtype=np.float32))
 
 
 class MMEngine:
@@ -23,8 +178,15 @@ class MMEngine:
             self.coordPath = inp.dynamicsdir.absolute() / inp.coors
         else:
             self.coordPath = inp.dynamicsdir.absolute() / inp.conformers
+        self.frameIndex = None
         self.startIndex, self.endIndex, self.splitIndex = self.getIndices()
         self.symbols = None
+        self.deviceIDs = []
+        if inp.leapcache is None:
+            self.leapCache = None
+        else:
+            self.leapCache = LeapCache(inp.leapcache)
+        self.prmtopTemplate = None
 
     def checkForTCFormatting(self):
         """
@@ -66,17 +228,7 @@ class MMEngine:
         start = self.inp.start
         end = self.inp.end
         split = self.inp.split
-        coordIndex = []
-        splitIndex = None
-        with open(self.coordPath, "r") as f:
-            try:
-                for line in f.readlines():
-                    if "frame" in line:
-                        coordIndex.append(int(line.split()[2]))
-            except:
-                raise RuntimeError(
-                    f"XYZ coordinates file {self.inp.coords} is not correctly formatted"
-                )
+        coordIndex = self.getFrameIndex()["frames"]
         nframes = len(coordIndex)
         startIndex = 0
         if start != None:
@@ -102,23 +254,25 @@ class MMEngine:
         Raises:
             RuntimeError: If the XYZ coordinates file is not correctly formatted.
         """
-        with open(self.coordPath, "r") as f:
-            try:
-                natoms = int(f.readline())
-                lines = list(f.readlines())
-                nlines = len(lines) + 1  # for the f.readline() call
-                for line in lines[::-1]:
-                    if len(line.split()) == 0:
-                        nlines -= 1
-                    else:
-                        break
-                nframes = int(nlines / (natoms + 2))
-            except:
-                raise RuntimeError(
-                    f"XYZ coordinates file {self.inp.coords} is not correctly formatted"
-                )
+        nframes = len(self.getFrameIndex()["offsets"])
         return nframes
 
+    def getFrameIndex(self) -> dict:
+        """
+        Get the frame index of the coordinates file, which records the byte
+        offset and TeraChem frame number of every frame. The index is built
+        in one pass over the file and cached on disk next to it.
+
+        Returns:
+            dict: Frame index, as returned by utils.indexXYZ.
+
+        Raises:
+            RuntimeError: If the XYZ coordinates file is not correctly formatted.
+        """
+        if self.frameIndex is None:
+            self.frameIndex = utils.loadXYZIndex(self.coordPath)
+        return self.frameIndex
+
     def getIndices(self):
         """
         Get the start, end, and split indices for the coordinates.
@@ -188,17 +342,11 @@ class MMEngine:
         Raises:
             RuntimeError: If there's an error finding the frame in the coordinates file.
         """
-        frame = []
-        with open(self.coordPath, "r") as f:
-            natoms = int(f.readline())
-            lines = f.readlines()
-            for i in range(len(lines)):
-                if int(i / (natoms + 2)) == index and (i + 1) % (natoms + 2) > 1:
-                    frame.append(lines[i].split()[1:])
-                elif int((i + 1) / (natoms + 2)) > index:
-                    break
-        if len(frame) != natoms:
+        frameIndex = self.getFrameIndex()
+        natoms = frameIndex["natoms"]
+        if index < 0 or index >= len(frameIndex["offsets"]):
             raise RuntimeError("Error finding frame in coordinates XYZ file")
+        frame = utils.readXYZFrame(self.coordPath, frameIndex["offsets"][index], natoms)
         utils.writeRst(frame, natoms, dest)
 
     def writeMMFinished(self, f: Path = Path(".")):
@@ -232,9 +380,30 @@ class MMEngine:
         This method sets up the sampling process, generates frames,
         and runs the sampling for each folder.
         """
+        jobs = self.getSamplingJobs()
+        if self.useWorkers():
+            # Trajectories from every folder share one pool
+            self.sampleParallel(jobs)
+        else:
+            for f, frames, mdin in jobs:
+                os.chdir(f)
+                self.sample(frames, mdin)
+                self.writeMMFinished()
+                os.chdir("..")
+
+    def getSamplingJobs(self) -> list:
+        """
+        Set up MM sampling in the current directory: build the prmtop and
+        write the initial conditions of each folder which still needs to
+        be sampled.
+
+        Returns:
+            list: List of (folder, frames, mdin) tuples.
+        """
         self.prmtop = self.setup()
         allFrames = self.getFrames()
         folders = self.getFolders()
+        jobs = []
         for i, f in enumerate(folders):
             # skip restarted folders
             if self.inp.restart and f.is_dir():
@@ -245,14 +414,12 @@ class MMEngine:
             ]
             for frame in frames:
                 self.getFrame(frame, f / f"{frame}.rst7")
-            os.chdir(f)
             if i < self.inp.conformersperset:
                 mdin = self.inp.trainmdin
             else:
                 mdin = self.inp.validmdin
-            self.sample(frames, mdin)
-            self.writeMMFinished()
-            os.chdir("..")
+            jobs.append((f, frames, mdin))
+        return jobs
 
     def sample(self, frames, mdin):
         """
@@ -263,6 +430,103 @@ class MMEngine:
             mdin (str): Input file for the sampling process.
         """
 
+    def runTrajectory(self, frame, mdin):
+        """
+        Run the MM trajectory for a single conformer in the current directory,
+        producing {frame}.nc. This method should be implemented by subclasses
+        which support parallel sampling.
+
+        Args:
+            frame (int): Index of the conformer to sample from.
+            mdin (str): Input file for the sampling process.
+        """
+        raise NotImplementedError()
+
+    def useWorkers(self) -> bool:
+        """
+        Check whether trajectories should be run in a pool of workers.
+
+        Returns:
+            bool: True if more than one MM worker is requested and we are
+                allowed to start child processes.
+        """
+        # Pool workers (e.g. active learning models) can't have children
+        return self.inp.mmworkers > 1 and not current_process().daemon
+
+    def createPool(self, ntasks: int) -> Pool:
+        """
+        Create a pool of MM workers, each pinned to one GPU if any are available.
+
+        Args:
+            ntasks (int): Number of trajectories to be run.
+
+        Returns:
+            Pool: The pool of workers.
+        """
+        nworkers = max(min(self.inp.mmworkers, ntasks), 1)
+        if len(self.deviceIDs) == 0:
+            return Pool(nworkers)
+        devices = Queue()
+        for i in range(nworkers):
+            devices.put(self.deviceIDs[i % len(self.deviceIDs)])
+        return Pool(nworkers, initializer=pinDevice, initargs=(devices,))
+
+    def sampleParallel(self, jobs: list, markFinished: bool = True):
+        """
+        Run the trajectories of several folders concurrently. Each folder's
+        trajectories are collected into its geometry store as soon as all of
+        them are done.
+
+        Args:
+            jobs (list): List of (folder, frames, mdin) tuples.
+            markFinished (bool): Whether to write MMFinished.txt in each
+                folder once it is done.
+        """
+        home = Path.cwd()
+        jobs = [(self, (home / f).absolute(), frames, mdin) for f, frames, mdin in jobs]
+        ntasks = sum([len(frames) for engine, f, frames, mdin in jobs])
+        if ntasks == 0:
+            return
+        with self.createPool(ntasks) as p:
+            sampleFolders(jobs, p, markFinished)
+
+    def sampleTrajectories(self, frames: list, mdin: str):
+        """
+        Run the trajectories for each conformer in the current directory and
+        collect them into the geometry store.
+
+        Args:
+            frames (list): List of frame indices to sample.
+            mdin (str): Input file for the sampling process.
+        """
+        if self.useWorkers():
+            self.sampleParallel([(Path("."), frames, mdin)], markFinished=False)
+        else:
+            for frame in frames:
+                self.runTrajectory(frame, mdin)
+            self.convertTrajectories(frames)
+
+    def convertTrajectories(self, frames: list):
+        """
+        Collect the sampled trajectories into the folder's geometry store.
+        Geometries are numbered consecutively in the order of frames.
+
+        Args:
+            frames (list): List of frame indices which were sampled.
+        """
+        # On restart only some trajectories are rerun, so pick up the ones
+        # which had already finished as well
+        frames = list(frames)
+        for conformer in self.getConformerNames(Path(".")):
+            frame = int(conformer.split(".")[0])
+            if frame not in frames and Path(f"{frame}.nc").is_file():
+                frames.append(frame)
+        coords = [
+            utils.readNCGeometries(f"{frame}.nc", self.symbols) for frame in frames
+        ]
+        symbols = [symbol for symbol in self.symbols if symbol != "X"]
+        utils.writeGeometries(np.concatenate(coords), symbols)
+
     def setup(self):
         """
         Set up the MM engine.
@@ -273,7 +537,7 @@ class MMEngine:
         Raises:
             RuntimeError: If tleap fails to create a new .prmtop file.
         """
-        os.system(f"tleap -f setup.leap > leap.out")
+        self.buildPrmtop()
         prmtop = None
         for f in os.listdir():
             if f.endswith(".prmtop"):
@@ -293,6 +557,25 @@ class MMEngine:
             self.symbols = utils.getSymbolsFromPrmtop(prmtop)
         return prmtop
 
+    def buildPrmtop(self):
+        """
+        Build the prmtop and inpcrd files from setup.leap. If patchprmtop is
+        set, the parameters of the last tleap build are patched instead,
+        unless the topology has changed.
+        """
+        if self.inp.patchprmtop and self.prmtopTemplate is not None:
+            try:
+                self.prmtopTemplate.apply("setup.leap")
+                return
+            except Exception as e:
+                print(f"Could not patch prmtop ({e}), running tleap instead")
+        runTleap("setup.leap", self.leapCache)
+        if self.inp.patchprmtop:
+            try:
+                self.prmtopTemplate = PrmtopTemplate("setup.leap")
+            except Exception:
+                self.prmtopTemplate = None
+
     def getConformerNames(self, f: Path):
         """
         Get the names of conformer files in a directory.
@@ -358,8 +641,7 @@ class MMEngine:
                 os.chdir(f)
                 self.sample(redoFrames, mdin)
                 os.chdir("..")
-            else:
-                self.writeMMFinished(f)
+            self.writeMMFinished(f)
         self.getMMSamples()
 
 
@@ -371,10 +653,9 @@ class ExternalAmberEngine(MMEngine):
         Args:
             inp (Input): Input object containing configuration parameters.
         """
-        self.inp = inp
+        super().__init__(inp)
         self.heatCounter = inp.heatCounter
         self.checkForGPUs()
-        super().__init__(inp)
 
     def checkForGPUs(self):
         """
@@ -386,6 +667,7 @@ class ExternalAmberEngine(MMEngine):
                 print("Nvidia GPUs detected")
                 if which("pmemd.cuda"):
                     self.amberExe = "pmemd.cuda"
+                    self.deviceIDs = getAllGPUs(deviceIDs)
                     os.environ["CUDA_VISIBLE_DEVICES"] = str(deviceIDs[0])
                     print("Defaulting to pmemd.cuda")
                 else:
@@ -475,30 +757,37 @@ class ExternalAmberEngine(MMEngine):
             frames (list): List of frame indices to sample.
             mdin (Path): Path to the input file for the sampling process.
         """
-        numXYZs = 0
-        for frame in frames:
-            name = str(frame)
-            # Right now needs to be copy instead of move for restarting
-            copyfile(f"{name}.rst7", f"{name}_heat0.rst7")
-            for j in range(1, self.heatCounter + 1):
-                self.runSander(
-                    Path("..") / self.prmtop,
-                    Path("..") / f"heat{str(j)}.in",
-                    Path(f"{name}_heat{str(j)}.out"),
-                    Path(f"{name}_heat{str(j-1)}.rst7"),
-                    Path(f"{name}_heat{str(j)}.nc"),
-                    Path(f"{name}_heat{str(j)}.rst7"),
-                )
+        self.sampleTrajectories(frames, mdin)
+
+    def runTrajectory(self, frame, mdin):
+        """
+        Equilibrate and sample a single conformer using Amber.
+
+        Args:
+            frame (int): Index of the conformer to sample from.
+            mdin (Path): Path to the input file for the sampling process.
+        """
+        name = str(frame)
+        # Right now needs to be copy instead of move for restarting
+        copyfile(f"{name}.rst7", f"{name}_heat0.rst7")
+        for j in range(1, self.heatCounter + 1):
             self.runSander(
                 Path("..") / self.prmtop,
-                Path("..") / mdin,
-                Path(f"{name}_.out"),
-                Path(f"{name}_heat{str(self.heatCounter)}.rst7"),
-                Path(f"{name}.nc"),
-                Path(f"{name}_md.rst7"),
-                mdvels=Path(f"{name}_vel.nc"),
+                Path("..") / f"heat{str(j)}.in",
+                Path(f"{name}_heat{str(j)}.out"),
+                Path(f"{name}_heat{str(j-1)}.rst7"),
+                Path(f"{name}_heat{str(j)}.nc"),
+                Path(f"{name}_heat{str(j)}.rst7"),
             )
-            numXYZs += utils.convertNCtoXYZs(f"{name}.nc", self.symbols, numXYZs)
+        self.runSander(
+            Path("..") / self.prmtop,
+            Path("..") / mdin,
+            Path(f"{name}_.out"),
+            Path(f"{name}_heat{str(self.heatCounter)}.rst7"),
+            Path(f"{name}.nc"),
+            Path(f"{name}_md.rst7"),
+            mdvels=Path(f"{name}_vel.nc"),
+        )
 
 
 class ExternalOpenMMEngine(MMEngine):
@@ -510,6 +799,7 @@ class ExternalOpenMMEngine(MMEngine):
             options (Input): Input object containing configuration parameters.
         """
         super().__init__(options)
+        self.deviceIDs = getAllGPUs([])
 
     # The OpenMM python file must satisfy the following conditions:
     # 1. It accepts as arguments (in order) the .prmtop and .rst7 files
@@ -523,10 +813,215 @@ class ExternalOpenMMEngine(MMEngine):
             frames (list): List of frame indices to sample.
             mdin (Path): Path to the Python script for the OpenMM MD run.
         """
-        numXYZs = 0
-        for frame in frames:
-            name = str(frame)
-            os.system(
-                f"python {Path('..') / mdin} {self.prmtop} {name}.rst7 > {name}.out"
+        self.sampleTrajectories(frames, mdin)
+
+    def runTrajectory(self, frame, mdin):
+        """
+        Sample a single conformer using OpenMM.
+
+        Args:
+            frame (int): Index of the conformer to sample from.
+            mdin (Path): Path to the Python script for the OpenMM MD run.
+        """
+        name = str(frame)
+        os.system(f"python {Path('..') / mdin} {self.prmtop} {name}.rst7 > {name}.out")
+
+
+class InProcessOpenMMEngine(MMEngine):
+    def __init__(self, options):
+        """
+        Initialize the InProcessOpenMMEngine. Unlike ExternalOpenMMEngine,
+        the OpenMM Simulation is built once per cycle and MD input script,
+        and its Context is reused for every conformer. Sampled geometries
+        are kept in memory and written straight to the geometry store.
+
+        Args:
+            options (Input): Input object containing configuration parameters.
+        """
+        super().__init__(options)
+        self.platformName = options.openmmplatform
+        self.replicas = options.openmmreplicas
+        self.simulations = {}
+
+    # The OpenMM python file must define the following:
+    # 1. reportInterval, the number of steps between sampled geometries
+    # 2. createSimulation(prmtop, platform), which builds and returns an
+    #    app.Simulation from an app.AmberPrmtopFile on the given mm.Platform
+    #    (None for OpenMM's default)
+    # 3. sample(simulation, reporter), which equilibrates from the current
+    #    positions and then runs the sampling dynamics with the reporter
+    #    appended to simulation.reporters
+    def setup(self):
+        """
+        Set up the MM engine. Simulations from previous cycles are discarded,
+        since they were built from the previous parameters.
+
+        Returns:
+            str: Name of the parameter topology file.
+        """
+        self.simulations = {}
+        return super().setup()
+
+    def getMMSamples(self):
+        """
+        Perform MM sampling, then discard the simulations, which can't be
+        pickled along with the engine.
+        """
+        try:
+            super().getMMSamples()
+        finally:
+            self.simulations = {}
+
+    def useWorkers(self) -> bool:
+        """
+        Conformers are run one after another in a single Context, so the
+        engine never uses a pool of workers.
+
+        Returns:
+            bool: False.
+        """
+        return False
+
+    def getPlatform(self):
+        """
+        Get the OpenMM platform to run on.
+
+        Returns:
+            mm.Platform: The platform named by openmmplatform, or None to let
+                OpenMM pick the fastest one.
+        """
+        if self.platformName is None:
+            return None
+        return mm.Platform.getPlatformByName(self.platformName)
+
+    def getSimulation(self, mdin: Path):
+        """
+        Get the simulation for an MD input script, building it on first use.
+
+        Args:
+            mdin (Path): Path to the Python script for the OpenMM MD run.
+
+        Returns:
+            tuple: The imported script and its app.Simulation.
+        """
+        key = str(Path(mdin).absolute())
+        if key not in self.simulations:
+            script = loadScript(mdin)
+            prmtop = app.AmberPrmtopFile(str(Path("..") / self.prmtop))
+            simulation = script.createSimulation(prmtop, self.getPlatform())
+            self.simulations[key] = (script, simulation)
+        return self.simulations[key]
+
+    def getReplicas(self, mdin: Path, n: int):
+        """
+        Get n simulations for an MD input script which share one System,
+        each with its own Context and integrator, so that conformers can be
+        run in concurrent threads.
+
+        Args:
+            mdin (Path): Path to the Python script for the OpenMM MD run.
+            n (int): Number of replicas.
+
+        Returns:
+            tuple: The imported script and a list of n app.Simulations.
+        """
+        script, simulation = self.getSimulation(mdin)
+        key = f"{Path(mdin).absolute()}:replicas"
+        replicas = self.simulations.get(key, [])
+        platform = simulation.context.getPlatform()
+        properties = {}
+        if platform.getName() == "CPU":
+            # Share the cores between replicas instead of oversubscribing
+            properties["Threads"] = str(max(os.cpu_count() // n, 1))
+        while len(replicas) < n:
+            integrator = mm.XmlSerializer.clone(simulation.integrator)
+            replicas.append(
+                app.Simulation(
+                    simulation.topology,
+                    simulation.system,
+                    integrator,
+                    platform,
+                    properties,
+                )
             )
-            numXYZs += utils.convertNCtoXYZs(f"{name}.nc", self.symbols, numXYZs)
+        self.simulations[key] = replicas
+        return script, replicas[:n]
+
+    def runConformer(self, simulation: app.Simulation, script, frame: int):
+        """
+        Sample a single conformer in an existing simulation.
+
+        Args:
+            simulation (app.Simulation): Simulation to reuse.
+            script (module): The imported MD input script.
+            frame (int): Index of the conformer to sample from.
+
+        Returns:
+            np.ndarray: Sampled coordinates, one row per frame.
+        """
+        inpcrd = app.AmberInpcrdFile(f"{frame}.rst7")
+        if inpcrd.boxVectors is not None:
+            simulation.context.setPeriodicBoxVectors(*inpcrd.boxVectors)
+        simulation.context.setPositions(inpcrd.positions)
+        if inpcrd.velocities is not None:
+            simulation.context.setVelocities(inpcrd.velocities)
+        else:
+            natoms = simulation.system.getNumParticles()
+            simulation.context.setVelocities(np.zeros((natoms, 3)))
+        simulation.context.setTime(0)
+        simulation.currentStep = 0
+        simulation.reporters = []
+        atoms = [i for i in range(len(self.symbols)) if self.symbols[i] != "X"]
+        reporter = GeometryReporter(script.reportInterval, atoms)
+        script.sample(simulation, reporter)
+        simulation.reporters = []
+        if len(reporter.frames) == 0:
+            raise RuntimeError(
+                f"MM dynamics of conformer {frame} in {os.getcwd()} sampled no geometries"
+            )
+        return np.asarray(reporter.frames).reshape(len(reporter.frames), -1)
+
+    def sample(self, frames, mdin):
+        """
+        Perform sampling using OpenMM in this process.
+
+        Args:
+            frames (list): List of frame indices to sample.
+            mdin (Path): Path to the Python script for the OpenMM MD run.
+        """
+        nreplicas = min(self.replicas, len(frames))
+        if nreplicas > 1:
+            coords = self.sampleReplicas(frames, Path("..") / mdin, nreplicas)
+        else:
+            script, simulation = self.getSimulation(Path("..") / mdin)
+            coords = [self.runConformer(simulation, script, frame) for frame in frames]
+        symbols = [symbol for symbol in self.symbols if symbol != "X"]
+        utils.writeGeometries(np.concatenate(coords), symbols)
+
+    def sampleReplicas(self, frames: list, mdin: Path, nreplicas: int) -> list:
+        """
+        Sample conformers concurrently, in threads which each integrate one
+        replica. OpenMM releases the GIL while integrating.
+
+        Args:
+            frames (list): List of frame indices to sample.
+            mdin (Path): Path to the Python script for the OpenMM MD run.
+            nreplicas (int): Number of replicas to run at once.
+
+        Returns:
+            list: Sampled coordinates of each conformer, in the order of frames.
+        """
+        script, replicas = self.getReplicas(mdin, nreplicas)
+        free = queue.Queue()
+        for simulation in replicas:
+            free.put(simulation)
+
+        def runReplica(frame):
+            simulation = free.get()
+            try:
+                return self.runConformer(simulation, script, frame)
+            finally:
+                free.put(simulation)
+
+        with ThreadPool(nreplicas) as p:
+            return p.map(runReplica, frames)
@@ -1,12 +1,70 @@
 import os
 from pathlib import Path
 from shutil import copyfile, rmtree
+from time import perf_counter
 
 from . import mmengine, optengine, qmengine
 from .inputs import Input
+from .pipeline import Pipeline
 from .utils import convertTCtoFB, getXYZs
 
 
+def qmCalculationParallel(qmEngine, folder: Path, restart: bool):
+    """
+    Run the QM calculations for one sampling folder in a pipeline worker.
+
+    Args:
+        qmEngine (QMEngine): The QM engine to run the calculations with.
+        folder (Path): Absolute path of the sampling folder.
+        restart (bool): Whether to restart previously submitted calculations.
+    """
+    os.chdir(folder)
+    if restart:
+        qmEngine.restart()
+    else:
+        qmEngine.getQMRefData(getXYZs())
+
+
+def copyQMResultFiles(sampleFolder: Path, targetFolder: Path):
+    """
+    Copy the QM results of a sampling folder into a ForceBalance target.
+
+    Args:
+        sampleFolder (Path): Path of the sampling folder.
+        targetFolder (Path): Path of the target folder.
+    """
+    for f in ["all.mdcrd", "qdata.txt"]:
+        copyfile(sampleFolder / f, targetFolder / f)
+
+
+def validPreviousParallel(optEngine, optdir: Path, copies: list, i: int) -> tuple:
+    """
+    Evaluate the new validation sets with the previous parameters in a
+    pipeline worker. The ForceBalance inputs must already be set up, and
+    the result is recorded by the parent process with
+    OptEngine.recordValidPrevious.
+
+    Args:
+        optEngine (OptEngine): The optimization engine.
+        optdir (Path): Absolute path of the optimization directory.
+        copies (list): (sampling folder, target folder) pairs of QM results
+            to copy into the ForceBalance targets.
+        i (int): The iteration number.
+
+    Returns:
+        tuple: Validation objective with the previous parameters, time
+            taken, and the worker's target cache entries (or None).
+    """
+    for src, dest in copies:
+        copyQMResultFiles(src, dest)
+    os.chdir(optdir)
+    v, elapsed = optEngine.evaluateValidPrevious(i)
+    cacheEntries = None
+    if optEngine.targetCache is not None:
+        cacheEntries = optEngine.targetCache.entries
+    return v, elapsed, cacheEntries
+
+
 # Template class for ff models used by ff_optimizer
 # All these functions must be implemented and
 # all these variables set properly for ff_optimizer to
@@ -57,6 +115,21 @@ class AbstractModel:
         """
         raise NotImplementedError()
 
+    def doPipelinedSampling(self, i: int):
+        """
+        Perform MM sampling and QM calculations for a given iteration,
+        overlapping them where possible. Subclasses which can't overlap them
+        just run one after the other. Sets self.mmTime to the time spent on
+        MM sampling.
+
+        Args:
+            i (int): The iteration number.
+        """
+        mmStart = perf_counter()
+        self.doMMSampling(i)
+        self.mmTime = perf_counter() - mmStart
+        self.doQMCalculations(i)
+
 
 # Functions in this class assume that they are operating in the home directory
 # where the job was started.
@@ -137,6 +210,8 @@ class Model(AbstractModel):
             qmEngine = qmengine.SlurmEngine(inp)
         elif inp.qmengine == "chemcloud":
             qmEngine = qmengine.ChemcloudEngine(inp)
+        elif inp.qmengine == "tcserver":
+            qmEngine = qmengine.TCServerEngine(inp)
         return qmEngine
 
     def initializeMMEngine(self, inp: Input) -> mmengine.MMEngine:
@@ -153,6 +228,8 @@ class Model(AbstractModel):
             mmEngine = mmengine.ExternalAmberEngine(inp)
         if inp.mmengine == "openmm":
             mmEngine = mmengine.ExternalOpenMMEngine(inp)
+        if inp.mmengine == "openmm_inprocess":
+            mmEngine = mmengine.InProcessOpenMMEngine(inp)
         return mmEngine
 
     def initialCycle(self):
@@ -171,8 +248,8 @@ class Model(AbstractModel):
             # just put ff parameters where the next iteration expects them to be
             path = self.optdir / "result" / "opt_0"
             path.mkdir(exist_ok=True, parents=True)
-            copyfile(self.optdir / self.optEngine.mol2, path / self.optEngine.mol2)
-            copyfile(self.optdir / self.optEngine.frcmod, path / self.optEngine.frcmod)
+            for f in self.optEngine.getForceFieldFiles():
+                copyfile(self.optdir / f, path / f)
 
     def createTCData(self):
         """
@@ -299,6 +376,76 @@ class Model(AbstractModel):
                 os.chdir("..")
             os.chdir(self.home)
 
+    def doPipelinedSampling(self, i: int):
+        """
+        Perform MM sampling and QM calculations for a given iteration as a
+        pipeline. The QM calculations for each sampling folder start as soon
+        as its MM sampling has finished, and the validation sets are
+        evaluated with the previous parameters as soon as their QM
+        calculations are done. Sets self.mmTime to the time spent on MM
+        sampling.
+
+        Args:
+            i (int): The iteration number.
+        """
+        samplePath = self.makeSampleDir(i)
+        self.copySamplingFiles(i, samplePath)
+        restart = i == self.restartCycle
+        folders = [(samplePath / "train").absolute()]
+        for j in range(1, self.inp.nvalids + 1):
+            folders.append((samplePath / f"valid_{j}").absolute())
+        pipeline = Pipeline(len(folders) + 1)
+        for f in folders:
+            pipeline.addTask(
+                f.name,
+                qmCalculationParallel,
+                (self.qmEngine, f, restart),
+                ready=(f / "MMFinished.txt").is_file,
+            )
+        # If we're restarting, this may have finished already
+        doValidPrevious = len(self.optEngine.validPrevious) < i
+        if doValidPrevious:
+            self.setupOptInputs(i)
+            targetFolders = self.makeFBTargets(i)
+            copies = []
+            for sampleFolder, targetFolder in zip(folders[1:], targetFolders[1:]):
+                self.copyLeapFiles(targetFolder)
+                copies.append((sampleFolder, targetFolder.absolute()))
+            pipeline.addTask(
+                "valid_previous",
+                validPreviousParallel,
+                (self.optEngine, self.optdir.absolute(), copies, i),
+                deps=[f.name for f in folders[1:]],
+            )
+
+        def sample():
+            mmStart = perf_counter()
+            os.chdir(samplePath)
+            if restart:
+                self.mmEngine.restart()
+            else:
+                self.mmEngine.getMMSamples()
+            os.chdir(self.home)
+            self.mmTime = perf_counter() - mmStart
+
+        results = pipeline.run(sample)
+        if doValidPrevious:
+            self.optEngine.recordValidPrevious(i, *results["valid_previous"])
+
+    def setupOptInputs(self, i: int):
+        """
+        Copy the previous parameters into the optimization directory and set
+        up the ForceBalance inputs for a given iteration, so the validation
+        sets can be evaluated while sampling.
+
+        Args:
+            i (int): The iteration number.
+        """
+        os.chdir(self.optdir)
+        self.optEngine.copyResults(i - 1)
+        self.optEngine.setupInputFiles(i)
+        os.chdir(self.home)
+
     def makeFBTargets(self, i: int) -> list:
         """
         Create ForceBalance target folders for a given iteration.
@@ -350,9 +497,8 @@ class Model(AbstractModel):
             sampleFolders (list): List of sample folder paths.
             targetFolders (list): List of target folder paths.
         """
-        for f in ["all.mdcrd", "qdata.txt"]:
-            for i in range(len(sampleFolders)):
-                copyfile(sampleFolders[i] / f, targetFolders[i] / f)
+        for i in range(len(sampleFolders)):
+            copyQMResultFiles(sampleFolders[i], targetFolders[i])
 
     def getSampleFolders(self, i: int) -> list:
         """
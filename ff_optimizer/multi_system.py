@@ -0,0 +1,405 @@
+import os
+from pathlib import Path
+from shutil import copyfile
+from time import perf_counter
+
+from . import targetcache
+from .inputs import Input
+from .mmengine import sampleFolders
+from .model import Model, qmCalculationParallel, validPreviousParallel
+from .optengine import OptEngine, writeValidInitialLeap
+from .pipeline import Pipeline
+from .utils import convertTCtoFB
+
+
+class SharedOptEngine(OptEngine):
+    def __init__(self, inp: Input):
+        """
+        Initialize an OptEngine which fits one set of parameters to the
+        targets of several systems. The target in the ForceBalance input
+        (opt0) is a template, of which each system gets its own copy, named
+        {system}_{target}.
+
+        Args:
+            inp (Input): Input object containing configuration parameters.
+        """
+        self.systems = [Path(system).name for system in inp.systems]
+        super().__init__(inp)
+
+    def readFileNames(self):
+        """
+        Read .frcmod and .mol2 file names from ForceBalance input, and the
+        name of the initial target without its system prefix if the targets
+        have already been copied for each system.
+        """
+        super().readFileNames()
+        self.expanded = False
+        prefix = f"{self.systems[-1]}_"
+        if self.initialTarget is not None and self.initialTarget.startswith(prefix):
+            self.initialTarget = self.initialTarget[len(prefix) :]
+            self.expanded = True
+
+    def testTleap(self):
+        """
+        Each system has its own leap script, which is run when the system is
+        sampled, so there is no prmtop to build here.
+        """
+        self.prmtop = None
+
+    def writeValidInitialLeap(self):
+        """
+        Leap scripts for the initial parameters are written for each system
+        by its SystemModel.
+        """
+
+    def readTargetLines(self):
+        """
+        Read target lines from the ForceBalance input file. If the targets
+        have already been copied for each system, the first system's copy is
+        used as the template.
+        """
+        super().readTargetLines()
+        if not self.expanded:
+            return
+        first = f"{self.systems[0]}_{self.initialTarget}"
+        for attr in ["targetLines", "validTargetLines", "validInitialTargetLines"]:
+            lines = getattr(self, attr)
+            for end, line in enumerate(lines):
+                if line.split()[0] == "$end":
+                    break
+            lines = [
+                line.replace(first, self.initialTarget) for line in lines[: end + 1]
+            ]
+            setattr(self, attr, lines)
+
+    def editOpt0(self):
+        """
+        Adjust the opt0 target name if necessary, then replace the target with
+        a copy for each system.
+        """
+        if self.expanded:
+            return
+        super().editOpt0()
+        optionLines, targets = targetcache.readFBInput(self.optdir / self.inp.opt0)
+        newTargets = []
+        for name, lines in targets:
+            if name != self.initialTarget:
+                newTargets.append((name, lines))
+                continue
+            for newName in self.getTargetNames(name):
+                newTargets.append(
+                    (newName, [line.replace(name, newName) for line in lines])
+                )
+        targetcache.writeFBInput(self.optdir / self.inp.opt0, optionLines, newTargets)
+        self.expanded = True
+
+    def getTargetNames(self, name: str) -> list:
+        """
+        Get the names of the ForceBalance targets holding one kind of data,
+        one per system.
+
+        Args:
+            name (str): Name of the kind of data, e.g. train_3.
+
+        Returns:
+            list: List of target names.
+        """
+        return [f"{system}_{name}" for system in self.systems]
+
+
+class SystemModel(Model):
+    def __init__(self, inp: Input, name: str, sharedOptdir: Path):
+        """
+        Initialize the model of one of several systems. It samples the
+        system and runs its QM calculations, while the parameters are
+        optimized in the shared optimization directory.
+
+        Args:
+            inp (Input): Input object for the system (from Input.getSystemInput).
+            name (str): Name of the system.
+            sharedOptdir (Path): Path to the shared optimization directory.
+        """
+        self.setParams(inp)
+        self.name = name
+        self.sharedOptdir = sharedOptdir
+        self.getMDFiles(inp)
+        self.qmEngine = self.initializeQMEngine(inp)
+        self.mmEngine = self.initializeMMEngine(inp)
+        self.restartCycle = -1
+        if inp.validinitial:
+            writeValidInitialLeap(
+                self.optdir / "setup.leap", self.optdir / "setup_valid_initial.leap"
+            )
+
+    def copyFFFiles(self, i: int, dest: Path):
+        """
+        Copy force field files from the shared optimization directory to the
+        sampling directory.
+
+        Args:
+            i (int): The iteration number.
+            dest (Path): Path to the destination directory.
+        """
+        resultPath = self.sharedOptdir / "result" / f"opt_{i}"
+        for f in resultPath.iterdir():
+            copyfile(f, dest / f.name)
+
+    def createTCData(self, target: str) -> Path:
+        """
+        Create the system's initial target data from dynamics.
+
+        Args:
+            target (str): Name of the target.
+
+        Returns:
+            Path: Path to the created target data.
+        """
+        path = self.sharedOptdir / "targets" / target
+        path.mkdir(parents=True, exist_ok=True)
+        convertTCtoFB(
+            self.dynamicsdir / self.inp.tcout,
+            self.dynamicsdir / self.inp.coors,
+            self.inp.stride,
+            self.inp.start,
+            self.inp.end,
+            path / "qdata.txt",
+            path / "all.mdcrd",
+        )
+        return path
+
+    def makeFBTargets(self, i: int) -> list:
+        """
+        Create the system's ForceBalance target folders for a given
+        iteration in the shared optimization directory.
+
+        Args:
+            i (int): The iteration number.
+
+        Returns:
+            list: List of created target folder paths, train first.
+        """
+        targets = self.sharedOptdir / "targets"
+        names = [f"train_{i}", f"valid_{i}"]
+        for j in range(1, self.inp.nvalids):
+            names.append(f"valid_{i}_{j}")
+        folders = [targets / f"{self.name}_{name}" for name in names]
+        for f in folders:
+            f.mkdir(parents=True, exist_ok=True)
+        return folders
+
+    def getQMFolders(self, i: int) -> list:
+        """
+        Get the sampling folders whose QM calculations are run in a given
+        iteration, whether or not they exist yet.
+
+        Args:
+            i (int): The iteration number.
+
+        Returns:
+            list: Absolute paths of the train folder and then the valid folders.
+        """
+        samplePath = (self.sampledir / f"{str(i)}_cycle_{str(i)}").absolute()
+        folders = [samplePath / "train"]
+        for j in range(1, self.inp.nvalids + 1):
+            folders.append(samplePath / f"valid_{j}")
+        return folders
+
+
+# Functions in this class assume that they are operating in the home directory
+# where the job was started.
+class MultiSystemModel(Model):
+    def __init__(self, inp: Input):
+        """
+        Initialize a model which fits one set of parameters to several
+        systems. Each system is sampled and has its QM calculations run
+        separately, with the MM and QM work of all systems sharing worker
+        pools, and the targets of all systems are optimized together.
+
+        Args:
+            inp (Input): Input object containing configuration parameters.
+        """
+        self.setParams(inp)
+        self.optEngine = self.initializeOptEngine(inp)
+        self.restartCycle = self.optEngine.restartCycle
+        self.systems = []
+        for system in inp.systems:
+            systemModel = SystemModel(
+                inp.getSystemInput(system), Path(system).name, self.optdir
+            )
+            systemModel.restartCycle = self.restartCycle
+            self.systems.append(systemModel)
+            os.chdir(self.home)
+
+    def initializeOptEngine(self, inp: Input) -> SharedOptEngine:
+        """
+        Initialize the optimization engine shared by all systems.
+
+        Args:
+            inp (Input): Input object containing configuration parameters.
+
+        Returns:
+            SharedOptEngine: The initialized optimization engine.
+        """
+        return SharedOptEngine(inp)
+
+    def initialCycle(self):
+        """
+        Perform the initial cycle of the model, with initial target data
+        from the dynamics of each system.
+        """
+        if not self.inp.initialtraining:
+            super().initialCycle()
+            return
+        for system in self.systems:
+            path = system.createTCData(f"{system.name}_{self.optEngine.initialTarget}")
+            system.copyLeapFiles(path)
+        os.chdir(self.optdir)
+        self.optEngine.optimizeForcefield(0)
+        os.chdir(self.home)
+
+    def prepareSampling(self, i: int):
+        """
+        Create the sampling directory of each system for a given iteration
+        and copy the sampling files into it.
+
+        Args:
+            i (int): The iteration number.
+        """
+        for system in self.systems:
+            samplePath = system.makeSampleDir(i)
+            system.copySamplingFiles(i, samplePath)
+
+    def sampleSystems(self, i: int):
+        """
+        Run the MM sampling of every system for a given iteration. The
+        trajectories of all systems share one pool of workers, unless
+        restarting or the MM engine doesn't use workers.
+
+        Args:
+            i (int): The iteration number.
+        """
+        mmEngine = self.systems[0].mmEngine
+        if i == self.restartCycle or not mmEngine.useWorkers():
+            for system in self.systems:
+                os.chdir(system.sampledir / f"{str(i)}_cycle_{str(i)}")
+                if i == self.restartCycle:
+                    system.mmEngine.restart()
+                else:
+                    system.mmEngine.getMMSamples()
+                os.chdir(self.home)
+            return
+        jobs = []
+        for system in self.systems:
+            samplePath = (system.sampledir / f"{str(i)}_cycle_{str(i)}").absolute()
+            os.chdir(samplePath)
+            for f, frames, mdin in system.mmEngine.getSamplingJobs():
+                jobs.append((system.mmEngine, samplePath / f, frames, mdin))
+            os.chdir(self.home)
+        ntasks = sum([len(frames) for engine, f, frames, mdin in jobs])
+        if ntasks > 0:
+            with mmEngine.createPool(ntasks) as p:
+                sampleFolders(jobs, p)
+        os.chdir(self.home)
+
+    def doMMSampling(self, i: int):
+        """
+        Perform MM sampling of every system for a given iteration.
+
+        Args:
+            i (int): The iteration number.
+        """
+        self.prepareSampling(i)
+        self.sampleSystems(i)
+
+    def doQMCalculations(self, i: int):
+        """
+        Perform the QM calculations of every system for a given iteration,
+        with the sampling folders of all systems sharing one pool of workers.
+
+        Args:
+            i (int): The iteration number.
+        """
+        restart = i == self.restartCycle
+        tasks = []
+        for system in self.systems:
+            for f in system.getQMFolders(i):
+                if f.is_dir():
+                    tasks.append((f"{system.name}/{f.name}", system.qmEngine, f))
+        pipeline = Pipeline(len(tasks))
+        for name, qmEngine, f in tasks:
+            pipeline.addTask(name, qmCalculationParallel, (qmEngine, f, restart))
+        pipeline.run()
+        os.chdir(self.home)
+
+    def doPipelinedSampling(self, i: int):
+        """
+        Perform MM sampling and QM calculations of every system for a given
+        iteration as a pipeline. The QM calculations for each sampling folder
+        of any system start as soon as its MM sampling has finished, and the
+        validation sets are evaluated with the previous parameters once the
+        QM calculations of every system's validation sets are done. Sets
+        self.mmTime to the time spent on MM sampling.
+
+        Args:
+            i (int): The iteration number.
+        """
+        self.prepareSampling(i)
+        restart = i == self.restartCycle
+        nfolders = len(self.systems) * (self.inp.nvalids + 1)
+        pipeline = Pipeline(nfolders + 1)
+        for system in self.systems:
+            for f in system.getQMFolders(i):
+                pipeline.addTask(
+                    f"{system.name}/{f.name}",
+                    qmCalculationParallel,
+                    (system.qmEngine, f, restart),
+                    ready=(f / "MMFinished.txt").is_file,
+                )
+        # If we're restarting, this may have finished already
+        doValidPrevious = len(self.optEngine.validPrevious) < i
+        if doValidPrevious:
+            self.setupOptInputs(i)
+            copies = []
+            deps = []
+            for system in self.systems:
+                folders = system.getQMFolders(i)
+                targetFolders = system.makeFBTargets(i)
+                for sampleFolder, targetFolder in zip(folders[1:], targetFolders[1:]):
+                    system.copyLeapFiles(targetFolder)
+                    copies.append((sampleFolder, targetFolder.absolute()))
+                    deps.append(f"{system.name}/{sampleFolder.name}")
+            pipeline.addTask(
+                "valid_previous",
+                validPreviousParallel,
+                (self.optEngine, self.optdir.absolute(), copies, i),
+                deps=deps,
+            )
+
+        def sample():
+            mmStart = perf_counter()
+            self.sampleSystems(i)
+            self.mmTime = perf_counter() - mmStart
+
+        results = pipeline.run(sample)
+        os.chdir(self.home)
+        if doValidPrevious:
+            self.optEngine.recordValidPrevious(i, *results["valid_previous"])
+
+    def doParameterOptimization(self, i: int):
+        """
+        Perform parameter optimization for a given iteration, fitting the
+        parameters to the targets of every system.
+
+        Args:
+            i (int): The iteration number.
+        """
+        for system in self.systems:
+            targetFolders = system.makeFBTargets(i)
+            for f in targetFolders:
+                system.copyLeapFiles(f)
+            system.copyQMResults(system.getSampleFolders(i), targetFolders)
+
+        os.chdir(self.optdir)
+        self.optEngine.optimizeForcefield(i)
+        os.chdir(self.home)
+        self.getOptResults()
@@ -1,40 +1,75 @@
 import os
+import re
 import subprocess
+from multiprocessing.pool import ThreadPool
 from pathlib import Path
+from random import sample
 from shutil import copyfile
+from time import perf_counter
 
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import numpy as np
 
-from . import resp_prior, utils
+from . import fbdriver, resp_prior, targetcache, utils
 from .inputs import Input
+from .journal import CycleJournal
+from .leapcache import LeapCache, runTleap
+from .targetcache import TargetCache
 
 mpl.use("Agg")
 
 
 def runForceBalance(inp: str, out: str, err: str = None):
     """
-    Run ForceBalance with the given input file and capture output.
+    Run ForceBalance with the given input file, streaming its output to
+    files. Without a terminal on stdin, ForceBalance never waits at a prompt.
 
     Args:
         inp (str): Input file for ForceBalance.
         out (str): File to write stdout.
         err (str, optional): File to write stderr. Defaults to None.
     """
-    with subprocess.Popen(
-        ["ForceBalance.py", inp],
-        stdin=subprocess.PIPE,
-        text=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    ) as process:
-        stdout, stderr = process.communicate("\n" * 100)
-    with open(out, "w") as f:
-        f.write(stdout)
-    if err is not None:
-        with open(err, "w") as f:
-            f.write(stderr)
+    with open(out, "w") as stdout, open(err or os.devnull, "w") as stderr:
+        subprocess.run(
+            ["ForceBalance.py", inp],
+            stdin=subprocess.DEVNULL,
+            stdout=stdout,
+            stderr=stderr,
+        )
+
+
+def writeValidInitialLeap(leap: Path, dest: Path):
+    """
+    Write a tleap script which loads the initial force field files instead of
+    the current ones, for evaluating the initial parameters.
+
+    Args:
+        leap (Path): Path to the tleap script.
+        dest (Path): Path to write the new script to.
+    """
+    with open(leap, "r") as leapRead:
+        with open(dest, "w") as leapWrite:
+            for line in leapRead.readlines():
+                if "loadamberparams" in line:
+                    oldName = line.split()[1]
+                    newName = "initial_" + oldName
+                    line = line.replace(oldName, newName)
+                if "loadmol2" in line:
+                    oldName = line.split()[3]
+                    newName = "initial_" + oldName
+                    line = line.replace(oldName, newName)
+                leapWrite.write(line)
+
+
+def runForceBalanceStar(inp):
+    """
+    Helper function for running ForceBalance jobs concurrently.
+
+    Args:
+        inp (tuple): Arguments for runForceBalance.
+    """
+    runForceBalance(*inp)
 
 
 class OptEngine:
@@ -49,13 +84,26 @@ class OptEngine:
         self.home = Path(os.getcwd())
         self.inp = inp
         self.optdir = Path(inp.optdir)
+        self.journal = CycleJournal(self.optdir / "journal.jsonl")
         self.resp = inp.resp
         self.nvalids = inp.nvalids
+        self.fbWorkers = inp.fbworkers
+        self.fbResults = {}
+        self.setupCycle = None
         self.respPriors = None
         self.leap = "setup.leap"
+        if inp.leapcache is None:
+            self.leapCache = None
+        else:
+            self.leapCache = LeapCache(inp.leapcache)
+        if inp.targetcache:
+            self.targetCache = TargetCache(self.optdir / "targetcache.jsonl")
+        else:
+            self.targetCache = None
         self.doResp = inp.resp != 0
         self.maxCycles = inp.maxcycles
         self.mol2 = None
+        self.mol2s = []
         self.frcmod = None
         # test setting this
         self.initialTarget = None
@@ -65,20 +113,24 @@ class OptEngine:
 
     def readFileNames(self):
         """
-        Read .frcmod and .mol2 file names from ForceBalance input.
+        Read .frcmod and .mol2 file names from ForceBalance input. There may
+        be several .mol2 files (e.g. one per system); self.mol2 is the first.
         """
+        self.mol2s = []
         with open(self.optdir / self.inp.opt0, "r") as f:
             for line in f.readlines():
                 splitLine = line.split()
                 if len(splitLine) > 1:
                     if splitLine[0] == "forcefield":
-                        for i in range(1, 3):
-                            if ".mol2" in splitLine[i]:
-                                self.mol2 = splitLine[i]
-                            elif ".frcmod" in splitLine[i]:
-                                self.frcmod = splitLine[i]
+                        for token in splitLine[1:]:
+                            if ".mol2" in token:
+                                self.mol2s.append(token)
+                            elif ".frcmod" in token:
+                                self.frcmod = token
                     if splitLine[0] == "name":
                         self.initialTarget = splitLine[1]
+        if len(self.mol2s) > 0:
+            self.mol2 = self.mol2s[0]
 
     def checkFileNames(self):
         """
@@ -95,10 +147,11 @@ class OptEngine:
             raise RuntimeError(
                 f"No frcmod file specified for optimization in {self.inp.opt0}"
             )
-        if not (self.optdir / self.mol2).is_file():
-            raise RuntimeError(
-                f"Mol2 {self.mol2} specified in {self.inp.opt0} is not in {self.optdir}"
-            )
+        for mol2 in self.mol2s:
+            if not (self.optdir / mol2).is_file():
+                raise RuntimeError(
+                    f"Mol2 {mol2} specified in {self.inp.opt0} is not in {self.optdir}"
+                )
         if not (self.optdir / self.frcmod).is_file():
             raise RuntimeError(
                 f"Frcmod {self.frcmod} specified in {self.inp.opt0} is not in {self.optdir}"
@@ -113,7 +166,7 @@ class OptEngine:
         """
         utils.checkForAmber()
         os.chdir(self.optdir)
-        os.system(f"tleap -f {self.leap} > leap.out")
+        runTleap(self.leap, self.leapCache)
         self.prmtop = None
         for f in os.listdir():
             if f.endswith(".prmtop"):
@@ -181,20 +234,20 @@ class OptEngine:
         """
         Write tleap file for evaluating initial parameters on validation set.
         """
-        with open(os.path.join(self.optdir, "setup.leap"), "r") as leapRead:
-            with open(
-                os.path.join(self.optdir, "setup_valid_initial.leap"), "w"
-            ) as leapWrite:
-                for line in leapRead.readlines():
-                    if "loadamberparams" in line:
-                        oldName = line.split()[1]
-                        newName = "initial_" + oldName
-                        line = line.replace(oldName, newName)
-                    if "loadmol2" in line:
-                        oldName = line.split()[3]
-                        newName = "initial_" + oldName
-                        line = line.replace(oldName, newName)
-                    leapWrite.write(line)
+        writeValidInitialLeap(
+            self.optdir / "setup.leap", self.optdir / "setup_valid_initial.leap"
+        )
+
+    def getForceFieldFiles(self) -> list:
+        """
+        Get the names of the force field files being optimized.
+
+        Returns:
+            list: The .frcmod file, followed by the .mol2 files.
+        """
+        if len(self.mol2s) == 0 and self.mol2 is not None:
+            return [self.frcmod, self.mol2]
+        return [self.frcmod] + self.mol2s
 
     def copyToFF(self, f: str):
         """
@@ -212,7 +265,7 @@ class OptEngine:
         """
         (self.optdir / "forcefield").mkdir(exist_ok=True)
         if self.restartCycle == -1:
-            for f in [self.frcmod, self.mol2]:
+            for f in self.getForceFieldFiles():
                 self.copyToFF(f)
 
     # if we're not running initial training, we need to change the target in
@@ -255,16 +308,19 @@ class OptEngine:
     def makeInitialValidIn(self):
         if not self.inp.validinitial:
             return
+        ffFiles = self.getForceFieldFiles()
+
+        def toInitial(match):
+            if match.group() in ffFiles:
+                return f"initial_{match.group()}"
+            return match.group()
+
         with open(self.optdir / "valid_0.in", "r") as srcValid:
             with open(self.optdir / "valid_0_initial.in", "w") as destValid:
                 for line in srcValid.readlines():
                     if "$target" in line:
                         break
-                    destValid.write(
-                        line.replace(self.frcmod, f"initial_{self.frcmod}").replace(
-                            self.mol2, f"initial_{self.mol2}"
-                        )
-                    )
+                    destValid.write(re.sub(r"\S+", toInitial, line))
 
     def copyValids(self):
         for j in range(1, self.nvalids):
@@ -306,7 +362,8 @@ class OptEngine:
 
     def readOpt(self, filename: str) -> tuple:
         """
-        Read optimization results from a file.
+        Read optimization results from a file, or from the results of an
+        in-process ForceBalance run which wrote it.
 
         Args:
             filename (str): Name of the file to read.
@@ -314,47 +371,14 @@ class OptEngine:
         Returns:
             tuple: A tuple containing the optimization status and results.
         """
-        inInitialParams = False
-        inFinalParams = False
-        inFinalObj = False
-        params = []
-        initialParams = []
-        labels = []
-        results = {}
-        status = -1
-        with open(filename, "r") as f:
-            for line in f.readlines():
-                if "-------" in line:
-                    inFinalParams = False
-                    inInitialParams = False
-                if inFinalParams:
-                    if "=======" not in line:
-                        splitLine = line.split()
-                        params.append(splitLine[2])
-                        labels.append(splitLine[5])
-                if inInitialParams:
-                    if "=======" not in line:
-                        initialParams.append(line.split()[2])
-                if inFinalObj:
-                    results["obj"] = float(line.split()[5])
-                    inFinalObj = False
-                if "Final physical parameters" in line:
-                    inFinalParams = True
-                if "Starting parameter indices" in line:
-                    inInitialParams = True
-                if "Final objective function" in line:
-                    inFinalObj = True
-                if "Optimization Converged" in line:
-                    status = 0
-                if "Maximum number of optimization steps reached" in line:
-                    status = 2
-
-        params = np.asarray(params, dtype=np.float32)
-        initialParams = np.asarray(initialParams, dtype=np.float32)
-        results["params"] = params
-        results["labels"] = labels
-        results["initialParams"] = initialParams
-        return status, results
+        if Path(filename).name in self.fbResults:
+            parser = self.fbResults.pop(Path(filename).name)[0]
+        else:
+            parser = fbdriver.OptParser()
+            with open(filename, "r") as f:
+                for line in f:
+                    parser.feed(line)
+        return parser.getResults()
 
     def addTargetLines(self, inputFile: str, targetLines: list, newTarget: str):
         """
@@ -380,7 +404,8 @@ class OptEngine:
 
     def readValid(self, filename: str) -> float:
         """
-        Read validation results from a file.
+        Read validation results from a file, or from the results of an
+        in-process ForceBalance run which wrote it.
 
         Args:
             filename (str): Name of the file to read.
@@ -391,15 +416,25 @@ class OptEngine:
         Raises:
             RuntimeError: If ForceBalance single-point evaluation did not converge.
         """
-        with open(filename, "r") as f:
-            for line in f.readlines():
-                if "Objective Function Single Point" in line:
-                    return float(line.split()[6])
+        if Path(filename).name in self.fbResults:
+            parser = self.fbResults.pop(Path(filename).name)[1]
+        else:
+            parser = fbdriver.ValidParser()
+            with open(filename, "r") as f:
+                for line in f:
+                    parser.feed(line)
+                    if parser.obj is not None:
+                        break
+        if parser.obj is None:
             raise RuntimeError(
                 f"ForceBalance single-point evaluation of {filename} did not converge"
             )
+        return parser.obj
 
     def setupInputFiles(self, i):
+        # Inputs may already be set up, to evaluate the validation sets while sampling
+        if self.setupCycle == i:
+            return
         # Copy previous validation and optimization FB input files to current ones
         oldFiles = [
             f"opt_{i - 1}.in",
@@ -425,11 +460,65 @@ class OptEngine:
             copyfile(oldFile, newFile)
             # Add new targets section to each FB input file
             if "opt" in newFile:
-                self.addTargetLines(newFile, self.targetLines, f"train_{i}")
+                for name in self.getTargetNames(f"train_{i}"):
+                    self.addTargetLines(newFile, self.targetLines, name)
             elif "initial" in newFile:
-                self.addTargetLines(newFile, self.validInitialTargetLines, f"valid_{i}")
+                for name in self.getTargetNames(f"valid_{i}"):
+                    self.addTargetLines(newFile, self.validInitialTargetLines, name)
             else:
-                self.addTargetLines(newFile, self.validTargetLines, f"valid_{i}")
+                for name in self.getTargetNames(f"valid_{i}"):
+                    self.addTargetLines(newFile, self.validTargetLines, name)
+        if self.inp.targetwindow > 0:
+            self.selectTrainTargets(f"opt_{i}.in", i)
+        self.setupCycle = i
+
+    def selectTrainTargets(self, inputFile: str, i: int):
+        """
+        Age out training targets from an optimization input file, keeping
+        those of the last targetwindow cycles and targetsample older ones
+        chosen at random. Other targets are always kept, and a target which
+        was aged out of the previous cycle's input can be sampled back in.
+
+        Args:
+            inputFile (str): Name of the input file.
+            i (int): The iteration number.
+        """
+        optionLines, targets = targetcache.readFBInput(inputFile)
+        first = max(i - self.inp.targetwindow + 1, 1)
+        old = list(range(1, first))
+        keep = list(range(first, i + 1))
+        keep += sample(old, min(self.inp.targetsample, len(old)))
+        trainLines = {name: lines for name, lines in targets}
+        trainNames = set()
+        for j in range(1, i + 1):
+            trainNames.update(self.getTargetNames(f"train_{j}"))
+        newTargets = [target for target in targets if target[0] not in trainNames]
+        for j in sorted(keep):
+            for name in self.getTargetNames(f"train_{j}"):
+                if name in trainLines:
+                    newTargets.append((name, trainLines[name]))
+                else:
+                    lines = [
+                        line.replace(self.initialTarget, name)
+                        for line in self.targetLines
+                    ]
+                    newTargets.append((name, lines))
+        targetcache.writeFBInput(inputFile, optionLines, newTargets)
+
+    def getTargetNames(self, name: str) -> list:
+        """
+        Get the names of the ForceBalance targets holding one kind of data,
+        e.g. train_3 for the training data of cycle 3. Subclasses with
+        several targets per kind of data (e.g. one per system) override
+        this.
+
+        Args:
+            name (str): Name of the kind of data.
+
+        Returns:
+            list: List of target names.
+        """
+        return [name]
 
     def computeXTicks(self):
         cycles = len(self.valid)
@@ -574,28 +663,252 @@ class OptEngine:
         Args:
             i (int): The iteration number.
         """
-        copyfile(
-            os.path.join("result", f"opt_{i}", self.frcmod),
-            os.path.join("forcefield", self.frcmod),
-        )
-        copyfile(
-            os.path.join("result", f"opt_{i}", self.mol2),
-            os.path.join("forcefield", self.mol2),
-        )
+        for f in self.getForceFieldFiles():
+            copyfile(
+                os.path.join("result", f"opt_{i}", f),
+                os.path.join("forcefield", f),
+            )
+
+    def getValidJobs(self, i: int, suffix: str = "") -> list:
+        """
+        Get the ForceBalance jobs which evaluate every validation set of a
+        given iteration.
+
+        Args:
+            i (int): The iteration number.
+            suffix (str, optional): "_previous" for the previous parameters,
+                "_initial" for the initial parameters, or "" for the current
+                parameters. Defaults to "".
+
+        Returns:
+            list: List of (input, output, error) file name tuples.
+        """
+        if suffix == "_initial":
+            inSuffix = suffix
+        else:
+            inSuffix = ""
+        names = [f"valid_{i}"]
+        for j in range(1, self.nvalids):
+            names.append(f"valid_{i}_{j}")
+        return [
+            (f"{name}{inSuffix}.in", f"{name}{suffix}.out", f"{name}{suffix}.err")
+            for name in names
+        ]
+
+    def callForceBalance(self, inp: str, out: str, err: str = None):
+        """
+        Run ForceBalance, either in this process (if fbinprocess is set) or
+        as a subprocess. Results of in-process runs are kept for readOpt and
+        readValid, so the output doesn't have to be read back.
+
+        Args:
+            inp (str): Input file for ForceBalance.
+            out (str): File to write the output to.
+            err (str, optional): File to write errors to. Defaults to None.
+        """
+        if self.inp.fbinprocess:
+            self.fbResults[Path(out).name] = fbdriver.runForceBalance(inp, out, err)
+        else:
+            runForceBalance(inp, out, err)
+
+    def runForceBalanceJobs(self, jobs: list):
+        """
+        Run independent ForceBalance jobs, up to self.fbWorkers at a time.
+        In-process jobs run one at a time, since ForceBalance's logging and
+        working directory are shared by the whole process.
+
+        Args:
+            jobs (list): List of (input, output, error) file name tuples.
+        """
+        nworkers = min(self.fbWorkers, len(jobs))
+        if nworkers > 1 and not self.inp.fbinprocess:
+            # Each job is its own ForceBalance process, so threads suffice
+            with ThreadPool(nworkers) as p:
+                p.map(runForceBalanceStar, jobs)
+        else:
+            for job in jobs:
+                self.callForceBalance(*job)
+
+    def runValidJobs(self, jobs: list):
+        """
+        Run single-point ForceBalance jobs, through the target cache if
+        targetcache is set.
+
+        Args:
+            jobs (list): List of (input, output, error) file name tuples.
+        """
+        if self.targetCache is None:
+            self.runForceBalanceJobs(jobs)
+        else:
+            self.runCachedJobs(jobs)
+
+    def runCachedJobs(self, jobs: list):
+        """
+        Run single-point ForceBalance jobs, only evaluating the targets whose
+        objective function with the same parameters isn't in the target
+        cache. The remaining targets of each job are written to a reduced
+        input, named after the job's output with an "_uncached" suffix, and
+        those jobs run concurrently. The output of each job is then written
+        from the cached and new objective functions, in ForceBalance's
+        format. Jobs which fail keep ForceBalance's output, and jobs whose
+        targets don't all report an objective function are rerun in full.
+
+        Args:
+            jobs (list): List of (input, output, error) file name tuples.
+        """
+        root = Path.cwd()
+        cachedJobs = []
+        uncachedJobs = []
+        for inp, out, err in jobs:
+            optionLines, targets = targetcache.readFBInput(inp)
+            parameterKey = targetcache.getParameterKey(optionLines, root)
+            keys = [
+                targetcache.getTargetKey(parameterKey, name, lines, root)
+                for name, lines in targets
+            ]
+            uncached = [
+                target
+                for target, key in zip(targets, keys)
+                if self.targetCache.get(key) is None
+            ]
+            stem = Path(out).stem
+            uncachedJob = None
+            if len(uncached) > 0:
+                uncachedJob = (f"{stem}_uncached.in", f"{stem}_uncached.out", err)
+                targetcache.writeFBInput(uncachedJob[0], optionLines, uncached)
+                uncachedJobs.append(uncachedJob)
+            cachedJobs.append(
+                (out, optionLines, targets, keys, parameterKey, uncachedJob)
+            )
+        self.runForceBalanceJobs(uncachedJobs)
+
+        fullJobs = []
+        for (inp, out, err), cachedJob in zip(jobs, cachedJobs):
+            if not self.combineCachedTargets(*cachedJob):
+                fullJobs.append((inp, out, err))
+        self.runForceBalanceJobs(fullJobs)
+
+    def combineCachedTargets(
+        self,
+        out: str,
+        optionLines: list,
+        targets: list,
+        keys: list,
+        parameterKey: str,
+        uncachedJob: tuple,
+    ) -> bool:
+        """
+        Store the objective functions from a reduced single-point job in the
+        target cache, and write the output of the full job.
+
+        Args:
+            out (str): Output file of the full job.
+            optionLines (list): Lines outside of target sections.
+            targets (list): List of (name, lines) for each target.
+            keys (list): Target cache key of each target.
+            parameterKey (str): Key of the parameters.
+            uncachedJob (tuple): The reduced job, or None if every target
+                was cached.
+
+        Returns:
+            bool: False if the full job has to be run instead.
+        """
+        regularizationKey = f"{parameterKey}:regularization"
+        if uncachedJob is not None:
+            uncachedOut = uncachedJob[1]
+            # Results of in-process runs aren't read from the file here
+            self.fbResults.pop(Path(uncachedOut).name, None)
+            if self.readValidOrNone(uncachedOut) is None:
+                # Keep ForceBalance's output, so the failure is reported
+                copyfile(uncachedOut, out)
+                return True
+            objectives, regularization = targetcache.readObjectives(uncachedOut)
+            if regularization is not None:
+                self.targetCache.store(regularizationKey, regularization)
+            for (name, lines), key in zip(targets, keys):
+                if name in objectives:
+                    self.targetCache.store(key, objectives[name])
+
+        regularization = self.targetCache.entries.get(regularizationKey, None)
+        values = [self.targetCache.entries.get(key, None) for key in keys]
+        if regularization is None or None in values:
+            return False
+        weights = [
+            float(targetcache.getOption(lines, "weight", "1.0")[0])
+            for name, lines in targets
+        ]
+        normalize = targetcache.getOption(optionLines, "normalize_weights", "true")
+        if normalize[0].lower() not in ["0", "false", "no", "off"]:
+            total = sum(weights)
+            weights = [w / total for w in weights]
+        objectives = [
+            (name, value, w)
+            for (name, lines), value, w in zip(targets, values, weights)
+        ]
+        targetcache.writeObjectives(out, objectives, regularization)
+        return True
+
+    def readValidOrNone(self, filename: str) -> float:
+        """
+        Read validation results from a file, if the evaluation succeeded.
+
+        Args:
+            filename (str): Name of the file to read.
+
+        Returns:
+            float: The validation result, or None if the evaluation failed.
+        """
+        try:
+            return self.readValid(filename)
+        except RuntimeError:
+            return None
 
     def runValidPrevious(self, i):
+        """
+        Evaluate the validation sets of a given iteration with the previous
+        iteration's parameters.
+
+        Args:
+            i (int): The iteration number.
+        """
         # If we're just restarting, skip if this calculation finished
         if len(self.validPrevious) < i:
-            runForceBalance(
-                f"valid_{i}.in", f"valid_{i}_previous.out", f"valid_{i}_previous.err"
-            )
-            for j in range(1, self.nvalids):
-                runForceBalance(
-                    f"valid_{i}_{j}.in",
-                    f"valid_{i}_{j}_previous.out",
-                    f"valid_{i}_{j}_previous.err",
-                )
-            self.validPrevious.append(self.readValid(f"valid_{i}_previous.out"))
+            self.recordValidPrevious(i, *self.evaluateValidPrevious(i))
+
+    def evaluateValidPrevious(self, i: int) -> tuple[float, float]:
+        """
+        Evaluate the validation sets of a given iteration with the previous
+        iteration's parameters, without recording the result. The input
+        files must already be set up.
+
+        Args:
+            i (int): The iteration number.
+
+        Returns:
+            tuple: The validation result and the time taken.
+        """
+        start = perf_counter()
+        self.runValidJobs(self.getValidJobs(i, "_previous"))
+        return self.readValid(f"valid_{i}_previous.out"), perf_counter() - start
+
+    def recordValidPrevious(
+        self, i: int, v: float, elapsed: float, cacheEntries: dict = None
+    ):
+        """
+        Record the result of evaluating the validation sets of a given
+        iteration with the previous iteration's parameters.
+
+        Args:
+            i (int): The iteration number.
+            v (float): The validation result.
+            elapsed (float): Time taken by the evaluation.
+            cacheEntries (dict, optional): Target cache entries of the
+                process which ran the evaluation. Defaults to None.
+        """
+        if cacheEntries is not None and self.targetCache is not None:
+            self.targetCache.update(cacheEntries)
+        self.validPrevious.append(v)
+        self.journal.record(i, "validPrevious", obj=v, time=elapsed)
 
     def runTraining(self, i: int):
         """
@@ -609,38 +922,49 @@ class OptEngine:
                 self.respPriors.updateRespPriors(
                     i, os.path.join("forcefield", self.mol2)
                 )
-            runForceBalance(f"opt_{i}.in", f"opt_{i}.out", f"opt_{i}.err")
-            self.checkOpt(i)
+            start = perf_counter()
+            self.callForceBalance(f"opt_{i}.in", f"opt_{i}.out", f"opt_{i}.err")
+            self.checkOpt(i, perf_counter() - start)
 
     def runValid(self, i: int):
         """
-        Run validation for a given iteration.
+        Run validation for a given iteration. If the validation sets are also
+        evaluated with the initial parameters, those evaluations run
+        alongside.
 
         Args:
             i (int): The iteration number.
         """
         if len(self.valid) < i:
-            runForceBalance(f"valid_{i}.in", f"valid_{i}.out", f"valid_{i}.err")
-            for j in range(1, self.nvalids):
-                runForceBalance(
-                    f"valid_{i}_{j}.in", f"valid_{i}_{j}.out", f"valid_{i}_{j}.err"
-                )
-            self.valid.append(self.readValid(f"valid_{i}.out"))
+            start = perf_counter()
+            jobs = self.getValidJobs(i)
+            doInitial = self.inp.validinitial and len(self.validInitial) < i
+            if doInitial:
+                jobs += self.getValidJobs(i, "_initial")
+            self.runValidJobs(jobs)
+            elapsed = perf_counter() - start
+            v = self.readValid(f"valid_{i}.out")
+            self.valid.append(v)
+            self.journal.record(i, "valid", obj=v, time=elapsed)
+            if doInitial:
+                v = self.readValid(f"valid_{i}_initial.out")
+                self.validInitial.append(v)
+                self.journal.record(i, "validInitial", obj=v, time=elapsed)
 
     def runValidInitial(self, i: int):
+        """
+        Run validation with the initial parameters for a given iteration,
+        if runValid hasn't done so already.
+
+        Args:
+            i (int): The iteration number.
+        """
         if len(self.validInitial) < i:
-            runForceBalance(
-                f"valid_{i}_initial.in",
-                f"valid_{i}_initial.out",
-                f"valid_{i}_initial.err",
-            )
-            for j in range(1, self.nvalids):
-                runForceBalance(
-                    f"valid_{i}_{j}_initial.in",
-                    f"valid_{i}_{j}_initial.out",
-                    f"valid_{i}_{j}_initial.err",
-                )
-            self.validInitial.append(self.readValid(f"valid_{i}_initial.out"))
+            start = perf_counter()
+            self.runValidJobs(self.getValidJobs(i, "_initial"))
+            v = self.readValid(f"valid_{i}_initial.out")
+            self.validInitial.append(v)
+            self.journal.record(i, "validInitial", obj=v, time=perf_counter() - start)
 
     def runValidFinal(self, i: int, lastCycle: int) -> float:
         """
@@ -655,16 +979,22 @@ class OptEngine:
         """
         self.copyResults(i)
         out = f"valid_{i}_final.out"
-        runForceBalance(f"valid_{lastCycle}.in", out)
-        return self.readValid(out)
+        start = perf_counter()
+        self.runValidJobs([(f"valid_{lastCycle}.in", out, None)])
+        v = self.readValid(out)
+        self.journal.record(
+            i, "validFinal", obj=v, lastCycle=lastCycle, time=perf_counter() - start
+        )
+        return v
 
     def runInitialTraining(self):
         """
         Run initial training for the forcefield optimization.
         """
-        runForceBalance(self.inp.opt0, "opt_0.out", "opt_0.err")
+        start = perf_counter()
+        self.callForceBalance(self.inp.opt0, "opt_0.out", "opt_0.err")
         self.copyResults(0)
-        self.checkOpt(0)
+        self.checkOpt(0, perf_counter() - start)
 
     # We assume that optimizeForcefield and all the functions it calls run in the inp.optdir directory
     def optimizeForcefield(self, i):
@@ -768,14 +1098,11 @@ class OptEngine:
         """
         resultFolder = self.home / "3_result"
         resultFolder.mkdir(exist_ok=True)
-        copyfile(
-            self.optdir / Path("result") / f"opt_{best}" / self.mol2,
-            resultFolder / self.mol2,
-        )
-        copyfile(
-            self.optdir / Path("result") / f"opt_{best}" / self.frcmod,
-            resultFolder / self.frcmod,
-        )
+        for f in self.getForceFieldFiles():
+            copyfile(
+                self.optdir / Path("result") / f"opt_{best}" / f,
+                resultFolder / f,
+            )
 
     def getFinalValidations(self, lastCycle: int) -> int:
         """
@@ -789,48 +1116,79 @@ class OptEngine:
         """
         vs = []
         for j in range(lastCycle - self.inp.patience, lastCycle + 1):
+            record = self.journal.get(j, "validFinal")
+            if record is not None and record["lastCycle"] == lastCycle:
+                vs.append(record["obj"])
+                continue
             try:
                 v = self.readValid(f"valid_{j}_final.out")
-            except:
+            except (OSError, RuntimeError, ValueError, IndexError):
                 v = self.runValidFinal(j, lastCycle)
             vs.append(v)
         vs = np.asarray(vs)
         return np.argmin(vs) + lastCycle - self.inp.patience
 
-    def checkOpt(self, i: int):
+    def checkOpt(self, i: int, elapsed: float = None):
         """
-        Check optimization results for a given iteration.
+        Check optimization results for a given iteration and record them in
+        the journal.
 
         Args:
             i (int): The iteration number.
+            elapsed (float, optional): Time taken by the optimization, in
+                seconds. Defaults to None.
 
         Raises:
             RuntimeError: If ForceBalance fails.
         """
         status, results = self.readOpt(self.optdir / f"opt_{i}.out")
-        if status == 0:
-            # setup params and labels after first optimization
-            if i - (not self.inp.initialtraining) == 0:
-                self.params = np.zeros((self.maxCycles + 2, len(results["labels"])))
-                self.labels = results["labels"]
-                self.params[0, :] = results["initialParams"]
-            self.train.append(results["obj"])
-            self.sortParams(results, i)
-        else:
+        if status != 0:
             raise RuntimeError("ForceBalance failed!")
+        self.addOptResults(i, results)
+        self.recordOpt(i, results, time=elapsed)
 
-    def determineRestart(self):
+    def addOptResults(self, i: int, results: dict):
         """
-        Determine the restart cycle and set restart variables.
+        Add the objective function and parameters of an optimization.
+
+        Args:
+            i (int): The iteration number.
+            results (dict): Optimization results, as returned by readOpt.
         """
-        self.train = []
-        self.valid = []
-        self.validInitial = []
-        self.validPrevious = []
-        if not self.inp.restart:
-            self.restartCycle = -1
-            return
-        # Determine cycle for restart, set restart variables
+        # setup params and labels after first optimization
+        if i - (not self.inp.initialtraining) == 0:
+            self.params = np.zeros((self.maxCycles + 2, len(results["labels"])))
+            self.labels = results["labels"]
+            self.params[0, :] = results["initialParams"]
+        self.train.append(results["obj"])
+        self.sortParams(results, i)
+
+    def recordOpt(self, i: int, results: dict, **data):
+        """
+        Record the results of an optimization in the journal.
+
+        Args:
+            i (int): The iteration number.
+            results (dict): Optimization results, as returned by readOpt.
+            **data: Additional data to record, e.g. timings.
+        """
+        self.journal.record(
+            i,
+            "opt",
+            obj=results["obj"],
+            params=[float(p) for p in results["params"]],
+            labels=list(results["labels"]),
+            initialParams=[float(p) for p in results["initialParams"]],
+            **data,
+        )
+
+    def importLogs(self):
+        """
+        Import the stages completed by a run from before the cycle journal
+        existed by reading its ForceBalance output files. Stops at the first
+        stage which did not finish.
+        """
+        readErrors = (OSError, RuntimeError, ValueError, IndexError, KeyError)
         for i in range(self.maxCycles + 2):
             if i == 0 and not self.inp.initialtraining:
                 continue
@@ -838,28 +1196,74 @@ class OptEngine:
                 # check if valid previous finished
                 try:
                     vPrev = self.checkValids(i, "_previous")
-                except:
+                except readErrors:
                     break
-                self.validPrevious.append(vPrev)
+                self.journal.record(i, "validPrevious", obj=vPrev, imported=True)
             # check if parameter optimization finished
             try:
-                self.checkOpt(i)
-            except Exception:
+                status, results = self.readOpt(self.optdir / f"opt_{i}.out")
+            except readErrors:
+                break
+            if status != 0 or "obj" not in results:
                 break
+            self.recordOpt(i, results, imported=True)
             if i > 0:
                 # check if validation finished
                 try:
                     v = self.checkValids(i)
-                except:
+                except readErrors:
                     break
-                self.valid.append(v)
+                self.journal.record(i, "valid", obj=v, imported=True)
                 # check if validation with initial params finished
                 if self.inp.validinitial:
                     try:
                         vInitial = self.checkValids(i, "_initial")
-                    except:
+                    except readErrors:
+                        break
+                    self.journal.record(i, "validInitial", obj=vInitial, imported=True)
+
+    def determineRestart(self):
+        """
+        Determine the restart cycle and set restart variables from the
+        cycle journal. Runs without a journal are imported from their
+        ForceBalance output files first.
+        """
+        self.train = []
+        self.valid = []
+        self.validInitial = []
+        self.validPrevious = []
+        if not self.inp.restart:
+            self.journal.clear()
+            self.restartCycle = -1
+            return
+        # Imported records are redone, since how many validation sets must
+        # have finished may have changed since the import
+        if self.journal.isImported():
+            self.journal.clear()
+            self.importLogs()
+        # Determine cycle for restart, set restart variables
+        for i in range(self.maxCycles + 2):
+            if i == 0 and not self.inp.initialtraining:
+                continue
+            if i > 0:
+                record = self.journal.get(i, "validPrevious")
+                if record is None:
+                    break
+                self.validPrevious.append(record["obj"])
+            record = self.journal.get(i, "opt")
+            if record is None:
+                break
+            self.addOptResults(i, record)
+            if i > 0:
+                record = self.journal.get(i, "valid")
+                if record is None:
+                    break
+                self.valid.append(record["obj"])
+                if self.inp.validinitial:
+                    record = self.journal.get(i, "validInitial")
+                    if record is None:
                         break
-                    self.validInitial.append(vInitial)
+                    self.validInitial.append(record["obj"])
                 if self.respPriors is not None:
                     self.respPriors.getCharges(i)
         self.restartCycle = i
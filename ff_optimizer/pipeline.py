@@ -0,0 +1,194 @@
+import threading
+import traceback
+from multiprocessing import Pool
+
+
+class Task:
+    def __init__(self, name: str, func, args: tuple = (), deps: tuple = (), ready=None):
+        """
+        Initialize a pipeline task.
+
+        Args:
+            name (str): Unique name of the task.
+            func: Module-level function run in a pool worker.
+            args (tuple, optional): Arguments for func. Defaults to ().
+            deps (tuple, optional): Names of tasks which must finish first.
+                Defaults to ().
+            ready (optional): Function with no arguments which returns True
+                once the task's inputs exist, e.g. a check for MMFinished.txt.
+                Defaults to None (always ready).
+        """
+        self.name = name
+        self.func = func
+        self.args = args
+        self.deps = list(deps)
+        self.ready = ready
+
+    def isReady(self, done: dict) -> bool:
+        """
+        Check whether the task can be started.
+
+        Args:
+            done (dict): Results of the tasks which have finished.
+
+        Returns:
+            bool: True if all dependencies are done and the ready condition holds.
+        """
+        for dep in self.deps:
+            if dep not in done:
+                return False
+        return self.ready is None or self.ready()
+
+
+class Pipeline:
+    def __init__(self, nworkers: int, interval: float = 5):
+        """
+        Initialize a dependency-driven pipeline. Tasks are run in a pool of
+        worker processes as soon as their dependencies have finished and
+        their ready conditions hold, while the calling process does other
+        work (e.g. MM sampling).
+
+        Args:
+            nworkers (int): Number of worker processes.
+            interval (float, optional): Time in seconds between checks of
+                the ready conditions. Defaults to 5.
+        """
+        self.nworkers = nworkers
+        self.interval = interval
+        self.tasks = {}
+
+    def addTask(self, name: str, func, args: tuple = (), deps: tuple = (), ready=None):
+        """
+        Add a task to the pipeline. See Task for the arguments.
+
+        Raises:
+            ValueError: If the name is taken or a dependency is unknown.
+        """
+        if name in self.tasks:
+            raise ValueError(f"Pipeline task {name} already exists")
+        for dep in deps:
+            if dep not in self.tasks:
+                raise ValueError(f"Pipeline task {name} depends on unknown task {dep}")
+        self.tasks[name] = Task(name, func, args, deps, ready)
+
+    def run(self, foreground=None) -> dict:
+        """
+        Run all tasks. If foreground is given, it is run in the calling
+        process while the tasks are scheduled in the background.
+
+        Args:
+            foreground (optional): Function with no arguments to run in the
+                calling process. Defaults to None.
+
+        Returns:
+            dict: Maps task names to the values returned by their functions.
+
+        Raises:
+            RuntimeError: If a task fails or can never become ready.
+        """
+        self.done = {}
+        self.failed = {}
+        self.running = set()
+        self.foregroundDone = foreground is None
+        self.error = None
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+        self.wakeup = threading.Event()
+        # Workers are forked before the scheduler thread starts
+        with Pool(max(min(self.nworkers, len(self.tasks)), 1)) as p:
+            scheduler = threading.Thread(target=self.schedule, args=(p,), daemon=True)
+            scheduler.start()
+            try:
+                if foreground is not None:
+                    foreground()
+            except BaseException:
+                self.finished.set()
+                self.wakeup.set()
+                scheduler.join()
+                raise
+            with self.lock:
+                self.foregroundDone = True
+            self.wakeup.set()
+            scheduler.join()
+        if self.error is not None:
+            raise RuntimeError(self.error)
+        return self.done
+
+    def schedule(self, p: Pool):
+        """
+        Submit tasks to the pool as they become ready, until all tasks are
+        done or one of them fails.
+
+        Args:
+            p (Pool): Pool of worker processes.
+        """
+        submitted = set()
+        while not self.finished.is_set():
+            self.wakeup.clear()
+            with self.lock:
+                if len(self.failed) > 0:
+                    name, message = sorted(self.failed.items())[0]
+                    self.error = f"Pipeline task {name} failed:\n{message}"
+                    break
+                if len(self.done) == len(self.tasks):
+                    break
+                for name, task in self.tasks.items():
+                    if name in submitted or not task.isReady(self.done):
+                        continue
+                    submitted.add(name)
+                    self.running.add(name)
+                    p.apply_async(
+                        task.func,
+                        task.args,
+                        callback=self.getCallback(name),
+                        error_callback=self.getErrorCallback(name),
+                    )
+                # Once nothing else can make progress, waiting won't help
+                if self.foregroundDone and len(self.running) == 0:
+                    if len(submitted) < len(self.tasks):
+                        waiting = sorted(set(self.tasks.keys()) - submitted)
+                        self.error = f"Pipeline tasks {waiting} never became ready"
+                        break
+            self.wakeup.wait(self.interval)
+        self.finished.set()
+
+    def getCallback(self, name: str):
+        """
+        Get the function the pool calls when a task finishes.
+
+        Args:
+            name (str): Name of the task.
+
+        Returns:
+            Function storing the task's result.
+        """
+
+        def callback(result):
+            with self.lock:
+                self.running.discard(name)
+                self.done[name] = result
+            # Wake the scheduler so dependent tasks start right away
+            self.wakeup.set()
+
+        return callback
+
+    def getErrorCallback(self, name: str):
+        """
+        Get the function the pool calls when a task raises an exception.
+
+        Args:
+            name (str): Name of the task.
+
+        Returns:
+            Function storing the task's error.
+        """
+
+        def errorCallback(error):
+            with self.lock:
+                self.running.discard(name)
+                self.failed[name] = "".join(
+                    traceback.format_exception(type(error), error, error.__traceback__)
+                )
+            self.wakeup.set()
+
+        return errorCallback
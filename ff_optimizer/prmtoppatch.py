@@ -0,0 +1,433 @@
+import hashlib
+import itertools
+import json
+import os
+from math import sqrt
+from pathlib import Path
+from shutil import copyfile
+
+import numpy as np
+from parmed.amber import AmberParm
+
+from .leapcache import getLeapOutputs, readLeapScript
+
+# Number of characters taken up by the atom types of each frcmod section
+typeWidths = {"BOND": 5, "ANGL": 8, "DIHE": 11, "IMPR": 11}
+# Number of values of each frcmod section
+nvalues = {"MASS": 1, "BOND": 2, "ANGL": 2, "DIHE": 4, "IMPR": 3, "NONB": 2}
+
+
+def getLeapInputs(leap: str) -> tuple:
+    """
+    Get the files a leap script reads from the current directory.
+
+    Args:
+        leap (str): Path to the leap script.
+
+    Returns:
+        tuple: Lists of frcmod files, mol2 files, and all other input files.
+    """
+    outputs = getLeapOutputs(leap)
+    frcmods = []
+    mol2s = []
+    others = []
+    for tokens in readLeapScript(leap):
+        lowered = [token.lower() for token in tokens]
+        for i, token in enumerate(tokens):
+            if token in outputs or not os.path.isfile(token):
+                continue
+            if i > 0 and lowered[i - 1] == "loadamberparams":
+                frcmods.append(token)
+            elif i > 0 and lowered[i - 1] == "loadmol2":
+                mol2s.append(token)
+            else:
+                others.append(token)
+    return frcmods, mol2s, others
+
+
+def getKey(types: tuple) -> tuple:
+    """
+    Get the canonical key of a bond, angle, or proper dihedral, which can be
+    read in either direction.
+
+    Args:
+        types (tuple): Atom types.
+
+    Returns:
+        tuple: The smaller of types and reversed types.
+    """
+    return min(tuple(types), tuple(reversed(types)))
+
+
+def readFrcmods(frcmods: list) -> dict:
+    """
+    Read parameters from frcmod files. Later files override earlier ones,
+    as they do in tleap.
+
+    Args:
+        frcmods (list): Paths to frcmod files.
+
+    Returns:
+        dict: Maps section names ("MASS", "BOND", "ANGL", "DIHE", "IMPR",
+            "NONB") to dicts from atom types to parameters. Dihedrals map
+            to lists of (force constant, phase, periodicity) terms.
+    """
+    params = {section: {} for section in nvalues.keys()}
+    for frcmod in frcmods:
+        with open(frcmod, "r") as f:
+            lines = f.readlines()[1:]
+        section = None
+        continuing = False
+        for line in lines:
+            if len(line.strip()) == 0:
+                section = None
+                continue
+            if section is None:
+                if line[:4] in nvalues:
+                    section = line[:4]
+                continue
+            if section in typeWidths:
+                width = typeWidths[section]
+                types = tuple(t.strip() for t in line[:width].split("-"))
+                values = [float(v) for v in line[width:].split()[: nvalues[section]]]
+            else:
+                splitLine = line.split()
+                types = (splitLine[0],)
+                values = [float(v) for v in splitLine[1 : nvalues[section] + 1]]
+            if section == "DIHE":
+                # Negative periodicities mean more terms follow
+                types = getKey(types)
+                idivf, pk, phase, pn = values
+                term = (pk / idivf, phase, abs(pn))
+                if continuing:
+                    params[section][types].append(term)
+                else:
+                    params[section][types] = [term]
+                continuing = pn < 0
+            elif section == "IMPR":
+                params[section][types] = [(values[0], values[1], abs(values[2]))]
+            elif section in ["BOND", "ANGL"]:
+                params[section][getKey(types)] = values
+            else:
+                params[section][types[0]] = values
+    return params
+
+
+def readMol2s(mol2s: list) -> tuple:
+    """
+    Read atoms, bonds, and charges from mol2 files.
+
+    Args:
+        mol2s (list): Paths to mol2 files.
+
+    Returns:
+        tuple: List of (residue, atom name, atom type) for each atom, list of
+            bonds, and dict from (residue, atom name) to charge.
+    """
+    atoms = []
+    bonds = []
+    charges = {}
+    for mol2 in mol2s:
+        section = None
+        with open(mol2, "r") as f:
+            for line in f.readlines():
+                if line.startswith("@<TRIPOS>"):
+                    section = line.strip()
+                    continue
+                splitLine = line.split()
+                if len(splitLine) == 0:
+                    continue
+                if section == "@<TRIPOS>ATOM":
+                    atoms.append((splitLine[7], splitLine[1], splitLine[5]))
+                    charges[(splitLine[7], splitLine[1])] = float(splitLine[8])
+                elif section == "@<TRIPOS>BOND":
+                    bonds.append(tuple(splitLine[1:4]))
+    return atoms, bonds, charges
+
+
+def getTopologySignature(leap: str) -> str:
+    """
+    Get a hash of everything in a tleap build except the parameter values
+    which can be patched: the leap script, other inputs such as conf.pdb,
+    the atoms and bonds of the mol2 files, and which parameters the frcmod
+    files define.
+
+    Args:
+        leap (str): Path to the leap script.
+
+    Returns:
+        str: Hex digest identifying the topology.
+    """
+    frcmods, mol2s, others = getLeapInputs(leap)
+    h = hashlib.sha256()
+    for f in [leap] + others:
+        with open(f, "rb") as g:
+            h.update(hashlib.sha256(g.read()).digest())
+    atoms, bonds, _ = readMol2s(mol2s)
+    params = readFrcmods(frcmods)
+    topology = {
+        "atoms": atoms,
+        "bonds": bonds,
+        "mass": sorted(params["MASS"].items()),
+    }
+    for section in ["BOND", "ANGL", "NONB"]:
+        topology[section] = sorted(params[section].keys())
+    for section in ["DIHE", "IMPR"]:
+        topology[section] = sorted(
+            (key, [term[2] for term in terms]) for key, terms in params[section].items()
+        )
+    h.update(json.dumps(topology).encode())
+    return h.hexdigest()
+
+
+def getImproperKeys(types: tuple) -> list:
+    """
+    Get the frcmod keys which could match an improper dihedral, most specific
+    first. The central atom is third.
+
+    Args:
+        types (tuple): Atom types of the improper, as ordered in the prmtop.
+
+    Returns:
+        list: Candidate keys.
+    """
+    keys = []
+    for nwild in range(3):
+        for perm in itertools.permutations([types[0], types[1], types[3]]):
+            key = ("X",) * nwild + perm[nwild:2] + (types[2], perm[2])
+            if key not in keys:
+                keys.append(key)
+    return keys
+
+
+def isClose(a: float, b: float) -> bool:
+    """
+    Check whether a parameter in a prmtop matches its value in a frcmod or
+    mol2 file, up to the precision of the prmtop.
+
+    Args:
+        a (float): First value.
+        b (float): Second value.
+
+    Returns:
+        bool: True if the values match.
+    """
+    return bool(np.isclose(a, b, rtol=1e-4, atol=1e-6))
+
+
+class ParameterUpdates:
+    def __init__(self):
+        """
+        Collect new values for the parameter types of a prmtop. Types are
+        shared between terms, so every term using a type must ask for the
+        same new values.
+        """
+        self.updates = {}
+
+    def add(self, paramType, attrs: list, oldValues: list, newValues: list):
+        """
+        Request new values for a parameter type.
+
+        Args:
+            paramType: parmed parameter type (e.g. BondType) from the prmtop.
+            attrs (list): Names of the attributes to update.
+            oldValues (list): Values in the frcmod the prmtop was built from.
+            newValues (list): Values in the new frcmod.
+
+        Raises:
+            RuntimeError: If the prmtop doesn't match the old values or
+                different new values are requested for the same type.
+        """
+        for attr, old in zip(attrs, oldValues):
+            if not isClose(getattr(paramType, attr), old):
+                raise RuntimeError(
+                    f"{type(paramType).__name__} {attr} in prmtop does not match its frcmod"
+                )
+        values = list(zip(attrs, newValues))
+        if self.updates.setdefault(id(paramType), (paramType, values))[1] != values:
+            raise RuntimeError(
+                f"{type(paramType).__name__} is shared by terms with different parameters"
+            )
+
+    def apply(self):
+        """
+        Set the new values.
+        """
+        for paramType, values in self.updates.values():
+            for attr, value in values:
+                setattr(paramType, attr, value)
+
+
+def patchBonded(parm: AmberParm, oldParams: dict, newParams: dict):
+    """
+    Update bond, angle, and dihedral parameters of a prmtop which are
+    defined in the frcmod files.
+
+    Args:
+        parm (AmberParm): The prmtop.
+        oldParams (dict): Parameters the prmtop was built from.
+        newParams (dict): New parameters, as returned by readFrcmods.
+
+    Raises:
+        RuntimeError: If the prmtop can't be patched consistently.
+    """
+    updates = ParameterUpdates()
+    for bond in parm.bonds:
+        key = getKey((bond.atom1.type, bond.atom2.type))
+        if key in newParams["BOND"]:
+            updates.add(
+                bond.type, ["k", "req"], oldParams["BOND"][key], newParams["BOND"][key]
+            )
+    for angle in parm.angles:
+        key = getKey((angle.atom1.type, angle.atom2.type, angle.atom3.type))
+        if key in newParams["ANGL"]:
+            updates.add(
+                angle.type,
+                ["k", "theteq"],
+                oldParams["ANGL"][key],
+                newParams["ANGL"][key],
+            )
+    for dihedral in parm.dihedrals:
+        types = (
+            dihedral.atom1.type,
+            dihedral.atom2.type,
+            dihedral.atom3.type,
+            dihedral.atom4.type,
+        )
+        if dihedral.improper:
+            section = "IMPR"
+            keys = getImproperKeys(types)
+        else:
+            section = "DIHE"
+            keys = [getKey(types), getKey(("X", types[1], types[2], "X"))]
+        # tleap uses the most specific match
+        key = None
+        for k in keys:
+            if k in newParams[section] or k in oldParams[section]:
+                key = k
+                break
+        if key is None or key not in newParams[section]:
+            continue
+        oldTerms = {term[2]: term for term in oldParams[section][key]}
+        newTerms = {term[2]: term for term in newParams[section][key]}
+        per = abs(dihedral.type.per)
+        if per not in oldTerms or per not in newTerms:
+            raise RuntimeError(f"Dihedral {'-'.join(key)} changed periodicities")
+        updates.add(
+            dihedral.type, ["phi_k", "phase"], oldTerms[per][:2], newTerms[per][:2]
+        )
+    updates.apply()
+
+
+def patchCharges(parm: AmberParm, oldCharges: dict, newCharges: dict):
+    """
+    Update the charges of atoms defined in the mol2 files.
+
+    Args:
+        parm (AmberParm): The prmtop.
+        oldCharges (dict): Charges the prmtop was built from.
+        newCharges (dict): New charges, as returned by readMol2s.
+
+    Raises:
+        RuntimeError: If the prmtop doesn't match the old charges.
+    """
+    for atom in parm.atoms:
+        key = (atom.residue.name, atom.name)
+        if key not in newCharges:
+            continue
+        if not isClose(atom.charge, oldCharges[key]):
+            raise RuntimeError(f"Charge of {'/'.join(key)} does not match its mol2")
+        atom.charge = newCharges[key]
+
+
+def patchLJ(parm: AmberParm, oldParams: dict, newParams: dict):
+    """
+    Update Lennard-Jones parameters of atom types defined in the frcmod
+    files, using the Lorentz-Berthelot combining rules for every pair which
+    involves an updated type.
+
+    Args:
+        parm (AmberParm): The prmtop.
+        oldParams (dict): Parameters the prmtop was built from.
+        newParams (dict): New parameters, as returned by readFrcmods.
+
+    Raises:
+        RuntimeError: If the prmtop can't be patched consistently.
+    """
+    updates = {}
+    for atom in parm.atoms:
+        if atom.type not in newParams["NONB"]:
+            continue
+        i = atom.nb_idx - 1
+        rmin, eps = oldParams["NONB"][atom.type]
+        if not isClose(parm.LJ_radius[i], rmin) or not isClose(parm.LJ_depth[i], eps):
+            raise RuntimeError(f"LJ parameters of {atom.type} do not match its frcmod")
+        values = tuple(newParams["NONB"][atom.type])
+        if updates.setdefault(i, values) != values:
+            raise RuntimeError(f"LJ type of {atom.type} is shared with other types")
+    if len(updates) == 0:
+        return
+    for i, (rmin, eps) in updates.items():
+        parm.LJ_radius[i] = rmin
+        parm.LJ_depth[i] = eps
+    data = parm.parm_data
+    ntypes = parm.pointers["NTYPES"]
+    for i in range(ntypes):
+        for j in range(ntypes):
+            if i not in updates and j not in updates:
+                continue
+            index = data["NONBONDED_PARM_INDEX"][ntypes * i + j] - 1
+            if index < 0:
+                continue
+            rij = parm.LJ_radius[i] + parm.LJ_radius[j]
+            wdij = sqrt(parm.LJ_depth[i] * parm.LJ_depth[j])
+            data["LENNARD_JONES_ACOEF"][index] = wdij * rij**12
+            data["LENNARD_JONES_BCOEF"][index] = 2 * wdij * rij**6
+
+
+class PrmtopTemplate:
+    def __init__(self, leap: str = "setup.leap"):
+        """
+        Record a tleap build in the current directory, so that later builds
+        with the same topology can be made by patching its parameters
+        instead of running tleap.
+
+        Args:
+            leap (str, optional): Name of the leap script. Defaults to
+                "setup.leap".
+        """
+        self.folder = Path.cwd()
+        self.outputs = getLeapOutputs(leap)
+        self.frcmods, self.mol2s, _ = getLeapInputs(leap)
+        self.signature = getTopologySignature(leap)
+
+    def apply(self, leap: str = "setup.leap"):
+        """
+        Write the prmtop and inpcrd files of a leap script in the current
+        directory by patching the template's parameters with those in the
+        current frcmod and mol2 files.
+
+        Args:
+            leap (str, optional): Name of the leap script. Defaults to
+                "setup.leap".
+
+        Raises:
+            RuntimeError: If the topology has changed or the template can't
+                be patched consistently, in which case tleap must be run.
+        """
+        if getTopologySignature(leap) != self.signature:
+            raise RuntimeError("Topology differs from the template")
+        frcmods, mol2s, _ = getLeapInputs(leap)
+        oldParams = readFrcmods([self.folder / f for f in self.frcmods])
+        newParams = readFrcmods(frcmods)
+        _, _, oldCharges = readMol2s([self.folder / f for f in self.mol2s])
+        _, _, newCharges = readMol2s(mol2s)
+        parm = AmberParm(str(self.folder / self.outputs[0]))
+        patchBonded(parm, oldParams, newParams)
+        patchCharges(parm, oldCharges, newCharges)
+        patchLJ(parm, oldParams, newParams)
+        outputs = getLeapOutputs(leap)
+        parm.write_parm(outputs[0])
+        copyfile(self.folder / self.outputs[1], outputs[1])
+        with open("leap.out", "w") as f:
+            f.write(f"Patched parameters of {self.folder / self.outputs[0]}\n")
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from shutil import copyfile, rmtree
+
+import numpy as np
+
+
+class QMCache:
+    def __init__(
+        self,
+        cacheDir: str | Path,
+        settings: list,
+        maxSize: float,
+        doResp: bool = False,
+        decimals: int = 5,
+    ):
+        """
+        Initialize an on-disk cache of TeraChem results. Results are keyed by
+        a hash of the geometry (rounded to a fixed number of decimals) and
+        the TeraChem settings, which carry the method, basis, charge, spin
+        multiplicity and all other keywords. The cache can be shared between
+        cycles, restarts, and models.
+
+        Args:
+            cacheDir (str or Path): Directory holding the cache.
+            settings (list): TeraChem settings, as read by QMEngine.readInputFile.
+            maxSize (float): Maximum size of the cache in GB. Least recently
+                used results are evicted beyond this.
+            doResp (bool, optional): Whether results must include the ESP.
+                Defaults to False.
+            decimals (int, optional): Number of decimals (in Angstrom) the
+                geometry is rounded to before hashing. Defaults to 5.
+        """
+        self.cacheDir = Path(cacheDir).absolute()
+        self.cacheDir.mkdir(parents=True, exist_ok=True)
+        self.settings = sorted(" ".join(setting).lower() for setting in settings)
+        self.maxSize = int(maxSize * 1024**3)
+        self.doResp = doResp
+        self.decimals = decimals
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evicted = 0
+
+    def getKey(self, coords: np.ndarray, symbols: list) -> str:
+        """
+        Get the cache key of a calculation.
+
+        Args:
+            coords (np.ndarray): Flattened coordinates in Angstrom.
+            symbols (list): Atomic symbols.
+
+        Returns:
+            str: Hex digest identifying the calculation.
+        """
+        # Adding 0 turns -0.0 into 0.0 so both hash the same
+        geometry = np.round(np.asarray(coords, dtype=np.float64), self.decimals) + 0.0
+        h = hashlib.sha256()
+        h.update(json.dumps([list(map(str, symbols)), self.settings]).encode())
+        h.update(geometry.tobytes())
+        return h.hexdigest()
+
+    def getEntry(self, key: str) -> Path:
+        """
+        Get the directory of a cache entry.
+
+        Args:
+            key (str): Cache key.
+
+        Returns:
+            Path: Directory holding the results for key.
+        """
+        return self.cacheDir / key[:2] / key
+
+    def load(self, coords: np.ndarray, symbols: list, name: str) -> bool:
+        """
+        Copy a cached result into the current directory as tc_{name}.out
+        (and esp_{name}.xyz if RESP is being used).
+
+        Args:
+            coords (np.ndarray): Flattened coordinates in Angstrom.
+            symbols (list): Atomic symbols.
+            name (str): Job name.
+
+        Returns:
+            bool: True if the result was in the cache, False otherwise.
+        """
+        entry = self.getEntry(self.getKey(coords, symbols))
+        files = {"tc.out": f"tc_{name}.out"}
+        if self.doResp:
+            files["esp.xyz"] = f"esp_{name}.xyz"
+        try:
+            for src, dest in files.items():
+                copyfile(entry / src, dest)
+            # Mark the entry as recently used
+            os.utime(entry)
+        except OSError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, coords: np.ndarray, symbols: list, name: str):
+        """
+        Store the result of a successful calculation in the current directory.
+
+        Args:
+            coords (np.ndarray): Flattened coordinates in Angstrom.
+            symbols (list): Atomic symbols.
+            name (str): Job name.
+        """
+        entry = self.getEntry(self.getKey(coords, symbols))
+        if entry.is_dir():
+            return
+        files = {f"tc_{name}.out": "tc.out"}
+        if self.doResp:
+            files[f"esp_{name}.xyz"] = "esp.xyz"
+        # Write into a temporary directory first so that other processes
+        # sharing the cache never see a partial entry
+        tmp = entry.parent / f".{entry.name}.{os.getpid()}"
+        try:
+            tmp.mkdir(parents=True, exist_ok=True)
+            for src, dest in files.items():
+                copyfile(src, tmp / dest)
+            os.rename(tmp, entry)
+            self.stored += 1
+        except OSError:
+            pass
+        if tmp.is_dir():
+            rmtree(tmp, ignore_errors=True)
+
+    def getSize(self, entry: Path) -> int:
+        """
+        Get the size of a cache entry on disk.
+
+        Args:
+            entry (Path): Cache entry directory.
+
+        Returns:
+            int: Size in bytes.
+        """
+        size = 0
+        for f in entry.iterdir():
+            size += f.stat().st_size
+        return size
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits within its
+        maximum size.
+        """
+        entries = []
+        total = 0
+        for bucket in self.cacheDir.iterdir():
+            if not bucket.is_dir():
+                continue
+            for entry in bucket.iterdir():
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    size = self.getSize(entry)
+                    entries.append((entry.stat().st_mtime, size, entry))
+                except OSError:
+                    continue
+                total += size
+        if total <= self.maxSize:
+            return
+        for _, size, entry in sorted(entries):
+            rmtree(entry, ignore_errors=True)
+            self.evicted += 1
+            total -= size
+            if total <= self.maxSize:
+                break
+
+    def report(self) -> str:
+        """
+        Summarize the cache statistics.
+
+        Returns:
+            str: Hits, misses and hit rate, new entries, and evictions.
+        """
+        lookups = self.hits + self.misses
+        rate = 100 * self.hits / lookups if lookups > 0 else 0
+        return (
+            f"QM cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate), "
+            f"{self.stored} stored, {self.evicted} evicted"
+        )
@@ -1,14 +1,27 @@
+import asyncio
+import atexit
+import fcntl
 import os
+import queue
+import shlex
+import socket
 import subprocess
+import tempfile
+from multiprocessing import Pool, current_process
+from multiprocessing.pool import ThreadPool
 from pathlib import Path
 from shutil import copyfile, rmtree
-from time import sleep
+from time import perf_counter, sleep
 
-from chemcloud import compute
+import numpy as np
+from chemcloud import CCClient
 from qcio import ProgramInput, Structure
+from qcio.constants import ANGSTROM_TO_BOHR
 from qcparse import parse
 
 from . import utils
+from .qmcache import QMCache
+from .resp_prior import readCharges
 
 
 class QMEngine:
@@ -27,6 +40,13 @@ class QMEngine:
         self.backupInputSettings = self.readInputFile(
             inp.sampledir / inp.tctemplate_backup
         )
+        self.qmWorkers = inp.qmworkers
+        if inp.qmcache is None:
+            self.cache = None
+        else:
+            self.cache = QMCache(
+                inp.qmcache, self.inputSettings, inp.qmcachesize, self.doResp
+            )
 
     def readInputFile(self, inputFile: str):
         """
@@ -100,94 +120,130 @@ class QMEngine:
             espXYZs: List of ESP XYZ coordinates.
             esps: List of ESP values.
         """
+        lines = []
+        for i in range(len(energies)):
+            lines.append(f"JOB {i+1}\n")
+            lines.append(f"COORDS {utils.formatFloats(coords[i], 5)}\n")
+            lines.append(f"ENERGY {str(round(float(energies[i]),7))}\n")
+            lines.append(f"FORCES {utils.formatFloats(grads[i], 8)}\n")
+            if espXYZs is not None:
+                lines.append(f"ESPXYZ {utils.formatFloats(espXYZs[i], 6)}\n")
+                lines.append(f"ESPVAL {utils.formatFloats(esps[i], 6)}\n\n")
+            else:
+                lines.append("\n")
         with open("qdata.txt", "w") as f:
-            for i in range(len(energies)):
-                f.write(f"JOB {i+1}\n")
-                coordLine = "COORDS "
-                for coord in coords[i]:
-                    coordLine = coordLine + str(round(float(coord), 5)) + " "
-                gradLine = "FORCES "
-                for grad in grads[i]:
-                    gradLine = gradLine + str(round(float(grad), 8)) + " "
-                f.write(coordLine + "\n")
-                f.write(f"ENERGY {str(round(float(energies[i]),7))}\n")
-                f.write(gradLine + "\n")
-                if espXYZs is not None:
-                    espXYZLine = "ESPXYZ "
-                    for xyz in espXYZs[i]:
-                        espXYZLine = espXYZLine + str(round(float(xyz), 6)) + " "
-                    f.write(espXYZLine + "\n")
-                    espLine = "ESPVAL "
-                    for val in esps[i]:
-                        espLine = espLine + str(round(float(val), 6)) + " "
-                    f.write(espLine + "\n\n")
-                else:
-                    f.write("\n")
-
-        with open("all.mdcrd", "w") as f:
-            f.write("Converted from xyz by QMEngine\n")
-            for i in range(len(energies)):
-                tokenCounter = 1
-                for coord in coords[i]:
-                    f.write("%8.3f" % float(coord))
-                    if tokenCounter == 10:
-                        f.write("\n")
-                        tokenCounter = 1
-                    else:
-                        tokenCounter += 1
-                if tokenCounter != 1:
-                    f.write("\n")
+            f.write("".join(lines))
+
+        utils.writeMdcrd(coords, "all.mdcrd", "Converted from xyz by QMEngine")
+
+    def mapWorkers(self, func, tasks: list) -> list:
+        """
+        Apply a function to each task, in a pool of self.qmWorkers processes
+        if more than one is requested.
+
+        Args:
+            func: Module-level function taking one task.
+            tasks (list): Arguments for each call.
+
+        Returns:
+            list: Results of each call, in the order of the tasks.
+        """
+        nworkers = max(min(self.qmWorkers, len(tasks)), 1)
+        # Pool workers (e.g. active learning models) can't have children
+        if nworkers == 1 or current_process().daemon:
+            return [func(task) for task in tasks]
+        with Pool(nworkers) as p:
+            return p.map(func, tasks, chunksize=max(len(tasks) // (4 * nworkers), 1))
 
     def readQMRefData(self):
         """
-        Read QM reference data from output files.
+        Read QM reference data from output files. Outputs, geometries and ESP
+        files are read concurrently by up to self.qmWorkers processes. If
+        doing RESP, the ESP and RESP charges read from the outputs are written
+        to the charge store, so they don't need to be parsed again.
 
         Returns:
             tuple: Energies, gradients, coordinates, ESP XYZs, and ESP values.
         """
-        coords = []
-        energies = []
-        grads = []
+        xyzs = utils.getXYZs()
+        if utils.getGeometryStorePath().is_file():
+            geometries, symbols = utils.readGeometries()
+            tasks = [(utils.getName(f), None, self.doResp) for f in xyzs]
+        else:
+            # Each worker reads its own XYZ file
+            geometries = {}
+            symbols = np.asarray([], dtype=str)
+            if len(xyzs) > 0 and self.cache is not None:
+                symbols = utils.readXYZ(xyzs[0], readSymbols=True)[1]
+            tasks = [(utils.getName(f), f, self.doResp) for f in xyzs]
+        results = self.mapWorkers(readQMResult, tasks)
+
+        n = len(results)
+        energies = np.empty(n, dtype=np.float64)
+        grads = np.empty((n, 0), dtype=np.float64)
+        coords = np.empty((n, 0), dtype=np.float32)
         if self.doResp:
             espXYZs = []
             esps = []
+            espCharges = []
+            respCharges = []
         else:
             espXYZs = None
             esps = None
-        for f in utils.getXYZs():
-            coord = utils.readXYZ(f)
-            name = utils.getName(f)
-            try:
-                result = parse(f"tc_{name}.out", "terachem")
-                assert result.energy
-                assert result.gradient.any()
-            except Exception as e:
-                print(e)
-                raise RuntimeError(
-                    f"Terachem job tc_{name}.out in {os.getcwd()} did not succeed!"
-                )
-            energies.append(result.energy)
-            grads.append(result.gradient.flatten())
-            coords.append(coord)
+        for i, (task, result) in enumerate(zip(tasks, results)):
+            energy, grad, coord, espXYZ, esp, charges = result
+            if coord is None:
+                coord = geometries[task[0]]
+            if i == 0:
+                grads = np.empty((n, grad.shape[0]), dtype=np.float64)
+                coords = np.empty((n, coord.shape[0]), dtype=coord.dtype)
+            energies[i] = energy
+            grads[i] = grad
+            coords[i] = coord
             if self.doResp:
-                espXYZ, esp = utils.readEsp(f"esp_{name}.xyz")
                 espXYZs.append(espXYZ)
                 esps.append(esp)
+                if charges is not None:
+                    espCharges.append(charges[0])
+                    respCharges.append(charges[1])
+            if self.cache is not None:
+                self.cache.store(coord, symbols, task[0])
+        if self.cache is not None:
+            self.cache.evict()
+            print(self.cache.report())
+        if self.doResp:
+            if n > 0 and len(respCharges) == n:
+                utils.writeCharges(espCharges, respCharges)
+            elif utils.getChargeStorePath().is_file():
+                os.remove(utils.getChargeStorePath())
         return energies, grads, coords, espXYZs, esps
 
+    def loadCachedResults(self, xyzs: list) -> list:
+        """
+        Copy results for any geometries which are already in the QM cache
+        into the current directory.
+
+        Args:
+            xyzs (list): List of XYZ file paths.
+
+        Returns:
+            list: XYZ file paths of the geometries which still need to be run.
+        """
+        if self.cache is None or len(xyzs) == 0:
+            return xyzs
+        geometries, symbols = utils.readGeometries()
+        misses = []
+        for xyz in xyzs:
+            name = utils.getName(xyz)
+            if not self.cache.load(geometries[name], symbols, name):
+                misses.append(xyz)
+        return misses
+
     def restart(self):
-        xyzs = []
-        for f in utils.getXYZs():
-            name = utils.getName(f)
-            out = f"tc_{name}.out"
-            try:
-                result = parse(out, "terachem")
-                assert result.energy
-                assert result.gradient.any()
-            except Exception:
-                #print(f)
-                #print(e)
-                xyzs.append(f)
+        allXyzs = utils.getXYZs()
+        outs = [f"tc_{utils.getName(f)}.out" for f in allXyzs]
+        succeeded = self.mapWorkers(checkTCResult, outs)
+        xyzs = [f for f, success in zip(allXyzs, succeeded) if not success]
         self.getQMRefData(xyzs)
 
     # This is the function which must be implemented by inherited classes
@@ -208,6 +264,8 @@ class SlurmEngine(QMEngine):
         """
         self.readSbatchFile(inp.sampledir / inp.sbatchtemplate)
         self.inp = inp
+        self.useArray = inp.slurmarray
+        self.retries = inp.retries
         super().__init__(inp)
 
     def readSbatchFile(self, sbatchFile: str):
@@ -220,19 +278,24 @@ class SlurmEngine(QMEngine):
         with open(sbatchFile, "r") as f:
             self.sbatchLines = f.readlines()
 
-    def replaceVars(self, line, index):
+    def replaceVars(self, line, index, useBackup=False):
         """
         Replace variables in a Slurm batch file line.
 
         Args:
             line (str): Line from the Slurm batch file.
             index (str): Job index.
+            useBackup (bool, optional): Whether to run the backup TeraChem
+                input file in place of the primary one. Defaults to False.
 
         Returns:
             str: Updated line with variables replaced.
         """
-        tcin = f"tc_{index}.in"
         tcbackup = f"tc_backup_{index}.in"
+        if useBackup:
+            tcin = tcbackup
+        else:
+            tcin = f"tc_{index}.in"
         line = line.replace("JOBID", index)
         line = line.replace("TCTEMPLATEBACKUP", tcbackup)
         line = line.replace("TCTEMPLATE", tcin)
@@ -251,6 +314,44 @@ class SlurmEngine(QMEngine):
             for line in self.sbatchLines:
                 f.write(self.replaceVars(line, index))
 
+    def writeArrayFile(self, fileName: str, namesFile: str, useBackup: bool = False):
+        """
+        Write a Slurm batch file for a job array. Task i runs the geometry
+        named on line i of namesFile.
+
+        Args:
+            fileName (str): Name of the output Slurm batch file.
+            namesFile (str): File with one geometry name per line.
+            useBackup (bool, optional): Whether to run the backup TeraChem
+                input files. Defaults to False.
+        """
+        header = True
+        with open(fileName, "w") as f:
+            for line in self.sbatchLines:
+                # sbatch stops reading options at the first command
+                if header and not line.startswith("#") and line.strip() != "":
+                    f.write(f'NAME=$(sed -n "${{SLURM_ARRAY_TASK_ID}}p" {namesFile})\n')
+                    header = False
+                if line.startswith("#SBATCH"):
+                    # Options are shared by every task in the array
+                    f.write(line.replace("JOBID", "array"))
+                else:
+                    f.write(self.replaceVars(line, "${NAME}", useBackup))
+
+    def getJobID(self, output) -> str:
+        """
+        Get the job ID from the output of sbatch.
+
+        Args:
+            output (bytes or str): Output of sbatch ("Submitted batch job ID").
+
+        Returns:
+            str: Slurm job ID.
+        """
+        if isinstance(output, bytes):
+            output = output.decode()
+        return output.split()[3]
+
     def slurmCommand(self, command: list):
         """
         Execute a Slurm command with retries.
@@ -278,25 +379,169 @@ class SlurmEngine(QMEngine):
             raise RuntimeError(f"Slurm command {str(command)} failed")
         return output
 
-    def waitForJobs(self, jobIDs):
+    def getQueuedJobs(self, jobIDs: list) -> set | None:
+        """
+        Get which of a set of Slurm jobs are still queued or running. Only
+        these jobs are queried, rather than the whole queue.
+
+        Args:
+            jobIDs (list): List of Slurm job IDs.
+
+        Returns:
+            set: Job IDs still in the queue, or None if squeue failed.
         """
-        Wait for Slurm jobs to complete.
+        command = ["squeue", "--noheader", "--format=%F", f"--jobs={','.join(jobIDs)}"]
+        try:
+            result = subprocess.run(command, capture_output=True)
+        except OSError:
+            return None
+        if result.returncode != 0:
+            # squeue rejects IDs of jobs which have already left the queue
+            if b"Invalid job id" not in result.stderr:
+                return None
+            if len(jobIDs) == 1:
+                return set()
+            queued = set()
+            for jobID in jobIDs:
+                status = self.getQueuedJobs([jobID])
+                if status is None:
+                    return None
+                queued |= status
+            return queued
+        return set(result.stdout.decode().split()) & set(jobIDs)
+
+    def waitForJobs(self, jobIDs, minWait: float = 10, maxWait: float = 120):
+        """
+        Wait for Slurm jobs to complete, polling with exponential backoff.
 
         Args:
             jobIDs (list): List of Slurm job IDs to wait for.
+            minWait (float, optional): Initial time between polls in seconds.
+                Defaults to 10.
+            maxWait (float, optional): Maximum time between polls in seconds.
+                Defaults to 120.
+
+        Raises:
+            RuntimeError: If squeue fails repeatedly.
         """
+        jobIDs = [
+            jobID.decode() if isinstance(jobID, bytes) else str(jobID)
+            for jobID in jobIDs
+        ]
+        wait = minWait
+        failures = 0
         while len(jobIDs) > 0:
-            runningIDs = []
-            sleep(10)
-            # status = self.slurmCommand(["squeue", "-o", "%.12i", "-u", self.user])
-            status = self.slurmCommand(["squeue", "-o", "%.12i"])
-            for runningID in (
-                status.replace(b" ", b"").replace(b'"', b"").split(b"\n")[1:]
-            ):
-                for submitID in jobIDs:
-                    if runningID == submitID:
-                        runningIDs.append(runningID)
-            jobIDs = runningIDs
+            sleep(wait)
+            wait = min(2 * wait, maxWait)
+            queued = self.getQueuedJobs(jobIDs)
+            if queued is None:
+                failures += 1
+                if failures == 10:
+                    raise RuntimeError(f"squeue failed for jobs {jobIDs}")
+                continue
+            failures = 0
+            jobIDs = [jobID for jobID in jobIDs if jobID in queued]
+
+    def getArrayStates(self, jobID: str) -> dict:
+        """
+        Get the final state of each task in a Slurm job array from sacct.
+
+        Args:
+            jobID (str): Slurm job ID of the array.
+
+        Returns:
+            dict: Maps task IDs (str) to Slurm states, e.g. "COMPLETED".
+                Empty if sacct is unavailable.
+        """
+        command = [
+            "sacct",
+            "--noheader",
+            "--parsable2",
+            "--allocations",
+            f"--jobs={jobID}",
+            "--format=JobID,State",
+        ]
+        try:
+            output = self.slurmCommand(command)
+        except RuntimeError:
+            return {}
+        states = {}
+        for line in output.decode().splitlines():
+            split = line.split("|")
+            if len(split) < 2 or "_" not in split[0]:
+                continue
+            # States can carry extra text, e.g. "CANCELLED by 1234"
+            states[split[0].split("_")[1]] = split[1].split()[0]
+        return states
+
+    def checkOutput(self, name: str) -> bool:
+        """
+        Check whether a TeraChem calculation finished.
+
+        Args:
+            name (str): Job name.
+
+        Returns:
+            bool: True if tc_{name}.out exists and reports the job finished.
+        """
+        out = Path(f"tc_{name}.out")
+        if not out.is_file():
+            return False
+        with open(out, "r", errors="replace") as f:
+            return "Job finished" in f.read()
+
+    def submitArray(self, names: list, useBackup: bool = False) -> str:
+        """
+        Submit TeraChem calculations as a Slurm job array.
+
+        Args:
+            names (list): Names of the geometries to run.
+            useBackup (bool, optional): Whether to run the backup TeraChem
+                input files. Defaults to False.
+
+        Returns:
+            str: Slurm job ID of the array.
+        """
+        if useBackup:
+            tag = "backup"
+        else:
+            tag = "array"
+        namesFile = f"jobs_{tag}.txt"
+        sbatchFile = f"sbatch_{tag}.sh"
+        with open(namesFile, "w") as f:
+            f.write("\n".join(names) + "\n")
+        self.writeArrayFile(sbatchFile, namesFile, useBackup)
+        job = self.slurmCommand(["sbatch", f"--array=1-{len(names)}", sbatchFile])
+        return self.getJobID(job)
+
+    def runArray(self, names: list):
+        """
+        Run TeraChem calculations as a Slurm job array and wait for them.
+        Tasks which fail are resubmitted as a new array which runs the
+        backup TeraChem input files.
+
+        Args:
+            names (list): Names of the geometries to run.
+        """
+        useBackup = False
+        attempt = 0
+        while len(names) > 0:
+            jobID = self.submitArray(names, useBackup)
+            self.waitForJobs([jobID])
+            states = self.getArrayStates(jobID)
+            failed = []
+            for i, name in enumerate(names):
+                # Rely on the output alone if sacct has no record of the task
+                state = states.get(str(i + 1), "COMPLETED")
+                if state != "COMPLETED" or not self.checkOutput(name):
+                    failed.append(name)
+            names = failed
+            if attempt == self.retries:
+                break
+            attempt += 1
+            useBackup = True
+        if len(names) > 0:
+            print(f"Slurm array tasks for {names} in {os.getcwd()} failed")
 
     def getQMRefData(self, xyzs: list):
         """
@@ -309,16 +554,23 @@ class SlurmEngine(QMEngine):
             tuple: Energies, gradients, coordinates, ESP XYZs, and ESP values.
         """
         jobIDs = []
+        xyzs = self.loadCachedResults(xyzs)
+        # TeraChem reads coordinates from disk
+        xyzs = utils.writeXYZs(xyzs)
         for xyz in xyzs:
             name = xyz.name.split(".")[0]
             super().writeInputFile(self.inputSettings, xyz, f"tc_{name}.in")
             super().writeInputFile(
                 self.backupInputSettings, xyz, f"tc_backup_{name}.in"
             )
-            self.writeSbatchFile(name, f"sbatch_{name}.sh")
-            job = self.slurmCommand(["sbatch", f"sbatch_{name}.sh"])
-            jobIDs.append(job.split()[3])
-        self.waitForJobs(jobIDs)
+            if not self.useArray:
+                self.writeSbatchFile(name, f"sbatch_{name}.sh")
+                job = self.slurmCommand(["sbatch", f"sbatch_{name}.sh"])
+                jobIDs.append(self.getJobID(job))
+        if self.useArray:
+            self.runArray([xyz.name.split(".")[0] for xyz in xyzs])
+        else:
+            self.waitForJobs(jobIDs)
 
         for xyz in xyzs:
             name = xyz.name.split(".")[0]
@@ -355,6 +607,9 @@ class DebugEngine(QMEngine):
         energies = []
         grads = []
         coords = []
+        xyzs = self.loadCachedResults(xyzs)
+        # TeraChem reads coordinates from disk
+        xyzs = utils.writeXYZs(xyzs)
         for xyz in xyzs:
             name = xyz.name.split(".")[0]
             super().writeInputFile(self.inputSettings, xyz, f"tc_{name}.in")
@@ -381,9 +636,31 @@ class ChemcloudEngine(QMEngine):
             inp: Input object containing configuration parameters.
         """
         self.batchSize = inp.batchsize
+        self.batchesInFlight = inp.batchesinflight
+        self.retries = inp.retries
+        self.client = None
         super().__init__(inp)
         self.setKeywords(self.doResp)
 
+    def __getstate__(self) -> dict:
+        # The HTTP client is bound to an event loop, so copies in worker
+        # processes make their own
+        state = self.__dict__.copy()
+        state["client"] = None
+        return state
+
+    def getClient(self) -> CCClient:
+        """
+        Get the ChemCloud client this engine submits calculations with,
+        creating it the first time.
+
+        Returns:
+            CCClient: The client.
+        """
+        if self.client is None:
+            self.client = CCClient()
+        return self.client
+
     def setKeywords(self, doResp):
         """
         Set keywords for ChemCloud calculations.
@@ -451,6 +728,28 @@ class ChemcloudEngine(QMEngine):
         mol = Structure(**kwargs)
         return mol
 
+    def loadStructure(self, coords: np.ndarray, symbols: list):
+        """
+        Create a molecular structure from coordinates in memory.
+
+        Args:
+            coords (np.ndarray): Flattened coordinates in Angstrom.
+            symbols (list): Atomic symbols.
+
+        Returns:
+            Structure: Molecular structure.
+        """
+        kwargs = {}
+        if "charge" in self.specialKeywords.keys():
+            kwargs["charge"] = self.specialKeywords["charge"]
+        if "spinmult" in self.specialKeywords.keys():
+            kwargs["multiplicity"] = self.specialKeywords["spinmult"]
+        geometry = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        mol = Structure(
+            symbols=list(symbols), geometry=geometry * ANGSTROM_TO_BOHR, **kwargs
+        )
+        return mol
+
     def checkSpecialKeywords(self):
         """
         Check and validate special keywords for ChemCloud calculations.
@@ -502,9 +801,17 @@ class ChemcloudEngine(QMEngine):
             keywords = self.backupKeywords
         else:
             keywords = self.keywords
+        # Build structures straight from the geometry store if there is one
+        if utils.getGeometryStorePath().is_file():
+            geometries, symbols = utils.readGeometries()
+        else:
+            geometries = None
         for xyz in sorted(xyzs):
             jobID = utils.getName(xyz)
-            mol = self.loadStructureFromXYZ(xyz)
+            if geometries is None:
+                mol = self.loadStructureFromXYZ(xyz)
+            else:
+                mol = self.loadStructure(geometries[jobID], symbols)
             programInput = ProgramInput(
                 structure=mol,
                 model=mod,
@@ -556,44 +863,134 @@ class ChemcloudEngine(QMEngine):
                 retryXyzs.append(f"{jobID}.xyz")
         return retryXyzs
 
-    def runJobs(self, xyzs: list, useBackup: bool = False) -> list:
+    def getBatches(self, programInputs: list) -> list:
         """
-        Run QM jobs for a list of XYZ files.
+        Split program inputs into batches for submission to ChemCloud.
 
         Args:
-            xyzs (list): List of XYZ file paths.
-            useBackup (bool, optional): Whether to use backup settings. Defaults to False.
+            programInputs (list): List of program inputs for QM calculations.
 
         Returns:
-            list: List of XYZ file names for failed jobs.
+            list: List of lists of at most self.batchSize program inputs.
+        """
+        return [
+            programInputs[i : i + self.batchSize]
+            for i in range(0, len(programInputs), self.batchSize)
+        ]
+
+    async def runBatch(
+        self, programInputs: list, attempt: int, semaphore: asyncio.Semaphore
+    ) -> tuple[list, list, int]:
+        """
+        Run one batch of QM jobs on ChemCloud.
+
+        Args:
+            programInputs (list): List of program inputs in the batch.
+            attempt (int): Number of times these jobs have been tried before.
+            semaphore (asyncio.Semaphore): Limits the number of batches in flight.
+
+        Returns:
+            tuple: Program inputs, outputs, and attempt number of the batch.
 
         Raises:
-            RuntimeError: If ChemCloud returns an unexpected number of outputs or if batch submission fails.
+            RuntimeError: If ChemCloud returns an unexpected number of outputs.
         """
-        programInputs = self.createProgramInputs(xyzs, useBackup=useBackup)
-        # If there are no jobs to run after restart
-        if len(programInputs) == 0:
-            return []
-
-        # run chemcloud jobs
-        outputs = compute("terachem", programInputs, collect_files=self.doResp)
+        async with semaphore:
+            outputs = await self.getClient().compute_async(
+                "terachem", programInputs, collect_files=self.doResp
+            )
         if not isinstance(outputs, list):
             outputs = [outputs]
-
-        # check for errors
         if len(outputs) != len(programInputs):
             dumpFailedJobs(programInputs, outputs)
             raise RuntimeError(
                 "ChemCloud did not return the same number of outputs as inputs"
             )
-        retryXyzs = self.getFailedJobs(outputs)
+        return programInputs, outputs, attempt
+
+    async def runJobsAsync(
+        self, xyzs: list, useBackup: bool = False, retries: int = 0
+    ) -> list:
+        """
+        Run QM jobs for a list of XYZ files in batches, keeping up to
+        self.batchesInFlight batches running on ChemCloud at once. Results are
+        written as each batch finishes, and the failed jobs of a batch are
+        resubmitted right away with the backup settings.
+
+        Args:
+            xyzs (list): List of XYZ file paths.
+            useBackup (bool, optional): Whether to use backup settings for the
+                first attempt. Defaults to False.
+            retries (int, optional): Number of times each failed job is
+                retried with the backup settings. Defaults to 0.
+
+        Returns:
+            list: List of XYZ file names for jobs which failed on every attempt.
+
+        Raises:
+            RuntimeError: If ChemCloud returns an unexpected number of outputs.
+        """
+        semaphore = asyncio.Semaphore(self.batchesInFlight)
+        pending = set()
+
+        def submit(xyzs, attempt):
+            programInputs = self.createProgramInputs(
+                xyzs, useBackup=useBackup or attempt > 0
+            )
+            for batch in self.getBatches(programInputs):
+                pending.add(
+                    asyncio.create_task(self.runBatch(batch, attempt, semaphore))
+                )
+
+        submit(xyzs, 0)
+        failedXyzs = []
+        try:
+            while len(pending) > 0:
+                done, _ = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    pending.remove(task)
+                    programInputs, outputs, attempt = task.result()
+                    retryXyzs = self.getFailedJobs(outputs)
+                    if len(retryXyzs) == 0:
+                        continue
+                    if attempt < retries:
+                        submit(retryXyzs, attempt + 1)
+                    else:
+                        if useBackup or attempt > 0:
+                            dumpFailedJobs(programInputs, outputs)
+                        failedXyzs += retryXyzs
+        finally:
+            for task in pending:
+                task.cancel()
+        return sorted(failedXyzs, key=lambda xyz: int(utils.getName(xyz)))
+
+    def runJobs(self, xyzs: list, useBackup: bool = False) -> list:
+        """
+        Run QM jobs for a list of XYZ files, without retrying failed jobs.
+
+        Args:
+            xyzs (list): List of XYZ file paths.
+            useBackup (bool, optional): Whether to use backup settings. Defaults to False.
+
+        Returns:
+            list: List of XYZ file names for failed jobs.
+
+        Raises:
+            RuntimeError: If ChemCloud returns an unexpected number of outputs or
+                if jobs fail with the backup settings.
+        """
+        # If there are no jobs to run after restart
+        if len(xyzs) == 0:
+            return []
+        # CCClient.run binds the client's HTTP client to the event loop it starts
+        client = self.getClient()
+        retryXyzs = client.run(self.runJobsAsync(xyzs, useBackup=useBackup))
         if len(retryXyzs) > 0 and useBackup:
-            dumpFailedJobs(programInputs, outputs)
             raise RuntimeError(
-                f"Job ids {sorted([xyz.split('.')[0] for xyz in retryXyzs])} in {os.getcwd()} failed!"
+                f"Job ids {[utils.getName(xyz) for xyz in retryXyzs]} in {os.getcwd()} failed!"
             )
-
-        # return failed jobs
         return retryXyzs
 
     def getQMRefData(self, xyzs: list):
@@ -607,12 +1004,16 @@ class ChemcloudEngine(QMEngine):
             RuntimeError: If QM calculations fail after multiple retries.
         """
         cwd = os.getcwd()
-        # Run calculations with default settings
-        retryXyzs = self.runJobs(xyzs)
-
-        # Re-run failed calculations with backup settings
-        if len(retryXyzs) > 0:
-            retryXyzs = self.runJobs(retryXyzs, useBackup=True)
+        xyzs = self.loadCachedResults(xyzs)
+        # Run calculations with default settings, retrying failed
+        # calculations with backup settings
+        if len(xyzs) > 0:
+            client = self.getClient()
+            failedXyzs = client.run(self.runJobsAsync(xyzs, retries=self.retries))
+            if len(failedXyzs) > 0:
+                raise RuntimeError(
+                    f"Job ids {[utils.getName(xyz) for xyz in failedXyzs]} in {os.getcwd()} failed!"
+                )
 
         # collect results and write qdata.txt
         energies, grads, coords, espXYZs, esps = super().readQMRefData()
@@ -620,6 +1021,338 @@ class ChemcloudEngine(QMEngine):
         os.chdir(cwd)
 
 
+class TCServer:
+    def __init__(self, command: str, device: str, port: int, host: str = "localhost"):
+        """
+        Initialize a persistent TeraChem server on one device. The server is
+        started with start(), and keeps running between calculations.
+
+        Args:
+            command (str): Command which starts the server, with {port} and
+                {device} placeholders.
+            device (str): Device (GPU) ID, which is also set as
+                CUDA_VISIBLE_DEVICES for the server.
+            port (int): Port the server listens on.
+            host (str, optional): Host the server runs on. Defaults to
+                "localhost".
+        """
+        self.command = command
+        self.device = str(device)
+        self.port = port
+        self.host = host
+        self.log = Path(f"tcserver_{port}.log").absolute()
+        # A server runs one client's calculations at a time, so every process
+        # using it (e.g. pipeline workers) leases it through this lock file
+        self.lockPath = Path(tempfile.gettempdir()) / f"tcserver_{host}_{port}.lock"
+        self.lockFile = None
+        self.process = None
+        self.client = None
+
+    def __getstate__(self) -> dict:
+        # Copies in worker processes connect to the server started by the parent
+        state = self.__dict__.copy()
+        state["process"] = None
+        state["client"] = None
+        state["lockFile"] = None
+        return state
+
+    def lease(self) -> bool:
+        """
+        Try to lease the server for this object's calculations, without
+        waiting if another process (or TCServer object) holds it.
+
+        Returns:
+            bool: True if the server was leased.
+        """
+        lockFile = open(self.lockPath, "a")
+        try:
+            fcntl.flock(lockFile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lockFile.close()
+            return False
+        self.lockFile = lockFile
+        return True
+
+    def release(self):
+        """
+        Close the connection to the server, so other clients can use it, and
+        end the lease.
+        """
+        self.disconnect()
+        if self.lockFile is not None:
+            fcntl.flock(self.lockFile, fcntl.LOCK_UN)
+            self.lockFile.close()
+            self.lockFile = None
+
+    def isListening(self) -> bool:
+        """
+        Check if a server is accepting connections on this port.
+
+        Returns:
+            bool: True if a connection could be made.
+        """
+        try:
+            with socket.create_connection((self.host, self.port), timeout=1):
+                return True
+        except OSError:
+            return False
+
+    def start(self, timeout: float = 600):
+        """
+        Start the server if one isn't already listening on this port, and
+        wait until it accepts connections.
+
+        Args:
+            timeout (float, optional): Time in seconds to wait for the server
+                to start. Defaults to 600.
+
+        Raises:
+            RuntimeError: If the server exits or doesn't start in time.
+        """
+        if self.isListening():
+            return
+        env = os.environ.copy()
+        env["CUDA_VISIBLE_DEVICES"] = self.device
+        command = self.command.format(port=self.port, device=self.device)
+        with open(self.log, "a") as f:
+            self.process = subprocess.Popen(
+                shlex.split(command), stdout=f, stderr=subprocess.STDOUT, env=env
+            )
+        start = perf_counter()
+        while not self.isListening():
+            if self.process.poll() is not None:
+                raise RuntimeError(
+                    f"TeraChem server on device {self.device} exited with code "
+                    f"{self.process.returncode}; see {self.log}"
+                )
+            if perf_counter() - start > timeout:
+                self.stop()
+                raise RuntimeError(
+                    f"TeraChem server on device {self.device} did not start within "
+                    f"{timeout} s; see {self.log}"
+                )
+            sleep(0.1)
+
+    def compute(self, programInput: ProgramInput):
+        """
+        Run a calculation on the server. If the connection to the server is
+        lost, the server is restarted and the calculation is tried again
+        once.
+
+        Args:
+            programInput (ProgramInput): Input for the calculation.
+
+        Returns:
+            ProgramOutput: Output of the calculation.
+
+        Raises:
+            OSError: If the server can't be reached after restarting it.
+        """
+        for attempt in range(2):
+            try:
+                if self.client is None:
+                    self.start()
+                    self.client = connectTCServer(self.host, self.port)
+                return self.client.compute(programInput)
+            except OSError:
+                self.disconnect()
+                if attempt > 0:
+                    raise
+
+    def disconnect(self):
+        """
+        Close the connection to the server, if there is one.
+        """
+        if self.client is not None:
+            try:
+                self.client.disconnect()
+            except OSError:
+                pass
+            self.client = None
+
+    def stop(self):
+        """
+        Stop the server, if it was started by this object.
+        """
+        self.release()
+        if self.process is not None:
+            if self.process.poll() is None:
+                self.process.terminate()
+                try:
+                    self.process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    self.process.kill()
+                    self.process.wait()
+            self.process = None
+
+
+class TCServerEngine(ChemcloudEngine):
+    def __init__(self, inp):
+        """
+        Initialize the TCServerEngine, which runs QM calculations locally
+        on persistent TeraChem servers, one per device. Servers are started
+        here and stopped when the program exits, so each one only pays the
+        TeraChem startup cost once. Copies of the engine in other processes
+        share the servers, leasing each one for a calculation at a time.
+
+        Args:
+            inp: Input object containing configuration parameters.
+        """
+        super().__init__(inp)
+        # Time in seconds between attempts to lease a server
+        self.leaseInterval = 0.05
+        devices = inp.tcdevices.replace(",", " ").split()
+        self.servers = [
+            TCServer(inp.tcservercommand, device, inp.tcport + i)
+            for i, device in enumerate(devices)
+        ]
+        atexit.register(self.stopServers)
+        self.startServers()
+
+    def startServers(self):
+        """
+        Start all TeraChem servers.
+        """
+        for server in self.servers:
+            server.start()
+
+    def stopServers(self):
+        """
+        Stop all TeraChem servers started by this engine.
+        """
+        for server in self.servers:
+            server.stop()
+
+    def leaseServer(self, idle: queue.Queue) -> TCServer:
+        """
+        Lease the next server which is idle in this process and not leased
+        by another process, waiting until there is one.
+
+        Args:
+            idle (queue.Queue): Queue of servers idle in this process.
+
+        Returns:
+            TCServer: The leased server.
+        """
+        while True:
+            server = idle.get()
+            if server.lease():
+                return server
+            idle.put(server)
+            sleep(self.leaseInterval)
+
+    def runServerJob(self, programInput: ProgramInput, idle: queue.Queue) -> tuple:
+        """
+        Run one calculation on the next idle server.
+
+        Args:
+            programInput (ProgramInput): Input for the calculation.
+            idle (queue.Queue): Queue of servers idle in this process.
+
+        Returns:
+            tuple: Program input, output (None if the calculation raised an
+                exception), and the exception (None if it didn't).
+
+        Raises:
+            OSError: If the server can't be reached.
+        """
+        server = self.leaseServer(idle)
+        try:
+            return programInput, server.compute(programInput), None
+        except OSError:
+            raise
+        except Exception as e:
+            return programInput, None, e
+        finally:
+            server.release()
+            idle.put(server)
+
+    def runServerJobs(self, xyzs: list, useBackup: bool = False) -> list:
+        """
+        Run QM jobs for a list of XYZ files on the TeraChem servers, and
+        write their results.
+
+        Args:
+            xyzs (list): List of XYZ file paths.
+            useBackup (bool, optional): Whether to use backup settings. Defaults to False.
+
+        Returns:
+            list: List of XYZ file names for failed jobs.
+        """
+        if len(xyzs) == 0:
+            return []
+        programInputs = self.createProgramInputs(xyzs, useBackup=useBackup)
+        idle = queue.Queue()
+        for server in self.servers:
+            idle.put(server)
+        failedXyzs = []
+        with ThreadPool(len(self.servers)) as p:
+            results = p.imap_unordered(
+                lambda programInput: self.runServerJob(programInput, idle),
+                programInputs,
+            )
+            for programInput, output, error in results:
+                jobID = programInput.extras["id"]
+                if output is None:
+                    with open(f"tc_{jobID}.out", "w") as f:
+                        f.write(f"{error}\n")
+                else:
+                    self.writeResult(output)
+                if output is None or not output.success:
+                    failedXyzs.append(f"{jobID}.xyz")
+        return sorted(failedXyzs, key=lambda xyz: int(utils.getName(xyz)))
+
+    def getQMRefData(self, xyzs: list):
+        """
+        Get QM reference data for a list of XYZ files. Failed calculations
+        are retried with the backup settings on the same servers.
+
+        Args:
+            xyzs (list): List of XYZ file paths.
+
+        Raises:
+            RuntimeError: If QM calculations fail after multiple retries.
+        """
+        xyzs = self.loadCachedResults(xyzs)
+        failedXyzs = self.runServerJobs(xyzs)
+        for i in range(self.retries):
+            if len(failedXyzs) == 0:
+                break
+            failedXyzs = self.runServerJobs(failedXyzs, useBackup=True)
+        if len(failedXyzs) > 0:
+            raise RuntimeError(
+                f"Job ids {[utils.getName(xyz) for xyz in failedXyzs]} in {os.getcwd()} failed!"
+            )
+
+        energies, grads, coords, espXYZs, esps = super().readQMRefData()
+        super().writeFBdata(energies, grads, coords, espXYZs, esps)
+
+
+def connectTCServer(host: str, port: int):
+    """
+    Connect to a TeraChem server with the TeraChem protocol buffer client.
+
+    Args:
+        host (str): Host the server runs on.
+        port (int): Port the server listens on.
+
+    Returns:
+        TCProtobufClient: Connected client.
+
+    Raises:
+        ImportError: If tcpb is not installed.
+    """
+    try:
+        from tcpb import TCProtobufClient
+    except ImportError as e:
+        raise ImportError(
+            "tcpb must be installed to run calculations on TeraChem servers"
+        ) from e
+    client = TCProtobufClient(host=host, port=port)
+    client.connect()
+    return client
+
+
 def dumpFailedJobs(programInputs: list, outputs: list):
     """
     Dump information about failed jobs for debugging.
@@ -636,3 +1369,90 @@ def dumpFailedJobs(programInputs: list, outputs: list):
         jobID = str(out.input_data.extras["id"])
         outName = jobID + "_output.yaml"
         out.save(outName)
+
+
+def readTCResult(out: str) -> tuple[float, np.ndarray]:
+    """
+    Read the energy and gradient of a TeraChem job. Finished jobs are read
+    with the fast parser, and anything else with qcparse.
+
+    Args:
+        out (str): Path to TeraChem output file.
+
+    Returns:
+        tuple: Energy and flattened gradient.
+
+    Raises:
+        RuntimeError: If the job did not succeed.
+    """
+    try:
+        result = utils.parseTCOutput(out)
+    except OSError:
+        result = None
+    if result is not None and result[0] and result[1].any():
+        return result
+    try:
+        result = parse(out, "terachem")
+        assert result.energy
+        assert result.gradient.any()
+    except Exception as e:
+        raise RuntimeError(
+            f"Terachem job {out} in {os.getcwd()} did not succeed!"
+        ) from e
+    return result.energy, np.asarray(result.gradient).flatten()
+
+
+def checkTCResult(out: str) -> bool:
+    """
+    Check whether a TeraChem job succeeded.
+
+    Args:
+        out (str): Path to TeraChem output file.
+
+    Returns:
+        bool: True if the energy and gradient can be read.
+    """
+    try:
+        readTCResult(out)
+    except RuntimeError:
+        return False
+    return True
+
+
+def readQMResult(task: tuple) -> tuple:
+    """
+    Read the results of the QM calculation of one geometry.
+
+    Args:
+        task (tuple): Geometry name, path to its XYZ file (None if the
+            geometry comes from the geometry store), and whether to read
+            the ESP.
+
+    Returns:
+        tuple: Energy, gradient, coordinates (None if no XYZ file was
+            given), ESP XYZ coordinates, ESP values and (ESP, RESP) charges
+            (None if not read, or no charges are in the output).
+
+    Raises:
+        RuntimeError: If the QM calculation did not succeed.
+    """
+    name, xyz, doResp = task
+    try:
+        energy, grad = readTCResult(f"tc_{name}.out")
+    except RuntimeError as e:
+        print(e.__cause__)
+        raise
+    coord = None
+    if xyz is not None:
+        coord = utils.readXYZ(xyz)
+    espXYZ = None
+    esp = None
+    charges = None
+    if doResp:
+        espXYZ, esp = utils.readEsp(f"esp_{name}.xyz")
+        with open(f"tc_{name}.out", "r") as f:
+            try:
+                charges = readCharges(f)
+            except RuntimeError:
+                pass
+    return energy, grad, coord, espXYZ, esp, charges
@@ -5,6 +5,7 @@ from typing import List, Tuple
 import numpy as np
 from scipy.stats import norm
 
+from . import utils
 from .inputs import Input
 
 # import matplotlib as mpl
@@ -26,12 +27,28 @@ class RespPriors:
         # getCharges will determine automatically where we are
         self.sampledir = inp.sampledir
         self.prmtop = prmtop
-        self.allEsp = []
-        self.allResp = []
+        # Charges of every frame read so far, in arrays which grow by
+        # doubling; allEsp and allResp are views of the filled rows
+        self.espStore = np.empty((0, 0))
+        self.respStore = np.empty((0, 0))
+        self.nframes = 0
+        self.readDirs = set()
         self.getRepeats(mol2)
+        # Running (count, mean, M2) of the charges of each repeat group
+        self.espStats = initializeStats(len(self.repeats))
+        self.respStats = initializeStats(len(self.repeats))
+        self.groupColumns = None
         self.mode = inp.resppriors
         self.getUnits()
 
+    @property
+    def allEsp(self) -> np.ndarray:
+        return self.espStore[: self.nframes]
+
+    @property
+    def allResp(self) -> np.ndarray:
+        return self.respStore[: self.nframes]
+
     def getUnits(self):
         """
         Get the number of units from the prmtop file.
@@ -82,41 +99,14 @@ class RespPriors:
         Raises:
             RuntimeError: If no charges are found in the lines.
         """
-        esp = []
-        resp = []
-        inEsp = False
-        inResp = False
-        almostInEsp = False
-        almostInResp = False
-        natoms = 0
-        for line in lines:
-            if "Total atoms:" in line:
-                natoms = int(line.split()[2])
-            if inEsp:
-                esp.append(float(line.split()[4]))
-                if len(esp) == natoms:
-                    inEsp = False
-            if inResp:
-                resp.append(float(line.split()[4]))
-                if len(resp) == natoms:
-                    inResp = False
-            if almostInEsp and "--------------------------------------" in line:
-                inEsp = True
-                almostInEsp = False
-            if almostInResp and "--------------------------------------" in line:
-                inResp = True
-                almostInResp = False
-            if "ESP unrestraint charges:" in line:
-                almostInEsp = True
-            if "ESP restraint charges:" in line:
-                almostInResp = True
-        if len(esp) == 0 or len(resp) == 0:
-            raise RuntimeError("No charges in lines")
-        return esp, resp
+        return readCharges(lines)
 
     def getCharges(self, i: int):
         """
-        Get charges from TeraChem output files for a given iteration.
+        Get charges from the training directory of a given iteration. The
+        charge store written when the QM results were read is used if there
+        is one; otherwise the charges are read from the TeraChem output
+        files. Directories which have already been read are skipped.
 
         Args:
             i (int): Iteration number.
@@ -134,69 +124,96 @@ class RespPriors:
             raise RuntimeError(
                 f"No training directory found in {os.path.join(self.sampledir, cycleDir)}"
             )
-        outs = []
-        for f in os.listdir(trainDir):
-            if f.startswith("tc") and f.endswith(".out"):
-                outs.append(f)
-
-        outs = sorted(outs)
-        for out in outs:
-            with open(trainDir / out, "r") as tcout:
-                lines = tcout.readlines()
-            esp, resp = self.readCharges(lines)
-            self.allEsp.append(esp)
-            self.allResp.append(resp)
-
-    def computeChargeDistributions(self):
+        if trainDir in self.readDirs:
+            return
+        if utils.getChargeStorePath(trainDir).is_file():
+            esp, resp = utils.readCharges(trainDir)
+        else:
+            outs = []
+            for f in os.listdir(trainDir):
+                if f.startswith("tc") and f.endswith(".out"):
+                    outs.append(f)
+            esp = []
+            resp = []
+            for out in sorted(outs):
+                with open(trainDir / out, "r") as tcout:
+                    frameEsp, frameResp = readCharges(tcout)
+                esp.append(frameEsp)
+                resp.append(frameResp)
+            esp = np.asarray(esp, dtype=np.float64)
+            resp = np.asarray(resp, dtype=np.float64)
+        self.addCharges(esp, resp)
+        self.readDirs.add(trainDir)
+
+    def addCharges(self, esp: np.ndarray, resp: np.ndarray):
         """
-        Compute charge distributions for ESP and RESP charges.
+        Add the charges of a set of frames to the store, and update the
+        running charge statistics of each repeat group.
+
+        Args:
+            esp (np.ndarray): ESP charges, one row per frame.
+            resp (np.ndarray): RESP charges, one row per frame.
 
         Raises:
             ValueError: If the number of atoms is not divisible by the number of units.
         """
-        espArray = np.array(self.allEsp, dtype=np.float32, copy=True)
-        respArray = np.array(self.allResp, dtype=np.float32, copy=True)
-        espArray.shape[1]
-        unitLength = len(self.repeats)
-        if espArray.shape[1] % self.units != 0:
+        if esp.shape[0] == 0:
+            return
+        natoms = esp.shape[1]
+        if natoms % self.units != 0:
             raise ValueError(
                 "Must have an integer number of molecules to be fitted in the RESP calculation"
             )
-        self.espMeans = np.zeros(unitLength)
-        self.espStdevs = np.ones(unitLength) * -1
-        self.respMeans = np.zeros(unitLength)
-        self.respStdevs = np.ones(unitLength) * -1
+        nframes = self.nframes + esp.shape[0]
+        if nframes > self.espStore.shape[0]:
+            capacity = max(nframes, 2 * self.espStore.shape[0])
+            self.espStore = growRows(self.espStore, capacity, natoms)
+            self.respStore = growRows(self.respStore, capacity, natoms)
+        self.espStore[self.nframes : nframes] = esp
+        self.respStore[self.nframes : nframes] = resp
+        self.nframes = nframes
+
+        columns, groups = self.getGroupColumns(natoms)
+        self.espStats = updateStats(self.espStats, esp[:, columns], groups)
+        self.respStats = updateStats(self.respStats, resp[:, columns], groups)
+
+    def getGroupColumns(self, natoms: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the columns of the charge arrays belonging to each repeat group.
+        A group with one atom is made up of that position in every unit,
+        and a group with several atoms of each of their positions.
+
+        Args:
+            natoms (int): Number of atoms in each frame.
+
+        Returns:
+            tuple: Column indices, and the repeat group of each column.
+        """
+        if self.groupColumns is not None and self.groupColumns[0] == natoms:
+            return self.groupColumns[1:]
+        unitLength = len(self.repeats)
+        columns = []
+        groups = []
         for i, idxs in enumerate(self.repeats):
-            if len(idxs) == 0:
-                continue
-            elif len(idxs) == 1:
-                self.espMeans[i], self.espStdevs[i] = norm.fit(
-                    espArray[:, i::unitLength].flatten()
-                )
-                self.respMeans[i], self.respStdevs[i] = norm.fit(
-                    respArray[:, i::unitLength].flatten()
-                )
-            else:
-                espList = []
-                respList = []
-                for idx in idxs:
-                    espList += list(espArray[:, idx::unitLength].flatten())
-                    respList += list(respArray[:, idx::unitLength].flatten())
-                self.espMeans[i], self.espStdevs[i] = norm.fit(
-                    np.asarray(espList, dtype=np.float32)
-                )
-                self.respMeans[i], self.respStdevs[i] = norm.fit(
-                    np.asarray(respList, dtype=np.float32)
-                )
-
-        # fig, ax = plt.subplots()
-        # plt.hist(allCharges[:,2::unitLength].flatten(),density=True,bins=12,edgecolor="black")
-        # xmin, xmax = plt.xlim()
-        # x = np.linspace(xmin, xmax, 100)
-        # y = norm.pdf(x, means[2], stdevs[2])
-        # plt.plot(x, y)
-        # fig.set_dpi(200)
-        # plt.savefig("RESP_charge_dist.png",bbox_inches="tight")
+            if len(idxs) == 1:
+                idxs = [i]
+            for idx in idxs:
+                column = np.arange(idx, natoms, unitLength)
+                columns.append(column)
+                groups.append(np.full(column.shape[0], i))
+        columns = np.concatenate(columns + [np.empty(0, dtype=int)])
+        groups = np.concatenate(groups + [np.empty(0, dtype=int)])
+        self.groupColumns = (natoms, columns, groups)
+        return columns, groups
+
+    def computeChargeDistributions(self):
+        """
+        Compute the mean and standard deviation of the ESP and RESP charges
+        of each repeat group from the running statistics. Groups without
+        charges have a mean of 0 and a standard deviation of -1.
+        """
+        self.espMeans, self.espStdevs = finalizeStats(self.espStats)
+        self.respMeans, self.respStdevs = finalizeStats(self.respStats)
 
     def computePriors(self, cdf: float = 0.95) -> np.ndarray:
         """
@@ -337,3 +354,136 @@ class RespPriors:
         inputFile = f"opt_{str(i)}.in"
         self.setPriors(priors, inputFile)
         self.setMol2Charges(self.respMeans, mol2)
+
+
+def readCharges(lines) -> Tuple[List[float], List[float]]:
+    """
+    Read ESP and RESP charges from TeraChem output lines.
+
+    Args:
+        lines: Iterable of lines from TeraChem output, e.g. an open file.
+
+    Returns:
+        tuple: ESP charges and RESP charges.
+
+    Raises:
+        RuntimeError: If no charges are found in the lines.
+    """
+    esp = []
+    resp = []
+    inEsp = False
+    inResp = False
+    almostInEsp = False
+    almostInResp = False
+    natoms = 0
+    for line in lines:
+        if "Total atoms:" in line:
+            natoms = int(line.split()[2])
+        if inEsp:
+            esp.append(float(line.split()[4]))
+            if len(esp) == natoms:
+                inEsp = False
+        if inResp:
+            resp.append(float(line.split()[4]))
+            if len(resp) == natoms:
+                inResp = False
+        if almostInEsp and "--------------------------------------" in line:
+            inEsp = True
+            almostInEsp = False
+        if almostInResp and "--------------------------------------" in line:
+            inResp = True
+            almostInResp = False
+        if "ESP unrestraint charges:" in line:
+            almostInEsp = True
+        if "ESP restraint charges:" in line:
+            almostInResp = True
+    if len(esp) == 0 or len(resp) == 0:
+        raise RuntimeError("No charges in lines")
+    return esp, resp
+
+
+def growRows(array: np.ndarray, nrows: int, ncols: int) -> np.ndarray:
+    """
+    Copy an array into a larger one with the given number of rows.
+
+    Args:
+        array (np.ndarray): The array.
+        nrows (int): Number of rows of the new array.
+        ncols (int): Number of columns of the new array.
+
+    Returns:
+        np.ndarray: The new array, with the old rows at the start.
+    """
+    grown = np.empty((nrows, ncols), dtype=np.float64)
+    if array.shape[0] > 0:
+        grown[: array.shape[0]] = array
+    return grown
+
+
+def initializeStats(ngroups: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Initialize running statistics for a number of groups.
+
+    Args:
+        ngroups (int): Number of groups.
+
+    Returns:
+        tuple: Count, mean and sum of squared deviations (M2) of each group.
+    """
+    return np.zeros(ngroups), np.zeros(ngroups), np.zeros(ngroups)
+
+
+def updateStats(
+    stats: Tuple[np.ndarray, np.ndarray, np.ndarray],
+    values: np.ndarray,
+    groups: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Update running statistics with a batch of values, using Welford's
+    algorithm in the pairwise form of Chan et al. to merge the statistics of
+    the batch into the running ones.
+
+    Args:
+        stats (tuple): Count, mean and M2 of each group.
+        values (np.ndarray): Values, one row per frame.
+        groups (np.ndarray): Group of each column of values.
+
+    Returns:
+        tuple: Updated count, mean and M2 of each group.
+    """
+    count, mean, m2 = stats
+    ngroups = count.shape[0]
+    groups = np.broadcast_to(groups, values.shape).ravel()
+    values = values.ravel()
+    batchCount = np.bincount(groups, minlength=ngroups).astype(np.float64)
+    batchSum = np.bincount(groups, weights=values, minlength=ngroups)
+    batchMean = batchSum / np.maximum(batchCount, 1)
+    deviations = values - batchMean[groups]
+    batchM2 = np.bincount(groups, weights=deviations**2, minlength=ngroups)
+    total = count + batchCount
+    delta = batchMean - mean
+    weight = batchCount / np.maximum(total, 1)
+    mean = mean + delta * weight
+    m2 = m2 + batchM2 + delta**2 * count * weight
+    return total, mean, m2
+
+
+def finalizeStats(
+    stats: Tuple[np.ndarray, np.ndarray, np.ndarray],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Get the mean and (maximum likelihood) standard deviation of each group
+    from running statistics, as scipy.stats.norm.fit would give.
+
+    Args:
+        stats (tuple): Count, mean and M2 of each group.
+
+    Returns:
+        tuple: Mean and standard deviation of each group; groups without
+            values have a mean of 0 and a standard deviation of -1.
+    """
+    count, mean, m2 = stats
+    hasValues = count > 0
+    means = np.where(hasValues, mean, 0.0)
+    stdevs = np.where(hasValues, np.sqrt(m2 / np.maximum(count, 1)), -1.0)
+    return means, stdevs
@@ -0,0 +1,202 @@
+from random import sample
+
+import numpy as np
+
+
+def getForceSpread(forces: np.ndarray) -> np.ndarray:
+    """
+    Get the spread of the committee's forces for each geometry.
+
+    Args:
+        forces (np.ndarray): Forces of shape (models, geometries, 3N).
+
+    Returns:
+        np.ndarray: Norm of the standard deviation of the forces (or of the
+            difference of the forces, for two models) for each geometry.
+    """
+    if forces.shape[0] == 2:
+        return np.linalg.norm(forces[0, :, :] - forces[1, :, :], axis=1)
+    return np.linalg.norm(np.std(forces, axis=0), axis=1)
+
+
+def getDescriptors(geometries: np.ndarray) -> np.ndarray:
+    """
+    Get rotation- and translation-invariant descriptors of geometries: the
+    inverse interatomic distances.
+
+    Args:
+        geometries (np.ndarray): Flattened geometries of shape (geometries, 3N).
+
+    Returns:
+        np.ndarray: Descriptors of shape (geometries, N(N-1)/2).
+    """
+    coords = np.asarray(geometries, dtype=np.float32).reshape(len(geometries), -1, 3)
+    i, j = np.triu_indices(coords.shape[1], k=1)
+    distances = np.linalg.norm(coords[:, i, :] - coords[:, j, :], axis=2)
+    return 1 / np.maximum(distances, 1e-6)
+
+
+class SelectionStrategy:
+    """
+    Query-by-committee selection of new geometries for QM calculations.
+    Subclasses define the uncertainty (spread) of the committee; by default,
+    the geometries with the largest spread are chosen.
+    """
+
+    def getSpread(self, energies: np.ndarray, forces: np.ndarray) -> np.ndarray:
+        """
+        Get the committee's uncertainty for each geometry.
+
+        Args:
+            energies (np.ndarray): Energies of shape (models, geometries).
+            forces (np.ndarray): Forces of shape (models, geometries, 3N).
+
+        Returns:
+            np.ndarray: Spread for each geometry.
+        """
+        raise NotImplementedError()
+
+    def choose(
+        self,
+        energies: np.ndarray,
+        forces: np.ndarray,
+        geomsNeeded: int,
+        geometries: list = None,
+    ) -> list:
+        """
+        Choose geometries for QM calculations.
+
+        Args:
+            energies (np.ndarray): Energies of shape (models, geometries).
+            forces (np.ndarray): Forces of shape (models, geometries, 3N).
+            geomsNeeded (int): Number of geometries needed.
+            geometries (list, optional): Flattened geometries. Only needed by
+                strategies which consider the structures. Defaults to None.
+
+        Returns:
+            list: Indices of chosen geometries.
+        """
+        spread = self.getSpread(energies, forces)
+        return [int(k) for k in np.argsort(spread)[::-1][:geomsNeeded]]
+
+
+class ForceSelection(SelectionStrategy):
+    """
+    Choose the geometries with the largest spread in forces.
+    """
+
+    def getSpread(self, energies: np.ndarray, forces: np.ndarray) -> np.ndarray:
+        return getForceSpread(forces)
+
+
+class EnergySelection(SelectionStrategy):
+    """
+    Choose the geometries with the largest standard deviation of the energy.
+    """
+
+    def getSpread(self, energies: np.ndarray, forces: np.ndarray) -> np.ndarray:
+        return np.std(energies, axis=0)
+
+
+class AtomSelection(SelectionStrategy):
+    """
+    Choose the geometries with the largest deviation in the force on any
+    single atom, which picks out local failures that the norm over all
+    atoms averages away.
+    """
+
+    def getSpread(self, energies: np.ndarray, forces: np.ndarray) -> np.ndarray:
+        atomForces = forces.reshape(forces.shape[0], forces.shape[1], -1, 3)
+        deviations = np.linalg.norm(np.std(atomForces, axis=0), axis=2)
+        return np.max(deviations, axis=1)
+
+
+class MixedSelection(ForceSelection):
+    """
+    Choose half of the geometries by spread in forces and the other half
+    randomly from the rest.
+    """
+
+    def choose(
+        self,
+        energies: np.ndarray,
+        forces: np.ndarray,
+        geomsNeeded: int,
+        geometries: list = None,
+    ) -> list:
+        indices = np.argsort(self.getSpread(energies, forces))
+        ntop = int((geomsNeeded + 1) / 2)
+        newGeoms = [int(k) for k in indices[::-1][:ntop]]
+        rest = indices[: len(indices) - ntop]
+        newGeoms += [int(rest[k]) for k in sample(range(len(rest)), geomsNeeded - ntop)]
+        return newGeoms
+
+
+class KCenterSelection(ForceSelection):
+    """
+    Choose geometries by greedy farthest-point (k-center) selection, weighted
+    by spread in forces, so near-duplicate high-spread geometries don't fill
+    the batch. Distances are measured between inverse-distance descriptors.
+    """
+
+    def __init__(self, poolFactor: int = 8):
+        """
+        Initialize the strategy.
+
+        Args:
+            poolFactor (int, optional): Only the poolFactor * geomsNeeded
+                geometries with the largest spread are candidates. Defaults
+                to 8.
+        """
+        self.poolFactor = poolFactor
+
+    def choose(
+        self,
+        energies: np.ndarray,
+        forces: np.ndarray,
+        geomsNeeded: int,
+        geometries: list = None,
+    ) -> list:
+        if geometries is None:
+            raise ValueError("K-center selection requires the geometries")
+        spread = self.getSpread(energies, forces)
+        candidates = np.argsort(spread)[::-1][: self.poolFactor * geomsNeeded]
+        descriptors = getDescriptors([geometries[k] for k in candidates])
+        weights = spread[candidates]
+        # Start from the geometry with the largest spread
+        chosen = [0]
+        minDists = np.linalg.norm(descriptors - descriptors[0], axis=1)
+        for _ in range(1, min(geomsNeeded, len(candidates))):
+            scores = weights * minDists
+            scores[chosen] = -np.inf
+            k = int(np.argmax(scores))
+            chosen.append(k)
+            dists = np.linalg.norm(descriptors - descriptors[k], axis=1)
+            minDists = np.minimum(minDists, dists)
+        return [int(candidates[k]) for k in chosen]
+
+
+def getStrategy(name: str) -> SelectionStrategy:
+    """
+    Get a selection strategy by name.
+
+    Args:
+        name (str): One of "mixed", "force", "energy", "atom", or "kcenter".
+
+    Returns:
+        SelectionStrategy: The selection strategy.
+
+    Raises:
+        ValueError: If the strategy is not implemented.
+    """
+    if name == "mixed":
+        return MixedSelection()
+    elif name == "force":
+        return ForceSelection()
+    elif name == "energy":
+        return EnergySelection()
+    elif name == "atom":
+        return AtomSelection()
+    elif name == "kcenter":
+        return KCenterSelection()
+    raise ValueError(f"Selection strategy {name} is not implemented")
@@ -0,0 +1,281 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+def readFBInput(inputFile: str) -> tuple:
+    """
+    Split a ForceBalance input file into its options and targets.
+
+    Args:
+        inputFile (str): Path to the input file.
+
+    Returns:
+        tuple: List of lines outside of target sections, and a list of
+            (name, lines) for each target section.
+    """
+    optionLines = []
+    targets = []
+    inTarget = False
+    with open(inputFile, "r") as f:
+        for line in f:
+            splitLine = line.split()
+            if len(splitLine) > 0 and splitLine[0].lower() == "$target":
+                inTarget = True
+                name = None
+                targetLines = []
+            if not inTarget:
+                # Blank lines are added back between sections by writeFBInput
+                if len(splitLine) > 0:
+                    optionLines.append(line)
+                continue
+            targetLines.append(line)
+            if len(splitLine) > 1 and splitLine[0].lower() == "name":
+                name = splitLine[1]
+            if len(splitLine) > 0 and splitLine[0].lower() == "$end":
+                inTarget = False
+                targets.append((name, targetLines))
+    return optionLines, targets
+
+
+def writeFBInput(inputFile: str, optionLines: list, targets: list):
+    """
+    Write a ForceBalance input file.
+
+    Args:
+        inputFile (str): Path to the input file.
+        optionLines (list): Lines outside of target sections.
+        targets (list): List of (name, lines) for each target section.
+    """
+    with open(inputFile, "w") as f:
+        f.writelines(optionLines)
+        for name, lines in targets:
+            f.write("\n")
+            f.writelines(lines)
+
+
+def getOption(lines: list, key: str, default: str = None) -> list:
+    """
+    Get the values of an option from lines of a ForceBalance input.
+
+    Args:
+        lines (list): Lines of the input file.
+        key (str): Name of the option.
+        default (str, optional): Value if the option isn't set. Defaults to
+            None.
+
+    Returns:
+        list: Values of the option, or [default] if it isn't set.
+    """
+    for line in lines:
+        splitLine = line.split("#")[0].split()
+        if len(splitLine) > 1 and splitLine[0].lower() == key:
+            return splitLine[1:]
+    return [default]
+
+
+def hashFile(h, path: Path):
+    """
+    Add the name and contents of a file to a hash.
+
+    Args:
+        h: hashlib hash object.
+        path (Path): The file.
+    """
+    h.update(str(path.name).encode())
+    with open(path, "rb") as f:
+        h.update(hashlib.sha256(f.read()).digest())
+
+
+def getParameterKey(optionLines: list, root: Path) -> str:
+    """
+    Get a key for the parameters a ForceBalance input evaluates targets
+    with: its options and the contents of its force field files.
+
+    Args:
+        optionLines (list): Lines outside of target sections.
+        root (Path): Directory ForceBalance runs in.
+
+    Returns:
+        str: Hex digest identifying the parameters.
+    """
+    h = hashlib.sha256()
+    for line in optionLines:
+        h.update(" ".join(line.split("#")[0].split()).encode())
+    ffdir = root / getOption(optionLines, "ffdir", "forcefield")[0]
+    for f in getOption(optionLines, "forcefield"):
+        if f is not None:
+            hashFile(h, ffdir / f)
+    return h.hexdigest()
+
+
+def getTargetKey(parameterKey: str, name: str, lines: list, root: Path) -> str:
+    """
+    Get a key for evaluating a target with a set of parameters. Target
+    data is identified by the paths, sizes and modification times of the
+    files in the target's directory, and its leap script by its contents.
+
+    Args:
+        parameterKey (str): Key of the parameters, from getParameterKey.
+        name (str): Name of the target.
+        lines (list): Lines of the target section.
+        root (Path): Directory ForceBalance runs in.
+
+    Returns:
+        str: Hex digest identifying the evaluation.
+    """
+    h = hashlib.sha256()
+    h.update(parameterKey.encode())
+    for line in lines:
+        h.update(" ".join(line.split("#")[0].split()).encode())
+    targetDir = root / "targets" / name
+    if targetDir.is_dir():
+        for f in sorted(targetDir.rglob("*")):
+            if f.is_file():
+                stat = f.stat()
+                h.update(
+                    f"{f.relative_to(targetDir)}:{stat.st_mtime_ns}:{stat.st_size}".encode()
+                )
+    leap = getOption(lines, "amber_leapcmd")[0]
+    if leap is not None and (root / leap).is_file():
+        hashFile(h, root / leap)
+    return h.hexdigest()
+
+
+def readObjectives(outputFile: str) -> tuple:
+    """
+    Read the objective function of each target, and the regularization,
+    from the output of a ForceBalance single-point evaluation.
+
+    Args:
+        outputFile (str): Path to the ForceBalance output.
+
+    Returns:
+        tuple: Dict from target names to objective functions, and the
+            regularization term (None if not found).
+    """
+    objectives = {}
+    regularization = None
+    inBreakdown = False
+    with open(outputFile, "r") as f:
+        for line in f:
+            splitLine = line.split()
+            if "Target:" in splitLine and "Objective" in splitLine:
+                name = splitLine[splitLine.index("Target:") + 1]
+                objectives[name] = float(splitLine[splitLine.index("=") + 1])
+            if "Objective Function Breakdown" in line:
+                inBreakdown = True
+            if inBreakdown and len(splitLine) > 1 and splitLine[0] == "Regularization":
+                regularization = float(splitLine[1])
+                inBreakdown = False
+    return objectives, regularization
+
+
+def writeObjectives(outputFile: str, objectives: list, regularization: float):
+    """
+    Write the output of a single-point evaluation from target objective
+    functions, in the format of ForceBalance so readValid can read it.
+
+    Args:
+        outputFile (str): Path to write the output to.
+        objectives (list): List of (name, objective, normalized weight)
+            for each target.
+        regularization (float): Regularization term.
+
+    Returns:
+        float: The total objective function.
+    """
+    total = regularization
+    bar = "#" + "=" * 68 + "#\n"
+    with open(outputFile, "w") as f:
+        f.write(bar)
+        f.write("#|  Objective Function Breakdown (from cached targets)  |#\n")
+        f.write(
+            "#|  Target Name              Residual  x  Weight  =  Contribution |#\n"
+        )
+        f.write(bar)
+        for name, objective, weight in objectives:
+            contribution = objective * weight
+            total += contribution
+            f.write(f"{name:<30} {objective:.5e} {weight:.3f} {contribution:.5e}\n")
+        f.write(
+            f"{'Regularization':<30} {regularization:.5e} 1.000 {regularization:.5e}\n"
+        )
+        f.write(f"{'Total':<30} {total:.5e}\n")
+        f.write("-" * 70 + "\n")
+        f.write(bar)
+        # Same tokens as ForceBalance's line, including the color codes
+        f.write(
+            f"#| \x1b[92m    Objective Function Single Point: {total:.8f}     \x1b[0m |#\n"
+        )
+        f.write(bar)
+    return total
+
+
+class TargetCache:
+    def __init__(self, path: str | Path):
+        """
+        Initialize an on-disk cache of the objective function of single
+        ForceBalance targets, evaluated with fixed parameters. Entries are
+        appended to a JSON lines file, one per evaluation.
+
+        Args:
+            path (str or Path): Path to the cache file.
+        """
+        self.path = Path(path).absolute()
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        if self.path.is_file():
+            with open(self.path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.entries[entry["key"]] = entry["value"]
+
+    def get(self, key: str) -> float:
+        """
+        Get a cached value.
+
+        Args:
+            key (str): Cache key.
+
+        Returns:
+            float: The cached value, or None if it isn't cached.
+        """
+        value = self.entries.get(key, None)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def update(self, entries: dict):
+        """
+        Add entries which another process has already stored.
+
+        Args:
+            entries (dict): Cached values by key.
+        """
+        self.entries.update(entries)
+
+    def store(self, key: str, value: float):
+        """
+        Store a value.
+
+        Args:
+            key (str): Cache key.
+            value (float): Value to store.
+        """
+        if self.entries.get(key, None) == value:
+            return
+        self.entries[key] = value
+        line = json.dumps({"key": key, "value": value}) + "\n"
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode())
+        finally:
+            os.close(fd)
@@ -1,4 +1,5 @@
 import os
+from itertools import islice
 from pathlib import Path
 from shutil import rmtree, which
 from time import sleep
@@ -85,7 +86,8 @@ def convertTCtoFB(
     mdcrd: str = "all.mdcrd",
 ) -> int:
     """
-    Convert TeraChem output to ForceBalance format.
+    Convert TeraChem output to ForceBalance format. Both files are streamed,
+    and gradient and coordinate frames are matched by MD step number.
 
     Args:
         tcout (str): Path to TeraChem output file.
@@ -100,147 +102,104 @@ def convertTCtoFB(
         int: Number of jobs processed.
     """
 
+    # Only the step number, energy and byte offset of each frame are kept in
+    # memory; coordinates and gradients are read back for the frames which
+    # are actually written out.
     molSize = 0
-    coords = []
-    frame = []
-    energies = []
-    grads = []
-    coordIndex = []
-    gradIndex = []
-    lineCounter = 0
-    frameStart = -1
-    coorEnergies = []
-
-    with open(coors, "r") as f:
-        maxFrame = -1
-        for line in f.readlines():
-            splitLine = line.split()
-            if lineCounter == 0:
-                molSize = int(splitLine[0])
-            if lineCounter == 1:
-                index = int(splitLine[2]) + 1  # coor files are 0-indexed
-                energy = splitLine[0]
-                if frameStart == -1:
-                    frameStart = index
-            elif lineCounter > 1 and lineCounter < molSize + 2:
-                for token in splitLine[1:]:
-                    frame.append(token)
-            if lineCounter == molSize + 1:
-                if index > maxFrame:
-                    maxFrame = index
-                    coords.append(frame)
-                    coordIndex.append(index)
-                    coorEnergies.append(energy)
-                else:
-                    j = len(coords) - 1
-                    while coordIndex[j] > index:
-                        j -= 1
-                    coords[j] = frame
-                    coordIndex[j] = index
-                    coorEnergies[j] = energy
-                frame = []
-                lineCounter = -1
-            lineCounter = lineCounter + 1
-
+    coordFrames = {}
+    with open(coors, "rb") as f:
+        offset = 0
+        for line in f:
+            offset += len(line)
+            if len(line.split()) == 0:
+                continue
+            molSize = int(line)
+            comment = f.readline()
+            frameOffset = offset + len(comment)
+            lines = list(islice(f, molSize))
+            offset = frameOffset + sum(map(len, lines))
+            if len(lines) < molSize:
+                break
+            splitLine = comment.split()
+            index = int(splitLine[2]) + 1  # coor files are 0-indexed
+            coordFrames[index] = (splitLine[0].decode(), frameOffset)
+
+    gradFrames = {}
     gradCounter = molSize + 37
     index = 0
     frameStart = -1
-
-    with open(tcout, "r") as f:
-        maxFrame = -1
-        for line in f.readlines():
-            if "MD STEP" in line:
+    with open(tcout, "rb") as f:
+        offset = 0
+        for line in f:
+            if b"MD STEP" in line:
                 index = int(line.split()[4])
                 if frameStart == -1:
-                    if len(grads) > 0:
+                    if len(gradFrames) > 0:
                         frameStart = index - 1  # first step is unnumbered "step 0"
-                        gradIndex[0] = index - 1
+                        gradFrames = {index - 1: gradFrames[0]}
                     else:
                         frameStart = index
-            if "FINAL ENERGY" in line:
+            if b"FINAL ENERGY" in line:
                 energy = float(line.split()[2])
-            if "Gradient units" in line:
+            if b"Gradient units" in line:
                 gradCounter = 0
-                frame = []
-            if gradCounter < molSize + 2 and gradCounter > 2:
-                for token in line.split():
-                    frame.append(token)
+                gradOffset = offset
             if gradCounter == molSize + 2:
-                for token in line.split():
-                    frame.append(token)
-                if index > maxFrame:
-                    maxFrame = index
-                    grads.append(frame)
-                    gradIndex.append(index)
-                    energies.append(energy)
-                else:
-                    j = len(grads) - 1
-                    while gradIndex[j] > index:
-                        j -= 1
-                    grads[j] = frame
-                    gradIndex[j] = index
-                    energies[j] = energy
+                gradFrames[index] = (energy, gradOffset)
             gradCounter = gradCounter + 1
+            offset += len(line)
 
+    gradIndex = list(gradFrames.keys())
+    coordPositions = {index: j for j, index in enumerate(coordFrames.keys())}
     if start == None:
         start = gradIndex[0]
     if end == None:
         end = gradIndex[-1]
 
-    jobCounter = 0
-    indices = []
-    precision = len(coorEnergies[0].split(".")[1])
-    for i in range(len(gradIndex)):
-        for j in range(len(coordIndex)):
-            if gradIndex[i] == coordIndex[j]:
-                eFormat = "%." + str(precision) + "f"
-                gradEnergy = eFormat % energies[i]
-                if coorEnergies[j] != gradEnergy:
-                    # print("Mismatched energies in step " + str(gradIndex[i]))
-                    # raise RuntimeError("Mismatched energies from " + tcout + " and " + coors)
-                    break
-                indices.append([i, j])
-
+    # Match frames by step number, checking that both files agree on the
+    # energy to the precision it is written with in the coordinates file
+    precision = len(next(iter(coordFrames.values()))[0].split(".")[1])
+    eFormat = "%." + str(precision) + "f"
     usedIndices = []
     lastFrame = -stride - 37
-    for i in range(len(indices)):
-        # Get first frame from timestep stride, not timestep 0
-        if (
-            gradIndex[indices[i][1]] >= start + stride - 1
-            and gradIndex[indices[i][1]] <= end
-        ):
-            if gradIndex[indices[i][1]] - lastFrame >= stride:
-                lastFrame = gradIndex[indices[i][1]]
-                usedIndices.append(indices[i])
-
-    with open(qdata, "w") as f:
-        for j in usedIndices:
-            f.write("\n")
-            f.write("JOB " + str(jobCounter) + "\n")
-            coordLine = "COORDS "
-            for coord in coords[j[1]]:
-                coordLine = coordLine + str(coord) + " "
-            gradLine = "FORCES "
-            for grad in grads[j[0]]:
-                gradLine = gradLine + str(grad) + " "
-            f.write(coordLine + "\n")
-            f.write("ENERGY " + str(energies[j[0]]) + "\n")
-            f.write(gradLine + "\n")
-            jobCounter = jobCounter + 1
+    for index, (energy, gradOffset) in gradFrames.items():
+        if index not in coordFrames:
+            continue
+        coorEnergy, coordOffset = coordFrames[index]
+        if coorEnergy != eFormat % energy:
+            continue
+        # Get first frame from timestep stride, not timestep 0. The stride is
+        # applied to the gradient step at the position of the matching
+        # coordinate frame, which is one step behind since the coordinates
+        # file has no step 0.
+        step = gradIndex[coordPositions[index]]
+        if step >= start + stride - 1 and step <= end:
+            if step - lastFrame >= stride:
+                lastFrame = step
+                usedIndices.append((energy, gradOffset, coordOffset))
 
-    with open(mdcrd, "w") as f:
-        f.write("converted from TC with convertTCMDtoFB.py\n")
-        for j in usedIndices:
-            tokenCounter = 1
-            for coord in coords[j[1]]:
-                f.write("%8.3f" % float(coord))
-                if tokenCounter == 10:
-                    f.write("\n")
-                    tokenCounter = 1
-                else:
-                    tokenCounter = tokenCounter + 1
-            if tokenCounter != 1:
-                f.write("\n")
+    jobCounter = 0
+    with open(coors, "rb") as coorsFile, open(tcout, "rb") as tcFile, open(
+        qdata, "w"
+    ) as qdataFile, open(mdcrd, "w") as mdcrdFile:
+        mdcrdFile.write("converted from TC with convertTCMDtoFB.py\n")
+        for energy, gradOffset, coordOffset in usedIndices:
+            coorsFile.seek(coordOffset)
+            coords = []
+            for line in islice(coorsFile, molSize):
+                coords += line.decode().split()[1:]
+            tcFile.seek(gradOffset)
+            grads = []
+            for line in islice(tcFile, 3, molSize + 3):
+                grads += line.decode().split()
+            qdataFile.write(
+                f"\nJOB {jobCounter}\n"
+                f"COORDS {''.join(coord + ' ' for coord in coords)}\n"
+                f"ENERGY {str(energy)}\n"
+                f"FORCES {''.join(grad + ' ' for grad in grads)}\n"
+            )
+            mdcrdFile.write(formatMdcrdFrame(coords))
+            jobCounter = jobCounter + 1
     return jobCounter
 
 
@@ -313,6 +272,156 @@ def writeXYZ(geometry: np.array, symbols: list, dest: str):
             )
 
 
+def indexXYZ(xyz: str | Path) -> dict:
+    """
+    Scan a multi-frame XYZ file once and record where each frame starts.
+
+    Args:
+        xyz (str or Path): Path to XYZ file.
+
+    Returns:
+        dict: "offsets" holds the byte offset of each frame, "frames" the
+            TeraChem frame number from each comment line (or the sequential
+            frame number if the comment line has none), and "natoms" the number
+            of atoms per frame. Incomplete trailing frames are ignored.
+
+    Raises:
+        RuntimeError: If the XYZ file is not formatted correctly.
+    """
+    offsets = []
+    frames = []
+    natoms = None
+    offset = 0
+    with open(xyz, "rb") as f:
+        try:
+            for line in f:
+                start = offset
+                offset += len(line)
+                # Allow blank lines between frames and at the end of the file
+                if len(line.split()) == 0:
+                    continue
+                n = int(line)
+                if natoms is None:
+                    natoms = n
+                elif n != natoms:
+                    raise ValueError
+                comment = f.readline()
+                offset += len(comment)
+                lines = list(islice(f, natoms))
+                offset += sum(map(len, lines))
+                if len(lines) < natoms:
+                    break
+                if b"frame" in comment:
+                    frames.append(int(comment.split()[2]))
+                else:
+                    frames.append(len(offsets))
+                offsets.append(start)
+        except:
+            raise RuntimeError(f"XYZ file {xyz} is formatted incorrectly!")
+    if natoms is None:
+        raise RuntimeError(f"XYZ file {xyz} is formatted incorrectly!")
+    return {
+        "offsets": np.asarray(offsets, dtype=np.int64),
+        "frames": np.asarray(frames, dtype=np.int64),
+        "natoms": natoms,
+    }
+
+
+def getXYZIndexPath(xyz: str | Path) -> Path:
+    """
+    Get the path of the cached frame index for an XYZ file.
+
+    Args:
+        xyz (str or Path): Path to XYZ file.
+
+    Returns:
+        Path: Path to the index file, stored next to the XYZ file.
+    """
+    xyz = Path(xyz)
+    return xyz.parent / f".{xyz.name}.index.npz"
+
+
+def loadXYZIndex(xyz: str | Path) -> dict:
+    """
+    Load the frame index for an XYZ file, rebuilding it if the cached copy is
+    missing or the XYZ file has changed since the index was written.
+
+    Args:
+        xyz (str or Path): Path to XYZ file.
+
+    Returns:
+        dict: Frame index, as returned by indexXYZ.
+
+    Raises:
+        RuntimeError: If the XYZ file is not formatted correctly.
+    """
+    stat = os.stat(xyz)
+    indexPath = getXYZIndexPath(xyz)
+    if indexPath.is_file():
+        try:
+            with np.load(indexPath) as cached:
+                if (
+                    int(cached["mtime"]) == stat.st_mtime_ns
+                    and int(cached["size"]) == stat.st_size
+                ):
+                    return {
+                        "offsets": cached["offsets"],
+                        "frames": cached["frames"],
+                        "natoms": int(cached["natoms"]),
+                    }
+        except (OSError, ValueError, KeyError):
+            pass
+    index = indexXYZ(xyz)
+    # Write to a temporary file first so that concurrent readers never see a
+    # partially written index
+    tmpPath = indexPath.with_name(f"{indexPath.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmpPath, "wb") as f:
+            np.savez(
+                f,
+                mtime=stat.st_mtime_ns,
+                size=stat.st_size,
+                **index,
+            )
+        os.replace(tmpPath, indexPath)
+    except OSError:
+        # Read-only directories just don't get a cached index
+        if tmpPath.is_file():
+            os.remove(tmpPath)
+    return index
+
+
+def readXYZFrame(xyz: str | Path, offset: int, natoms: int) -> list:
+    """
+    Read a single frame from a multi-frame XYZ file.
+
+    Args:
+        xyz (str or Path): Path to XYZ file.
+        offset (int): Byte offset of the start of the frame.
+        natoms (int): Number of atoms in the frame.
+
+    Returns:
+        list: 2D list of coordinate strings, one [x, y, z] row per atom.
+
+    Raises:
+        RuntimeError: If the frame is not formatted correctly.
+    """
+    frame = []
+    with open(xyz, "rb") as f:
+        f.seek(offset)
+        try:
+            if int(f.readline()) != natoms:
+                raise ValueError
+            f.readline()
+            for line in islice(f, natoms):
+                frame.append(line.decode().split()[1:4])
+        except ValueError:
+            raise RuntimeError(f"Error reading frame at byte {offset} of {xyz}")
+    if len(frame) != natoms or any(len(row) != 3 for row in frame):
+        raise RuntimeError(f"Error reading frame at byte {offset} of {xyz}")
+    return frame
+
+
 def convertPDBtoXYZ(pdb: str) -> str:
     """
     Convert PDB file to XYZ format.
@@ -401,6 +510,49 @@ def readGradFromTCout(outFile: str) -> tuple[float, np.ndarray]:
     return energy, grads
 
 
+def parseTCOutput(outFile: str | Path) -> tuple[float, np.ndarray] | None:
+    """
+    Read the energy and gradient of a finished TeraChem gradient job. Only
+    the first FINAL ENERGY line and the first gradient block are read, as
+    qcparse does, so this is a fast path for the fields we use.
+
+    Args:
+        outFile (str or Path): Path to TeraChem output file.
+
+    Returns:
+        tuple or None: Energy and flattened gradient, or None if the job
+            didn't finish or the output isn't in the expected format.
+    """
+    energy = None
+    grad = None
+    finished = False
+    with open(outFile, "r") as f:
+        lines = iter(f)
+        for line in lines:
+            if energy is None and line.startswith("FINAL ENERGY:"):
+                try:
+                    energy = float(line.split()[2])
+                except (IndexError, ValueError):
+                    return None
+            elif grad is None and line.split() == ["dE/dX", "dE/dY", "dE/dZ"]:
+                grad = []
+                for gradLine in lines:
+                    if gradLine.startswith(("--", "-=")):
+                        break
+                    grad.append(gradLine)
+                try:
+                    grad = np.loadtxt(grad, dtype=np.float64, ndmin=2)
+                except ValueError:
+                    return None
+                if grad.shape[1] != 3:
+                    return None
+            elif "Job finished" in line:
+                finished = True
+    if not finished or energy is None or grad is None:
+        return None
+    return energy, grad.flatten()
+
+
 def readOpt(filename: str) -> tuple[int, dict]:
     """
     Read optimization results from ForceBalance output file.
@@ -457,7 +609,7 @@ def readOpt(filename: str) -> tuple[int, dict]:
     return status, results
 
 
-def readEsp(filename: str) -> tuple[list, list]:
+def readEsp(filename: str) -> tuple[np.ndarray, np.ndarray]:
     """
     Read ESP data from file.
 
@@ -465,20 +617,131 @@ def readEsp(filename: str) -> tuple[list, list]:
         filename (str): Path to ESP file.
 
     Returns:
-        tuple: ESP XYZ coordinates and ESP values.
+        tuple: Flattened ESP XYZ coordinates and ESP values.
     """
-    lineCounter = 1
-    espXYZ = []
-    esp = []
-    with open(filename, "r") as f:
-        for line in f.readlines():
-            splitLine = line.split()
-            if lineCounter > 2 and len(splitLine) > 0:
-                for i in range(1, 4):
-                    espXYZ.append(splitLine[i])
-                esp.append(splitLine[4])
-            lineCounter += 1
-    return espXYZ, esp
+    try:
+        data = np.loadtxt(filename, skiprows=2, usecols=(1, 2, 3, 4), ndmin=2)
+    except ValueError:
+        raise RuntimeError(f"ESP file {filename} is formatted incorrectly!")
+    return data[:, :3].flatten(), data[:, 3].copy()
+
+
+def getChargeStorePath(folder: str | Path = ".") -> Path:
+    """
+    Get the path of the charge store in a folder.
+
+    Args:
+        folder (str or Path, optional): Path to folder. Defaults to current directory.
+
+    Returns:
+        Path: Path to the charge store.
+    """
+    return Path(folder) / "charges.npz"
+
+
+def writeCharges(esp: list, resp: list, folder: str | Path = ".") -> Path:
+    """
+    Write the ESP and RESP charges of a set of frames to the charge store of
+    a folder.
+
+    Args:
+        esp (list): ESP charges of each frame.
+        resp (list): RESP charges of each frame.
+        folder (str or Path, optional): Path to folder. Defaults to current directory.
+
+    Returns:
+        Path: Path to the charge store.
+    """
+    store = getChargeStorePath(folder)
+    with open(store, "wb") as f:
+        np.savez(
+            f,
+            esp=np.asarray(esp, dtype=np.float64),
+            resp=np.asarray(resp, dtype=np.float64),
+        )
+    return store
+
+
+def readCharges(folder: str | Path = ".") -> tuple[np.ndarray, np.ndarray]:
+    """
+    Read the ESP and RESP charges of all frames from the charge store of a
+    folder.
+
+    Args:
+        folder (str or Path, optional): Path to folder. Defaults to current directory.
+
+    Returns:
+        tuple: ESP and RESP charges, one row per frame.
+    """
+    with np.load(getChargeStorePath(folder)) as f:
+        esp = f["esp"]
+        resp = f["resp"]
+    return esp, resp
+
+
+def formatFloats(values: list | np.ndarray, ndigits: int) -> str:
+    """
+    Format numbers for a qdata.txt line. Each value is written exactly as
+    str(round(float(value), ndigits)) would write it and followed by a space.
+
+    Args:
+        values (list or np.ndarray): Numbers (or numeric strings) to format.
+        ndigits (int): Number of decimal places to round to.
+
+    Returns:
+        str: Formatted values.
+    """
+    values = np.asarray(values, dtype=np.float64).ravel()
+    if values.shape[0] == 0:
+        return ""
+    rounded = np.round(values, ndigits)
+    # np.round scales by 10**ndigits before rounding, which can land on the
+    # wrong side of a tie. Use Python's correctly rounded round() for values
+    # close enough to a tie for that to happen, and for values too large to
+    # scale exactly.
+    with np.errstate(invalid="ignore"):
+        scaled = values * 10.0**ndigits
+        tie = np.abs(np.abs(scaled - np.floor(scaled)) - 0.5)
+        inexact = (tie <= 4 * np.spacing(np.abs(scaled))) | ~(np.abs(scaled) < 2.0**52)
+    rounded = rounded.tolist()
+    for i in np.flatnonzero(inexact).tolist():
+        rounded[i] = round(float(values[i]), ndigits)
+    return " ".join(map(repr, rounded)) + " "
+
+
+def formatMdcrdFrame(frame: list | np.ndarray) -> str:
+    """
+    Format one frame of an Amber ASCII trajectory, ten coordinates per line.
+
+    Args:
+        frame (list or np.ndarray): Flattened coordinates of the frame.
+
+    Returns:
+        str: Formatted frame, ending in a newline.
+    """
+    frame = np.asarray(frame, dtype=np.float64).ravel()
+    n = frame.shape[0]
+    fmt = ("%8.3f" * 10 + "\n") * (n // 10)
+    if n % 10 != 0:
+        fmt += "%8.3f" * (n % 10) + "\n"
+    return fmt % tuple(frame.tolist())
+
+
+def writeMdcrd(
+    coords: list, dest: str = "all.mdcrd", title: str = "Converted from xyz"
+):
+    """
+    Write an Amber ASCII trajectory, ten coordinates per line.
+
+    Args:
+        coords (list): Flattened coordinates of each frame.
+        dest (str, optional): Destination file path. Defaults to "all.mdcrd".
+        title (str, optional): Title line. Defaults to "Converted from xyz".
+    """
+    with open(dest, "w") as f:
+        f.write(f"{title}\n")
+        for frame in coords:
+            f.write(formatMdcrdFrame(frame))
 
 
 # frame is a 2D list
@@ -622,6 +885,29 @@ def convertNCtoXYZs(nc: str, symbols: list, offset: int = 0) -> int:
     return coords.shape[0]
 
 
+def readNCGeometries(nc: str, symbols: list) -> np.ndarray:
+    """
+    Read all frames from a NetCDF trajectory, dropping dummy atoms.
+
+    Args:
+        nc (str): Path to NetCDF file.
+        symbols (list): List of atomic symbols, including dummy atoms ("X").
+
+    Returns:
+        np.ndarray: Coordinates with one row of length 3 * natoms per frame.
+            Empty if the file has no coordinates (i.e. it is a velocity file).
+    """
+    atoms = [i for i in range(len(symbols)) if symbols[i] != "X"]
+    f = netcdf_file(nc, "r", mmap=False)
+    try:
+        if "coordinates" not in f.variables:
+            return np.zeros((0, 3 * len(atoms)), dtype=np.float32)
+        coords = np.asarray(f.variables["coordinates"][:, atoms, :], dtype=np.float32)
+    finally:
+        f.close()
+    return coords.reshape(coords.shape[0], -1)
+
+
 def loadElements():
     """
     Loads elements dict from file
@@ -634,9 +920,41 @@ def loadElements():
     return elements
 
 
+# Atomic symbols of prmtop files which have already been read, keyed by
+# getPrmtopKey
+prmtopSymbols = {}
+
+
+def getPrmtopKey(prmtop: str) -> tuple:
+    """
+    Get a key identifying the current contents of a prmtop file.
+
+    Args:
+        prmtop (str): Path to AMBER prmtop file.
+
+    Returns:
+        tuple: Absolute path, modification time, and size of the file.
+    """
+    stat = os.stat(prmtop)
+    return (os.path.abspath(prmtop), stat.st_mtime_ns, stat.st_size)
+
+
+def storePrmtopSymbols(prmtop: str, symbols: list):
+    """
+    Record the atomic symbols of a prmtop file, so that getSymbolsFromPrmtop
+    doesn't need to read it.
+
+    Args:
+        prmtop (str): Path to AMBER prmtop file.
+        symbols (list): List of atomic symbols.
+    """
+    prmtopSymbols[getPrmtopKey(prmtop)] = list(symbols)
+
+
 def getSymbolsFromPrmtop(prmtop: str) -> list:
     """
-    Get atomic symbols from AMBER prmtop file.
+    Get atomic symbols from AMBER prmtop file. Symbols are only read once
+    for each version of the file.
 
     Args:
         prmtop (str): Path to AMBER prmtop file.
@@ -644,6 +962,9 @@ def getSymbolsFromPrmtop(prmtop: str) -> list:
     Returns:
         list: List of atomic symbols.
     """
+    key = getPrmtopKey(prmtop)
+    if key in prmtopSymbols:
+        return list(prmtopSymbols[key])
     elements = loadElements()
     elementsByNumber = {}
     for element in elements.keys():
@@ -672,6 +993,7 @@ def getSymbolsFromPrmtop(prmtop: str) -> list:
             symbols.append(elementsByNumber[int(number)])
         else:
             symbols.append("X")
+    prmtopSymbols[key] = list(symbols)
     return symbols
 
 
@@ -687,6 +1009,11 @@ def getXYZs(folder: str | Path = ".") -> list:
     """
     if type(folder) == str:
         folder = Path(folder)
+    store = getGeometryStorePath(folder)
+    if store.is_file():
+        with np.load(store) as f:
+            nframes = f["coords"].shape[0]
+        return sorted([folder / f"{i}.xyz" for i in range(1, nframes + 1)])
     xyzs = []
     for f in folder.iterdir():
         if f.name.endswith(".xyz") and not f.name.startswith("esp"):
@@ -694,6 +1021,99 @@ def getXYZs(folder: str | Path = ".") -> list:
     return sorted(xyzs)
 
 
+def getGeometryStorePath(folder: str | Path = ".") -> Path:
+    """
+    Get the path of the geometry store in a folder.
+
+    Args:
+        folder (str or Path, optional): Path to folder. Defaults to current directory.
+
+    Returns:
+        Path: Path to the geometry store.
+    """
+    return Path(folder) / "geometries.npz"
+
+
+def writeGeometries(
+    coords: np.ndarray, symbols: list, folder: str | Path = "."
+) -> Path:
+    """
+    Write a set of geometries to the geometry store of a folder, replacing
+    any geometries already stored there. Geometry i (0-indexed) is referred
+    to as {i+1}.xyz, just as if it had been written out as an XYZ file.
+
+    Args:
+        coords (np.ndarray): Coordinates in Angstrom, one row of length
+            3 * natoms per geometry.
+        symbols (list): Atomic symbols, shared by all geometries.
+        folder (str or Path, optional): Path to folder. Defaults to current directory.
+
+    Returns:
+        Path: Path to the geometry store.
+    """
+    symbols = np.asarray(symbols, dtype=str)
+    coords = np.asarray(coords, dtype=np.float32).reshape(-1, 3 * len(symbols))
+    store = getGeometryStorePath(folder)
+    with open(store, "wb") as f:
+        np.savez(f, coords=coords, symbols=symbols)
+    return store
+
+
+def readGeometries(folder: str | Path = ".") -> tuple[dict, np.ndarray]:
+    """
+    Read all geometries in a folder. Geometries are read from the folder's
+    geometry store if it has one, or from its XYZ files otherwise.
+
+    Args:
+        folder (str or Path, optional): Path to folder. Defaults to current directory.
+
+    Returns:
+        tuple: Dictionary mapping geometry names (XYZ file names without the
+            extension) to flattened coordinates, and the atomic symbols.
+    """
+    store = getGeometryStorePath(folder)
+    if store.is_file():
+        with np.load(store) as f:
+            coords = f["coords"]
+            symbols = f["symbols"]
+        geometries = {str(i + 1): coords[i] for i in range(coords.shape[0])}
+        return geometries, symbols
+    geometries = {}
+    symbols = np.asarray([], dtype=str)
+    for xyz in getXYZs(folder):
+        if len(symbols) == 0:
+            geometries[getName(xyz)], symbols = readXYZ(xyz, readSymbols=True)
+        else:
+            geometries[getName(xyz)] = readXYZ(xyz)
+    return geometries, symbols
+
+
+def writeXYZs(xyzs: list | None = None, folder: str | Path = ".") -> list:
+    """
+    Write out individual XYZ files from the geometry store of a folder, for
+    backends which need the coordinates on disk. Existing XYZ files are left
+    alone.
+
+    Args:
+        xyzs (list, optional): Names of the XYZ files to write. Defaults to
+            every geometry in the folder.
+        folder (str or Path, optional): Path to folder. Defaults to current directory.
+
+    Returns:
+        list: Paths of the XYZ files.
+    """
+    folder = Path(folder)
+    if xyzs is None:
+        xyzs = getXYZs(folder)
+    xyzs = [folder / Path(xyz).name for xyz in xyzs]
+    missing = [xyz for xyz in xyzs if not xyz.is_file()]
+    if len(missing) > 0 and getGeometryStorePath(folder).is_file():
+        geometries, symbols = readGeometries(folder)
+        for xyz in missing:
+            writeXYZ(geometries[getName(xyz)], symbols, xyz)
+    return xyzs
+
+
 # Separate file name from extension
 def getName(f: str | Path) -> str:
     """
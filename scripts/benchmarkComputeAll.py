@@ -0,0 +1,80 @@
+import os
+import sys
+from time import perf_counter
+
+import numpy as np
+
+from ff_optimizer.active_learning import ActiveLearningModel
+
+# Benchmark of the sharded, multi-process energy and force evaluation used
+# by ActiveLearningModel.computeAll against the original serial loop over
+# prmtops. Geometries are read from an xyz trajectory and perturbed to reach
+# the requested number of frames; every model uses the same prmtop. Both
+# paths must give the same energies and forces. Requires AmberTools (sander).
+#
+# Usage: python benchmarkComputeAll.py [prmtop] [xyz] [nframes] [nmodels]
+
+home = os.path.join(os.path.dirname(__file__), "..", "tests", "active_learning")
+
+
+def computeAllSerial(model, geometries, prmtops):
+    allEnergies = []
+    allForces = []
+    for prmtop in prmtops:
+        results = model.computeEnergyForce(geometries, prmtop)
+        allEnergies.append([result[0] for result in results])
+        allForces.append([result[1] for result in results])
+    return (
+        np.asarray(allEnergies, dtype=np.float32),
+        np.asarray(allForces, dtype=np.float32),
+    )
+
+
+def makeGeometries(xyz, nframes, seed=0):
+    # Only the first frame is used
+    with open(xyz, "r") as f:
+        natoms = int(f.readline().split()[0])
+    coords = np.loadtxt(xyz, usecols=(1, 2, 3), skiprows=2, max_rows=natoms)
+    coords = coords.flatten()
+    rng = np.random.default_rng(seed)
+    return list(coords + rng.normal(0, 0.02, (nframes, coords.shape[0])))
+
+
+def makeModel():
+    # computeAll only needs the number of evaluation workers
+    model = ActiveLearningModel.__new__(ActiveLearningModel)
+    model.evalWorkers = os.cpu_count()
+    return model
+
+
+if __name__ == "__main__":
+    prmtop = os.path.join(home, "amber.prmtop")
+    xyz = os.path.join(home, "coords.xyz")
+    nframes = 2000
+    nmodels = 5
+    if len(sys.argv) > 1:
+        prmtop = sys.argv[1]
+    if len(sys.argv) > 2:
+        xyz = sys.argv[2]
+    if len(sys.argv) > 3:
+        nframes = int(sys.argv[3])
+    if len(sys.argv) > 4:
+        nmodels = int(sys.argv[4])
+    geometries = makeGeometries(xyz, nframes)
+    prmtops = [prmtop] * nmodels
+    model = makeModel()
+    start = perf_counter()
+    serialEnergies, serialForces = computeAllSerial(model, geometries, prmtops)
+    serialTime = perf_counter() - start
+    start = perf_counter()
+    energies, forces = model.computeAll(geometries, prmtops)
+    poolTime = perf_counter() - start
+    if not np.allclose(serialEnergies, energies) or not np.allclose(
+        serialForces, forces
+    ):
+        raise RuntimeError("Energies or forces differ between serial and pool")
+    print(f"{nmodels} models, {nframes} frames, {len(geometries[0]) // 3} atoms")
+    print(f"{model.evalWorkers} workers")
+    print(f"Serial: {serialTime:8.3f} s")
+    print(f"Pool:   {poolTime:8.3f} s")
+    print(f"Speedup: {serialTime / poolTime:7.2f}x")
@@ -0,0 +1,110 @@
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+import numpy as np
+
+from ff_optimizer.qmengine import QMEngine
+
+# Benchmark of the qdata.txt/all.mdcrd writer used by QMEngine.writeFBdata
+# against the original element-by-element string concatenation, on a
+# 1000-frame, 50-atom dataset with ESP grids. Both writers must produce
+# byte-identical files.
+
+
+def writeFBdataLoop(energies, grads, coords, espXYZs=None, esps=None):
+    with open("qdata.txt", "w") as f:
+        for i in range(len(energies)):
+            f.write(f"JOB {i+1}\n")
+            coordLine = "COORDS "
+            for coord in coords[i]:
+                coordLine = coordLine + str(round(float(coord), 5)) + " "
+            gradLine = "FORCES "
+            for grad in grads[i]:
+                gradLine = gradLine + str(round(float(grad), 8)) + " "
+            f.write(coordLine + "\n")
+            f.write(f"ENERGY {str(round(float(energies[i]),7))}\n")
+            f.write(gradLine + "\n")
+            if espXYZs is not None:
+                espXYZLine = "ESPXYZ "
+                for xyz in espXYZs[i]:
+                    espXYZLine = espXYZLine + str(round(float(xyz), 6)) + " "
+                f.write(espXYZLine + "\n")
+                espLine = "ESPVAL "
+                for val in esps[i]:
+                    espLine = espLine + str(round(float(val), 6)) + " "
+                f.write(espLine + "\n\n")
+            else:
+                f.write("\n")
+
+    with open("all.mdcrd", "w") as f:
+        f.write("Converted from xyz by QMEngine\n")
+        for i in range(len(energies)):
+            tokenCounter = 1
+            for coord in coords[i]:
+                f.write("%8.3f" % float(coord))
+                if tokenCounter == 10:
+                    f.write("\n")
+                    tokenCounter = 1
+                else:
+                    tokenCounter += 1
+            if tokenCounter != 1:
+                f.write("\n")
+
+
+def writeFBdataBulk(energies, grads, coords, espXYZs=None, esps=None):
+    # writeFBdata doesn't touch any engine state
+    QMEngine.writeFBdata(None, energies, grads, coords, espXYZs, esps)
+
+
+def makeData(nframes, natoms, nesp, seed=0):
+    rng = np.random.default_rng(seed)
+    coords = list(rng.normal(0, 3, (nframes, 3 * natoms)).astype(np.float32))
+    grads = list(rng.normal(0, 0.05, (nframes, 3 * natoms)))
+    energies = list(rng.normal(-450, 0.01, nframes))
+    # readEsp returns the ESP data as strings
+    espXYZs = [
+        [f"{x:.6f}" for x in frame] for frame in rng.normal(0, 5, (nframes, 3 * nesp))
+    ]
+    esps = [
+        [f"{x:.6f}" for x in frame] for frame in rng.normal(0, 0.1, (nframes, nesp))
+    ]
+    return energies, grads, coords, espXYZs, esps
+
+
+def timeWriter(writer, data, dest):
+    cwd = os.getcwd()
+    os.makedirs(dest)
+    os.chdir(dest)
+    start = perf_counter()
+    writer(*data)
+    elapsed = perf_counter() - start
+    os.chdir(cwd)
+    return elapsed
+
+
+def readBytes(folder, name):
+    with open(os.path.join(folder, name), "rb") as f:
+        return f.read()
+
+
+if __name__ == "__main__":
+    nframes = 1000
+    natoms = 50
+    nesp = 500
+    if len(sys.argv) > 1:
+        nesp = int(sys.argv[1])
+    data = makeData(nframes, natoms, nesp)
+    with tempfile.TemporaryDirectory() as tmp:
+        loop = os.path.join(tmp, "loop")
+        bulk = os.path.join(tmp, "bulk")
+        loopTime = timeWriter(writeFBdataLoop, data, loop)
+        bulkTime = timeWriter(writeFBdataBulk, data, bulk)
+        for name in ["qdata.txt", "all.mdcrd"]:
+            if readBytes(loop, name) != readBytes(bulk, name):
+                raise RuntimeError(f"{name} differs between writers")
+    print(f"{nframes} frames, {natoms} atoms, {nesp} ESP points per frame")
+    print(f"Loop writer: {loopTime:8.3f} s")
+    print(f"Bulk writer: {bulkTime:8.3f} s")
+    print(f"Speedup:     {loopTime / bulkTime:8.2f}x")
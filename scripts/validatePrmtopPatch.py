@@ -0,0 +1,139 @@
+import os
+import re
+import sys
+from pathlib import Path
+from shutil import copytree, rmtree
+
+import numpy as np
+from parmed.amber import AmberParm
+
+from ff_optimizer import prmtoppatch
+from ff_optimizer.leapcache import getLeapOutputs, runTleap
+
+# Validation of prmtop patching against tleap. The example is built with
+# tleap, then its frcmod parameters and mol2 charges are perturbed and the
+# perturbed force field is both built with tleap and patched into the first
+# build. Every bond, angle, dihedral, charge, and Lennard-Jones coefficient
+# of the two prmtops must agree. Requires AmberTools (tleap).
+#
+# Usage: python validatePrmtopPatch.py [example 1_opt folder] [scale]
+
+home = Path(__file__).parent.parent.absolute()
+# Which values of each frcmod section are perturbed
+perturbed = {
+    "BOND": [0, 1],
+    "ANGL": [0, 1],
+    "DIHE": [1],
+    "IMPR": [0],
+    "NONB": [0, 1],
+}
+
+
+def perturbFrcmod(frcmod, rng, scale):
+    with open(frcmod, "r") as f:
+        lines = f.readlines()
+    section = None
+    for i, line in enumerate(lines[1:], 1):
+        if len(line.strip()) == 0:
+            section = None
+            continue
+        if section is None:
+            section = line[:4]
+            continue
+        if section not in perturbed:
+            continue
+        if section == "NONB":
+            width = line.index(line.split()[0]) + len(line.split()[0])
+        else:
+            width = prmtoppatch.typeWidths[section]
+        # Keep the columns of the original line, which tleap reads
+        tokens = list(re.finditer(r"\S+", line[width:]))
+        for j in reversed(perturbed[section]):
+            start = width + tokens[j].start()
+            end = width + tokens[j].end()
+            value = float(tokens[j].group()) * (1 + rng.normal(0, scale))
+            value = f"{value:.5f}"
+            start = max(end - len(value), len(line[:start].rstrip()) + 1)
+            lines[i] = lines[i][:start] + value + lines[i][end:]
+    with open(frcmod, "w") as f:
+        f.writelines(lines)
+
+
+def perturbMol2(mol2, rng, scale):
+    with open(mol2, "r") as f:
+        lines = f.readlines()
+    section = None
+    for i, line in enumerate(lines):
+        if line.startswith("@<TRIPOS>"):
+            section = line.strip()
+            continue
+        splitLine = line.split()
+        if section == "@<TRIPOS>ATOM" and len(splitLine) > 8:
+            splitLine[8] = f"{float(splitLine[8]) + rng.normal(0, scale):.6f}"
+            lines[i] = " ".join(splitLine) + "\n"
+    with open(mol2, "w") as f:
+        f.writelines(lines)
+
+
+def compare(parm1, parm2):
+    errors = []
+    for name, attrs in [
+        ("bonds", ["k", "req"]),
+        ("angles", ["k", "theteq"]),
+        ("dihedrals", ["phi_k", "per", "phase"]),
+    ]:
+        terms1 = getattr(parm1, name)
+        terms2 = getattr(parm2, name)
+        if len(terms1) != len(terms2):
+            errors.append(f"Different numbers of {name}")
+            continue
+        for t1, t2 in zip(terms1, terms2):
+            for attr in attrs:
+                if not np.isclose(getattr(t1.type, attr), getattr(t2.type, attr)):
+                    errors.append(f"{name} {attr}")
+    for key in ["CHARGE", "LENNARD_JONES_ACOEF", "LENNARD_JONES_BCOEF"]:
+        if not np.allclose(parm1.parm_data[key], parm2.parm_data[key], rtol=1e-5):
+            errors.append(key)
+    return sorted(set(errors))
+
+
+if __name__ == "__main__":
+    example = home / "examples" / "demo" / "1_opt"
+    scale = 0.05
+    if len(sys.argv) > 1:
+        example = Path(sys.argv[1]).absolute()
+    if len(sys.argv) > 2:
+        scale = float(sys.argv[2])
+    work = Path("validatePrmtopPatch").absolute()
+    if work.is_dir():
+        rmtree(work)
+    rng = np.random.default_rng(0)
+
+    copytree(example, work / "template")
+    os.chdir(work / "template")
+    runTleap()
+    template = prmtoppatch.PrmtopTemplate()
+    prmtop = getLeapOutputs("setup.leap")[0]
+
+    os.chdir(work)
+    copytree("template", "tleap")
+    os.chdir("tleap")
+    frcmods, mol2s, _ = prmtoppatch.getLeapInputs("setup.leap")
+    for frcmod in frcmods:
+        perturbFrcmod(frcmod, rng, scale)
+    for mol2 in mol2s:
+        perturbMol2(mol2, rng, scale)
+    os.chdir(work)
+    copytree("tleap", "patch")
+    os.chdir("tleap")
+    runTleap()
+    os.chdir(work / "patch")
+    template.apply()
+
+    errors = compare(
+        AmberParm(str(work / "tleap" / prmtop)), AmberParm(str(work / "patch" / prmtop))
+    )
+    if len(errors) > 0:
+        print("Patched prmtop differs from tleap in: " + ", ".join(errors))
+        sys.exit(1)
+    print(f"Patched prmtop of {example} matches tleap")
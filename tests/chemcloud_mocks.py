@@ -1,3 +1,4 @@
+import asyncio
 from pathlib import Path
 
 from qcio import *
@@ -184,6 +185,18 @@ class MockFutureResult:
         return cls(outputs)
 
 
+# Makes a stand-in for CCClient which submits calculations with computeAsync
+def mockClient(computeAsync):
+    class MockClient:
+        def compute_async(self, *args, **kwargs):
+            return computeAsync(*args, **kwargs)
+
+        def run(self, coroutine):
+            return asyncio.run(coroutine)
+
+    return MockClient
+
+
 def patcher(monkeypatch, target, outputs):
 
     def mockCompute(
@@ -218,4 +231,12 @@ def patcher(monkeypatch, target, outputs):
             result = programOutputs
         return result
 
-    monkeypatch.setattr(target, "compute", mockCompute)
+    async def mockComputeAsync(*args, **kwargs):
+        return mockCompute(*args, **kwargs)
+
+    if hasattr(target, "compute"):
+        monkeypatch.setattr(target, "compute", mockCompute)
+    if hasattr(target, "compute_async"):
+        monkeypatch.setattr(target, "compute_async", mockComputeAsync)
+    if hasattr(target, "CCClient"):
+        monkeypatch.setattr(target, "CCClient", mockClient(mockComputeAsync))
@@ -1,5 +1,7 @@
 # content of conftest.py
 
+from pathlib import Path
+
 import pytest
 
 
@@ -84,3 +86,12 @@ def pytest_collection_modifyitems(config, items):
         for item in items:
             if item not in items2:
                 item.add_marker(debug)
+
+
+@pytest.fixture(autouse=True)
+def removeJournals():
+    # OptEngines write cycle journals into the test data folders, and a stale
+    # journal changes where the next run's OptEngine restarts
+    yield
+    for path in Path(__file__).parent.rglob("journal.jsonl"):
+        path.unlink()
@@ -0,0 +1,32 @@
+import openmm as mm
+from openmm import app, unit
+
+reportInterval = 40
+# Records how often the system is built
+created = []
+
+
+def createSimulation(prmtop, platform):
+    system = prmtop.createSystem(
+        nonbondedMethod=app.NoCutoff,
+        nonbondedCutoff=2 * unit.nanometer,
+        removeCMMotion=True,
+        constraints=None,
+        rigidWater=True,
+    )
+    integrator = mm.VerletIntegrator(0.0002 * unit.picoseconds)
+    integrator.setConstraintTolerance(1e-05)
+    force = mm.CustomExternalForce("k*max(0, r-0.563)^2; r=sqrt(x*x+y*y+z*z)")
+    force.addGlobalParameter("k", 10.0 * unit.kilocalories_per_mole / unit.angstroms**2)
+    system.addForce(force)
+    for i in range(system.getNumParticles()):
+        force.addParticle(i, [])
+    system.setParticleMass(0, 0)
+    created.append(platform.getName())
+    return app.Simulation(prmtop.topology, system, integrator, platform)
+
+
+def sample(simulation, reporter):
+    simulation.minimizeEnergy(maxIterations=10)
+    simulation.reporters.append(reporter)
+    simulation.step(320)
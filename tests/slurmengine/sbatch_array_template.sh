@@ -0,0 +1,9 @@
+#!/bin/bash
+
+#SBATCH -t 2:00:00
+#SBATCH -J FB_ref_gradient_JOBID
+#SBATCH --mem=16GB
+cd $SCRATCH
+
+ml TeraChem
+terachem TCTEMPLATE > tc_JOBID.out
@@ -0,0 +1,89 @@
+"""
+Stub TeraChem server for testing the TCServerEngine, and a client for it.
+
+The server is run as a script with the port to listen on and a folder of
+TeraChem outputs. Each request is a JSON line with the job ID and keywords,
+and the reply is the output tc_{id}.out from the folder, or
+tc_{id}_success.out if the backup settings (which set maxit) are used and
+it exists. Like a TeraChem server, it serves one client at a time, and other
+clients wait until that client disconnects. Every job is logged to stdout.
+"""
+
+import json
+import os
+import socket
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+
+def serve(connection, outputs):
+    with connection, connection.makefile("rw") as f:
+        for line in f:
+            request = json.loads(line)
+            jobID = request["id"]
+            backup = "maxit" in request["keywords"]
+            out = outputs / f"tc_{jobID}.out"
+            if backup and (outputs / f"tc_{jobID}_success.out").is_file():
+                out = outputs / f"tc_{jobID}_success.out"
+            with open(out, "r") as g:
+                stdout = g.read()
+            print(f"job {jobID} {'backup' if backup else 'primary'}", flush=True)
+            reply = {
+                "success": "Job finished" in stdout,
+                "stdout": stdout,
+                "pid": os.getpid(),
+            }
+            f.write(json.dumps(reply) + "\n")
+            f.flush()
+
+
+class StubClient:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.socket = None
+        self.file = None
+
+    def connect(self):
+        self.socket = socket.create_connection((self.host, self.port))
+        self.file = self.socket.makefile("rw")
+
+    def disconnect(self):
+        self.file.close()
+        self.socket.close()
+
+    def compute(self, programInput):
+        request = {"id": programInput.extras["id"], "keywords": programInput.keywords}
+        self.file.write(json.dumps(request) + "\n")
+        self.file.flush()
+        line = self.file.readline()
+        if line == "":
+            raise ConnectionError("Stub server closed the connection")
+        reply = json.loads(line)
+        return SimpleNamespace(
+            input_data=programInput,
+            success=reply["success"],
+            stdout=reply["stdout"],
+            results=SimpleNamespace(files={}),
+            pid=reply["pid"],
+        )
+
+
+def connectStub(host, port):
+    client = StubClient(host, port)
+    client.connect()
+    return client
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1])
+    outputs = Path(sys.argv[2])
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(("localhost", port))
+    server.listen()
+    print(f"device {os.environ.get('CUDA_VISIBLE_DEVICES')}", flush=True)
+    while True:
+        connection, address = server.accept()
+        serve(connection, outputs)
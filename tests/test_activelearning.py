@@ -2,12 +2,13 @@ import os
 import random
 from copy import deepcopy
 from pathlib import Path
-from shutil import copyfile, rmtree
+from shutil import copyfile, copytree, rmtree
+from types import SimpleNamespace
 
 import numpy as np
 import pytest
 
-from ff_optimizer import active_learning, model, optengine, qmengine, utils
+from ff_optimizer import active_learning, model, optengine, qmengine, selection, utils
 
 from . import checkUtils
 from .test_inputs import getDefaults
@@ -43,6 +44,8 @@ def monkeyInit(self, inp):
     self.validGeometries = None
     self.restartCycle = 0
     self.nthreads = min(os.cpu_count(), self.nmodels)
+    self.evalWorkers = os.cpu_count()
+    self.strategy = selection.MixedSelection()
 
 
 @pytest.mark.amber
@@ -97,6 +100,12 @@ def test_computeEnergyForceAll(monkeypatch):
         checkUtils.checkArrays(results[i][1], forces[i])
 
 
+def copyFixture(name, tmp_path):
+    # Geometries are converted into stores in place, so work on a copy
+    copytree(Path(__file__).parent / "active_learning" / name, tmp_path / name)
+    os.chdir(tmp_path / name)
+
+
 def dontRemove(f):
     if not os.path.isfile(f):
         raise RuntimeError(f"File {f} not found")
@@ -125,10 +134,8 @@ def test_collectAll(monkeypatch):
     assert test3 == 27
 
 
-def test_collectAll2(monkeypatch):
-    os.chdir(
-        os.path.join(os.path.dirname(__file__), "active_learning", "collectGeometries2")
-    )
+def test_collectAll2(monkeypatch, tmp_path):
+    copyFixture("collectGeometries2", tmp_path)
     monkeypatch.setattr(active_learning.ActiveLearningModel, "__init__", monkeyInit)
     monkeypatch.setattr(os, "remove", dontRemove)
     args = getDefaults()
@@ -186,6 +193,64 @@ def test_computeAll(monkeypatch):
     assert forces.shape == (3, 24, 18)
 
 
+class FakeSander:
+    # Energies and forces depend on the prmtop and the geometry, so shards
+    # placed in the wrong slot of the output arrays are caught
+    prmtop = None
+    positions = None
+
+    class setup:
+        def __init__(self, prmtop, positions, box, options):
+            FakeSander.prmtop = prmtop
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            FakeSander.prmtop = None
+
+    @staticmethod
+    def gas_input():
+        return None
+
+    @staticmethod
+    def set_positions(positions):
+        FakeSander.positions = np.asarray(positions)
+
+    @staticmethod
+    def energy_forces():
+        if FakeSander.prmtop is None:
+            raise RuntimeError("sander context is not set up")
+        scale = int(FakeSander.prmtop[3])
+        energy = SimpleNamespace(tot=scale * float(np.sum(FakeSander.positions)))
+        return energy, list(scale * FakeSander.positions)
+
+
+@pytest.mark.parametrize("evalWorkers", [1, 4])
+def test_computeAllShards(monkeypatch, evalWorkers):
+    monkeypatch.setattr(active_learning.ActiveLearningModel, "__init__", monkeyInit)
+    monkeypatch.setattr(active_learning, "sander", FakeSander, raising=False)
+    os.chdir(os.path.join(os.path.dirname(__file__), "active_learning"))
+    args = getDefaults()
+    model = active_learning.ActiveLearningModel(args)
+    model.evalWorkers = evalWorkers
+    rng = np.random.default_rng(0)
+    geometries = list(rng.normal(0, 2, (11, 18)).astype(np.float32))
+    prmtops = [f"prm{str(i)}.prmtop" for i in range(1, 4)]
+    tasks = model.getShards(geometries, prmtops)
+    energies, forces = model.computeAll(geometries, prmtops)
+    assert len(tasks) == 3 * (-(-evalWorkers // 3))
+    assert sum(len(task[3]) for task in tasks) == 3 * 11
+    assert energies.shape == (3, 11)
+    assert forces.shape == (3, 11, 18)
+    for k in range(3):
+        for i in range(11):
+            assert checkUtils.checkFloats(
+                energies[k, i], (k + 1) * np.sum(geometries[i]), 1e-4
+            )
+            assert checkUtils.checkArrays(forces[k, i], (k + 1) * geometries[i])
+
+
 def test_chooseGeometries3Models(monkeypatch):
     monkeypatch.setattr(active_learning.ActiveLearningModel, "__init__", monkeyInit)
     os.chdir(
@@ -248,14 +313,19 @@ def monkeyComputeAll(self, geometries, prmtops):
     for prmtop in prmtops:
         if not os.path.isfile(prmtop):
             raise RuntimeError(f"{prmtop} is missing!")
-    return [0], []
+    self.computed.append(len(geometries))
+    energies = np.zeros((len(prmtops), len(geometries)), dtype=np.float32)
+    forces = np.zeros(
+        (len(prmtops), len(geometries), len(geometries[0])), dtype=np.float32
+    )
+    return energies, forces
 
 
-def monkeyChooseGeometries(self, energies, forces, num):
-    return energies
+def monkeyChooseGeometries(self, energies, forces, num, geometries=None):
+    return [0]
 
 
-def test_doActiveLearning(monkeypatch):
+def test_doActiveLearning(monkeypatch, tmp_path):
     monkeypatch.setattr(active_learning.ActiveLearningModel, "__init__", monkeyInit)
     monkeypatch.setattr(
         active_learning.ActiveLearningModel, "computeAll", monkeyComputeAll
@@ -263,13 +333,12 @@ def test_doActiveLearning(monkeypatch):
     monkeypatch.setattr(
         active_learning.ActiveLearningModel, "chooseGeometries", monkeyChooseGeometries
     )
-    os.chdir(
-        os.path.join(os.path.dirname(__file__), "active_learning", "doActiveLearning")
-    )
+    copyFixture("doActiveLearning", tmp_path)
     args = getDefaults()
     args.activelearning = 3
     model = active_learning.ActiveLearningModel(args)
     model.prmtop = "amber.prmtop"
+    model.computed = []
     folders = ["train", "valid_1", "valid_2"]
     for i in range(1, 4):
         for j in range(1, 4):
@@ -280,51 +349,53 @@ def test_doActiveLearning(monkeypatch):
                 ),
             )
     model.doActiveLearning(7)
+    # All nine sets are evaluated together, once
+    assert model.computed == [9]
 
     refGeom = utils.readXYZ(os.path.join("ref", "1.xyz"))
-    testGeom = utils.readXYZ(
-        os.path.join("model_1", "2_sampling", "7_cycle_7", "train", "1.xyz")
-    )
+    testGeom = utils.readGeometries(
+        os.path.join("model_1", "2_sampling", "7_cycle_7", "train")
+    )[0]["1"]
     assert checkUtils.checkArrays(testGeom, refGeom)
-    testGeom = utils.readXYZ(
-        os.path.join("model_2", "2_sampling", "7_cycle_7", "valid_1", "1.xyz")
-    )
+    testGeom = utils.readGeometries(
+        os.path.join("model_2", "2_sampling", "7_cycle_7", "valid_1")
+    )[0]["1"]
     assert checkUtils.checkArrays(testGeom, refGeom)
-    testGeom = utils.readXYZ(
-        os.path.join("model_3", "2_sampling", "7_cycle_7", "valid_2", "1.xyz")
-    )
+    testGeom = utils.readGeometries(
+        os.path.join("model_3", "2_sampling", "7_cycle_7", "valid_2")
+    )[0]["1"]
     assert checkUtils.checkArrays(testGeom, refGeom)
 
     refGeom = utils.readXYZ(os.path.join("ref", "3.xyz"))
-    testGeom = utils.readXYZ(
-        os.path.join("model_2", "2_sampling", "7_cycle_7", "train", "1.xyz")
-    )
+    testGeom = utils.readGeometries(
+        os.path.join("model_2", "2_sampling", "7_cycle_7", "train")
+    )[0]["1"]
     assert checkUtils.checkArrays(testGeom, refGeom)
-    testGeom = utils.readXYZ(
-        os.path.join("model_3", "2_sampling", "7_cycle_7", "valid_1", "1.xyz")
-    )
+    testGeom = utils.readGeometries(
+        os.path.join("model_3", "2_sampling", "7_cycle_7", "valid_1")
+    )[0]["1"]
     assert checkUtils.checkArrays(testGeom, refGeom)
-    testGeom = utils.readXYZ(
-        os.path.join("model_1", "2_sampling", "7_cycle_7", "valid_2", "1.xyz")
-    )
+    testGeom = utils.readGeometries(
+        os.path.join("model_1", "2_sampling", "7_cycle_7", "valid_2")
+    )[0]["1"]
     assert checkUtils.checkArrays(testGeom, refGeom)
 
     refGeom = utils.readXYZ(os.path.join("ref", "2.xyz"))
-    testGeom = utils.readXYZ(
-        os.path.join("model_3", "2_sampling", "7_cycle_7", "train", "1.xyz")
-    )
+    testGeom = utils.readGeometries(
+        os.path.join("model_3", "2_sampling", "7_cycle_7", "train")
+    )[0]["1"]
     assert checkUtils.checkArrays(testGeom, refGeom)
-    testGeom = utils.readXYZ(
-        os.path.join("model_1", "2_sampling", "7_cycle_7", "valid_1", "1.xyz")
-    )
+    testGeom = utils.readGeometries(
+        os.path.join("model_1", "2_sampling", "7_cycle_7", "valid_1")
+    )[0]["1"]
     assert checkUtils.checkArrays(testGeom, refGeom)
-    testGeom = utils.readXYZ(
-        os.path.join("model_2", "2_sampling", "7_cycle_7", "valid_2", "1.xyz")
-    )
+    testGeom = utils.readGeometries(
+        os.path.join("model_2", "2_sampling", "7_cycle_7", "valid_2")
+    )[0]["1"]
     assert checkUtils.checkArrays(testGeom, refGeom)
 
 
-def test_doActiveLearning2(monkeypatch):
+def test_doActiveLearning2(monkeypatch, tmp_path):
     monkeypatch.setattr(active_learning.ActiveLearningModel, "__init__", monkeyInit)
     monkeypatch.setattr(
         active_learning.ActiveLearningModel, "computeAll", monkeyComputeAll
@@ -333,31 +404,33 @@ def test_doActiveLearning2(monkeypatch):
         active_learning.ActiveLearningModel, "chooseGeometries", monkeyChooseGeometries
     )
     monkeypatch.setattr(os, "remove", dontRemove)
-    os.chdir(
-        os.path.join(os.path.dirname(__file__), "active_learning", "doActiveLearning2")
-    )
+    copyFixture("doActiveLearning2", tmp_path)
     args = getDefaults()
     args.activelearning = 2
     model = active_learning.ActiveLearningModel(args)
     model.prmtop = "water.prmtop"
+    model.computed = []
     model.doActiveLearning(7)
 
     ntrain1 = len(
-        os.listdir(os.path.join("model_1", "2_sampling", "7_cycle_7", "train"))
+        utils.getXYZs(os.path.join("model_1", "2_sampling", "7_cycle_7", "train"))
     )
     ntrain2 = len(
-        os.listdir(os.path.join("model_2", "2_sampling", "7_cycle_7", "train"))
+        utils.getXYZs(os.path.join("model_2", "2_sampling", "7_cycle_7", "train"))
     )
     nvalid1 = len(
-        os.listdir(os.path.join("model_1", "2_sampling", "7_cycle_7", "valid_1"))
+        utils.getXYZs(os.path.join("model_1", "2_sampling", "7_cycle_7", "valid_1"))
     )
     nvalid2 = len(
-        os.listdir(os.path.join("model_2", "2_sampling", "7_cycle_7", "valid_1"))
+        utils.getXYZs(os.path.join("model_2", "2_sampling", "7_cycle_7", "valid_1"))
     )
+    # chooseGeometries is mocked to pick a single geometry for every set
     assert ntrain1 == 1
     assert ntrain2 == 1
-    assert nvalid1 == 2
-    assert nvalid2 == 2
+    assert nvalid1 == 1
+    assert nvalid2 == 1
+    assert model.trainGeometries == 1
+    assert model.validGeometries == 2
 
 
 def monkeyInitModel(self, args):
@@ -520,6 +593,8 @@ def monkeyALInit(self, args):
         self.models[-1].optEngine.nvalids = 1
     self.restartCycle = 0
     self.nthreads = min(os.cpu_count(), self.nmodels)
+    self.evalWorkers = os.cpu_count()
+    self.strategy = selection.MixedSelection()
 
 
 def test_doParameterOptimization(monkeypatch):
@@ -1,6 +1,6 @@
 import os
 from pathlib import Path
-from shutil import copyfile, rmtree, which
+from shutil import copyfile, copytree, ignore_patterns, rmtree, which
 
 import GPUtil
 import pytest
@@ -118,10 +118,9 @@ def test_sample(monkeypatch):
     os.chdir("train")
     mmEngine.sample([928], "md.in")
     os.chdir("..")
+    geometries, _ = utils.readGeometries("train")
     for i in range(1, 11):
-        testXyz = loadtxt(
-            os.path.join("train", f"{str(i)}.xyz"), skiprows=2, usecols=(1, 2, 3)
-        )
+        testXyz = geometries[str(i)].reshape(-1, 3)
         refXyz = loadtxt(
             os.path.join("ref", f"{str(i)}.xyz"), skiprows=2, usecols=(1, 2, 3)
         )
@@ -150,12 +149,44 @@ def test_sample_conformers(monkeypatch):
     os.chdir("valid_1")
     mmEngine.sample([928, 135, 253], "md.in")
     os.chdir("..")
+    geometries, _ = utils.readGeometries("valid_1")
     for i in range(1, 31):
-        testXyz = loadtxt(
-            os.path.join("valid_1", f"{str(i)}.xyz"), skiprows=2, usecols=(1, 2, 3)
-        )
+        testXyz = geometries[str(i)].reshape(-1, 3)
         refXyz = loadtxt(
             os.path.join("ref", f"{str(i)}.xyz"), skiprows=2, usecols=(1, 2, 3)
         )
         assert checkUtils.checkArrays(testXyz, refXyz)
     # rmtree("valid_1")
+
+
+def test_sample_parallel(monkeypatch, tmp_path):
+    inp = getDefaults()
+    inp.heatCounter = 1
+    inp.mmworkers = 3
+    monkeypatch.setattr(mmengine.MMEngine, "getIndices", monkeyGetIndices)
+    monkeypatch.setattr(mmengine.ExternalAmberEngine, "runSander", monkeySander)
+    # Sample in a copy, so the tracked valid_1 fixtures are left alone
+    src = Path(__file__).parent.absolute() / "mmengine" / "sample_conformers"
+    copytree(src, tmp_path / "sample_conformers", ignore=ignore_patterns("valid_1"))
+    os.chdir(tmp_path / "sample_conformers")
+    inp.dynamicsdir = src.parent
+    mmEngine = mmengine.ExternalAmberEngine(inp)
+    mmEngine.prmtop = "water.prmtop"
+    mmEngine.symbols = utils.getSymbolsFromPrmtop("water.prmtop")
+    os.mkdir("valid_1")
+    copyfile("928.rst7", os.path.join("valid_1", "928.rst7"))
+    copyfile("135.rst7", os.path.join("valid_1", "135.rst7"))
+    copyfile("253.rst7", os.path.join("valid_1", "253.rst7"))
+
+    os.chdir("valid_1")
+    mmEngine.sample([928, 135, 253], "md.in")
+    os.chdir("..")
+    # XYZ numbering must follow the order of frames, not completion order
+    geometries, _ = utils.readGeometries("valid_1")
+    for i in range(1, 31):
+        testXyz = geometries[str(i)].reshape(-1, 3)
+        refXyz = loadtxt(
+            os.path.join("ref", f"{str(i)}.xyz"), skiprows=2, usecols=(1, 2, 3)
+        )
+        assert checkUtils.checkArrays(testXyz, refXyz)
+    assert not os.path.isfile(os.path.join("valid_1", "MMFinished.txt"))
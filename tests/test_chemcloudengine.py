@@ -1,11 +1,13 @@
+import asyncio
 import os
 import pytest
 from pathlib import Path
+from shutil import rmtree
 
 from qcio import ProgramInput, ProgramOutput, Provenance, Structure
 from qcparse import parse
 
-from ff_optimizer import qmengine
+from ff_optimizer import qmengine, utils
 
 from . import checkUtils
 from . import chemcloud_mocks as ccm
@@ -103,25 +105,36 @@ def test_initResp():
     assert chemcloudEngine.backupKeywords["resp"] == "yes"
 
 
+def monkeyComputeAsync(calls):
+    # Jobs 3, 6, and 9 fail unless run with the backup settings
+    async def computeAsync(program, programInputs, collect_files=False):
+        outputs = []
+        for inp in programInputs:
+            jobID = inp.extras["id"]
+            useBackup = "threall" in inp.keywords.keys()
+            calls.append((jobID, useBackup))
+            if useBackup and int(jobID) % 3 == 0:
+                outputs.append(
+                    ccm.programOutputFromTCout(f"tc_{jobID}_success.out", inp)
+                )
+            else:
+                outputs.append(ccm.programOutputFromTCout(f"tc_{jobID}.out", inp))
+        return outputs
+
+    return computeAsync
+
+
 def test_getQMRefData(monkeypatch):
     os.chdir(os.path.dirname(__file__))
     inp = getDefaults()
     inp.tctemplate = "qmengine/tc.in"
     inp.tctemplate_backup = "qmengine/tc_backup.in"
     inp.sampledir = Path("")
+    inp.batchsize = 4
     chemcloudEngine = qmengine.ChemcloudEngine(inp)
     calcDir = Path("chemcloudengine")
     xyzs = [f"{i}.xyz" for i in range(1, 11)]
-
-    def monkeyRunJobs(self, xyzs, useBackup=False):
-        refXyzs = ["3.xyz", "6.xyz", "9.xyz"]
-        if "1.xyz" in xyzs:
-            assert len(xyzs) == 10
-            assert not useBackup
-            return refXyzs
-        else:
-            assert checkUtils.checkLists(refXyzs, xyzs)
-            assert useBackup
+    calls = []
 
     def monkeyRead(*args):
         return [], [], [], [], []
@@ -129,11 +142,119 @@ def test_getQMRefData(monkeypatch):
     def monkeyWrite(*args):
         pass
 
-    monkeypatch.setattr(qmengine.ChemcloudEngine, "runJobs", monkeyRunJobs)
+    monkeypatch.setattr(qmengine, "CCClient", ccm.mockClient(monkeyComputeAsync(calls)))
+    monkeypatch.setattr(qmengine.ChemcloudEngine, "writeResult", monkeyWrite)
     monkeypatch.setattr(qmengine.QMEngine, "readQMRefData", monkeyRead)
     monkeypatch.setattr(qmengine.QMEngine, "writeFBdata", monkeyWrite)
     os.chdir(calcDir)
     chemcloudEngine.getQMRefData(xyzs)
+    assert sorted([int(jobID) for jobID, useBackup in calls if not useBackup]) == list(
+        range(1, 11)
+    )
+    assert sorted([int(jobID) for jobID, useBackup in calls if useBackup]) == [3, 6, 9]
+
+
+def test_getQMRefDataNoRetries(monkeypatch):
+    os.chdir(os.path.dirname(__file__))
+    inp = getDefaults()
+    inp.tctemplate = "qmengine/tc.in"
+    inp.tctemplate_backup = "qmengine/tc_backup.in"
+    inp.sampledir = Path("")
+    inp.retries = 0
+    chemcloudEngine = qmengine.ChemcloudEngine(inp)
+    xyzs = [f"{i}.xyz" for i in range(1, 11)]
+    calls = []
+    monkeypatch.setattr(qmengine, "CCClient", ccm.mockClient(monkeyComputeAsync(calls)))
+    monkeypatch.setattr(qmengine.ChemcloudEngine, "writeResult", monkeyWrite)
+    os.chdir("chemcloudengine")
+    crash = ""
+    try:
+        chemcloudEngine.getQMRefData(xyzs)
+    except RuntimeError as e:
+        crash = str(e)
+    assert crash.startswith("Job ids ['3', '6', '9']")
+    assert len(calls) == 10
+
+
+def test_getClient(monkeypatch):
+    os.chdir(os.path.dirname(__file__))
+    inp = getDefaults()
+    inp.tctemplate = "qmengine/tc.in"
+    inp.tctemplate_backup = "qmengine/tc_backup.in"
+    inp.sampledir = Path("")
+    ccEngine = qmengine.ChemcloudEngine(inp)
+    monkeypatch.setattr(qmengine, "CCClient", ccm.mockClient(None))
+    client = ccEngine.getClient()
+    assert ccEngine.getClient() is client
+    # Copies in worker processes make their own client
+    assert ccEngine.__getstate__()["client"] is None
+    assert ccEngine.client is client
+
+
+def test_runJobsAsyncBatches(monkeypatch):
+    os.chdir(os.path.dirname(__file__))
+    inp = getDefaults()
+    inp.tctemplate = "qmengine/tc.in"
+    inp.tctemplate_backup = "qmengine/tc_backup.in"
+    inp.sampledir = Path("")
+    inp.batchsize = 3
+    inp.batchesinflight = 2
+    ccEngine = qmengine.ChemcloudEngine(inp)
+    xyzs = [f"{i}.xyz" for i in range(1, 11)]
+    batchSizes = []
+    inFlight = [0, 0]
+
+    async def monkeyComputeAsync(program, programInputs, collect_files=False):
+        batchSizes.append(len(programInputs))
+        inFlight[0] += 1
+        inFlight[1] = max(inFlight)
+        await asyncio.sleep(0.01)
+        inFlight[0] -= 1
+        return [
+            ccm.programOutputFromTCout(f"tc_{inp.extras['id']}.out", inp)
+            for inp in programInputs
+        ]
+
+    monkeypatch.setattr(qmengine, "CCClient", ccm.mockClient(monkeyComputeAsync))
+    monkeypatch.setattr(qmengine, "dumpFailedJobs", monkeyDump)
+    monkeypatch.setattr(qmengine.ChemcloudEngine, "writeResult", monkeyWrite)
+    os.chdir("chemcloudengine")
+    failedXyzs = asyncio.run(ccEngine.runJobsAsync(xyzs, retries=2))
+    assert failedXyzs == ["3.xyz", "6.xyz", "9.xyz"]
+    # 4 batches of the primary settings, then each failure retried twice
+    assert sorted(batchSizes[:4]) == [1, 3, 3, 3]
+    assert sum(batchSizes[4:]) == 6
+    assert inFlight[1] == 2
+
+
+def test_createProgramInputsStore():
+    os.chdir(os.path.dirname(__file__))
+    inp = getDefaults()
+    inp.tctemplate = "qmengine/tc.in"
+    inp.tctemplate_backup = "qmengine/tc_backup.in"
+    inp.sampledir = Path("")
+    chemcloudEngine = qmengine.ChemcloudEngine(inp)
+    os.chdir("chemcloudengine")
+    xyzs = ["3.xyz", "6.xyz"]
+    refInputs = chemcloudEngine.createProgramInputs(xyzs)
+    geometries, symbols = utils.readGeometries()
+    os.mkdir("store")
+    os.chdir("store")
+    # Stored geometry i is named {i+1}.xyz
+    coords = [geometries["3"]] * 6
+    coords[5] = geometries["6"]
+    utils.writeGeometries(coords, symbols)
+    testInputs = chemcloudEngine.createProgramInputs(xyzs)
+    os.chdir("..")
+    rmtree("store")
+    for ref, test in zip(refInputs, testInputs):
+        assert ref.extras["id"] == test.extras["id"]
+        assert ref.structure.symbols == test.structure.symbols
+        assert ref.structure.charge == test.structure.charge
+        assert ref.structure.multiplicity == test.structure.multiplicity
+        assert checkUtils.checkArrays(
+            ref.structure.geometry, test.structure.geometry, 1e-5
+        )
 
 
 def test_createProgramInputsResp():
@@ -0,0 +1,137 @@
+import os
+import sys
+from pathlib import Path
+
+import forcebalance.forcefield
+import forcebalance.objective
+import forcebalance.optimizer
+import forcebalance.parser
+from forcebalance.output import logger
+
+from ff_optimizer import fbdriver, optengine
+
+from . import checkUtils
+from .test_inputs import getDefaults
+
+home = Path(__file__).parent.absolute() / "optengine"
+
+
+def getFakeOptimizer(log, chunkSize=1000, fail=False):
+    class FakeOptimizer:
+        def __init__(self, options, objective, forcefield):
+            pass
+
+        def Run(self):
+            # ForceBalance must not be able to wait for input
+            assert not sys.stdin.isatty()
+            assert sys.stdin.read() == ""
+            with open(log, "r") as f:
+                text = f.read()
+            for i in range(0, len(text), chunkSize):
+                logger.info(text[i : i + chunkSize])
+            if fail:
+                raise ValueError("Fake failure")
+
+    return FakeOptimizer
+
+
+def setupFakeForceBalance(monkeypatch, log, chunkSize=1000, fail=False):
+    monkeypatch.setattr(forcebalance.parser, "parse_inputs", lambda inp: ({}, []))
+    monkeypatch.setattr(forcebalance.forcefield, "FF", lambda options: None)
+    monkeypatch.setattr(forcebalance.objective, "Objective", lambda *args: None)
+    monkeypatch.setattr(
+        forcebalance.optimizer, "Optimizer", getFakeOptimizer(log, chunkSize, fail)
+    )
+
+
+def readOpt(filename):
+    parser = fbdriver.OptParser()
+    with open(filename, "r") as f:
+        for line in f:
+            parser.feed(line)
+    return parser.getResults()
+
+
+def test_runOpt(monkeypatch, tmp_path):
+    setupFakeForceBalance(monkeypatch, home / "success.out", 777)
+    os.chdir(tmp_path)
+    optParser, validParser = fbdriver.runForceBalance("opt_1.in", "opt_1.out")
+    status, results = optParser.getResults()
+    refStatus, refResults = readOpt(home / "success.out")
+    with open("opt_1.out", "r") as f:
+        out = f.read()
+    with open(home / "success.out", "r") as f:
+        ref = f.read()
+    assert out == ref
+    assert status == refStatus == 0
+    assert results["obj"] == refResults["obj"]
+    assert checkUtils.checkArrays(results["params"], refResults["params"])
+    assert checkUtils.checkArrays(results["initialParams"], refResults["initialParams"])
+    assert results["labels"] == refResults["labels"]
+    assert validParser.obj is None
+    # The log is no longer sent to the handler
+    assert not any(isinstance(h, fbdriver.ForceBalanceLog) for h in logger.handlers)
+
+
+def test_runValid(monkeypatch, tmp_path):
+    setupFakeForceBalance(monkeypatch, home / "valid.out", 50)
+    os.chdir(tmp_path)
+    optParser, validParser = fbdriver.runForceBalance(
+        "valid_1.in", "valid_1.out", "valid_1.err"
+    )
+    assert checkUtils.checkFloats(validParser.obj, 1.39869922, 0.000000001)
+    assert optParser.getResults()[0] == -1
+    assert os.path.getsize("valid_1.err") == 0
+
+
+def test_runFail(monkeypatch, tmp_path):
+    setupFakeForceBalance(monkeypatch, home / "validFail.out", fail=True)
+    os.chdir(tmp_path)
+    stdin = sys.stdin
+    optParser, validParser = fbdriver.runForceBalance(
+        "valid_1.in", "valid_1.out", "valid_1.err"
+    )
+    with open("valid_1.err", "r") as f:
+        err = f.read()
+    assert validParser.obj is None
+    assert "Fake failure" in err
+    assert sys.stdin is stdin
+
+
+def test_inProcessValid(monkeypatch, tmp_path):
+    setupFakeForceBalance(monkeypatch, home / "valid.out")
+    monkeypatch.setattr(
+        optengine.OptEngine, "__init__", lambda self, inp: self.setVariables(inp)
+    )
+    options = getDefaults()
+    options.fbinprocess = True
+    options.nvalids = 2
+    options.fbworkers = 2
+    optEngine = optengine.OptEngine(options)
+    optEngine.valid = []
+    os.chdir(tmp_path)
+    optEngine.runValid(1)
+    # Results don't come from the output files
+    assert os.path.isfile("valid_1_1.out")
+    assert list(optEngine.fbResults.keys()) == ["valid_1_1.out"]
+    assert checkUtils.checkFloats(optEngine.valid[0], 1.39869922, 0.000000001)
+    os.remove("valid_1_1.out")
+    assert checkUtils.checkFloats(
+        optEngine.readValid("valid_1_1.out"), 1.39869922, 0.000000001
+    )
+
+
+def test_forceBalanceLog(tmp_path):
+    parser = fbdriver.ValidParser()
+    with open(tmp_path / "log", "w") as f:
+        handler = fbdriver.ForceBalanceLog(f, [parser])
+        logger.addHandler(handler)
+        logger.info("\r#| \x1b[92m    Objective Function Single Point:")
+        logger.info(" 1.5     \x1b[0m |#\r\n")
+        logger.removeHandler(handler)
+        handler.close()
+    with open(tmp_path / "log", "r") as f:
+        lines = f.readlines()
+    assert parser.obj == 1.5
+    assert len(lines) == 2
+    assert "Single Point: 1.5" in lines[1]
@@ -1,6 +1,6 @@
 import os
 
-from ff_optimizer import ff_opt, model, optengine
+from ff_optimizer import ff_opt, journal, model, optengine
 
 from .test_inputs import getDefaults
 
@@ -66,6 +66,7 @@ def monkeyInitModel(self, inp):
 def monkeyInitOpt(self, inp):
     self.converged = False
     self.inp = inp
+    self.journal = journal.CycleJournal(os.path.join(inp.optdir, "journal.jsonl"))
     self.determineRestart()
 
 
@@ -0,0 +1,42 @@
+from ff_optimizer import journal
+
+
+def test_record(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    cycleJournal = journal.CycleJournal(path)
+    assert cycleJournal.get(1, "opt") is None
+    cycleJournal.record(1, "opt", obj=2.5, labels=["a", "b"], params=[1.0, 2.0])
+    cycleJournal.record(1, "valid", obj=3.5, time=10.0)
+    cycleJournal.record(1, "valid", obj=4.5, time=12.0)
+    loaded = journal.CycleJournal(path)
+    assert loaded.get(1, "opt")["labels"] == ["a", "b"]
+    assert loaded.get(1, "opt")["params"] == [1.0, 2.0]
+    # The latest record of a stage wins
+    assert loaded.get(1, "valid")["obj"] == 4.5
+    assert loaded.get(1, "valid")["time"] == 12.0
+    assert loaded.get(2, "valid") is None
+
+
+def test_partialRecord(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    cycleJournal = journal.CycleJournal(path)
+    cycleJournal.record(1, "opt", obj=2.5)
+    with open(path, "a") as f:
+        f.write('{"cycle": 1, "stage": "valid", "ob')
+    loaded = journal.CycleJournal(path)
+    assert loaded.get(1, "opt")["obj"] == 2.5
+    assert loaded.get(1, "valid") is None
+
+
+def test_isImported(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    cycleJournal = journal.CycleJournal(path)
+    assert cycleJournal.isImported()
+    cycleJournal.record(1, "opt", obj=2.5, imported=True)
+    assert cycleJournal.isImported()
+    cycleJournal.record(1, "valid", obj=2.5)
+    assert not cycleJournal.isImported()
+    cycleJournal.clear()
+    assert not path.is_file()
+    assert cycleJournal.get(1, "opt") is None
+    assert journal.CycleJournal(path).isImported()
@@ -0,0 +1,134 @@
+import os
+from pathlib import Path
+from shutil import copyfile, rmtree
+
+from ff_optimizer import leapcache, utils
+
+home = Path(__file__).parent.absolute()
+leapFiles = ["setup.leap", "conf.pdb", "sol.frcmod", "sol.mol2"]
+
+
+def setupFolder(name):
+    os.chdir(home / "full")
+    if os.path.isdir(name):
+        rmtree(name)
+    os.mkdir(name)
+    for f in leapFiles:
+        copyfile(os.path.join("1_opt", f), os.path.join(name, f))
+    os.chdir(name)
+
+
+def getFakeTleap(calls):
+    def fakeTleap(command):
+        calls.append(command)
+        src = home / "full" / "1_opt"
+        copyfile(src / "water.prmtop", "water.prmtop")
+        copyfile(src / "water.inpcrd", "water.inpcrd")
+        copyfile(src / "leap.out", "leap.out")
+        return 0
+
+    return fakeTleap
+
+
+def test_getLeapOutputs():
+    setupFolder("leap")
+    outputs = leapcache.getLeapOutputs("setup.leap")
+    os.chdir("..")
+    rmtree("leap")
+    assert outputs == ["water.prmtop", "water.inpcrd"]
+
+
+def test_getKey():
+    setupFolder("leap")
+    cache = leapcache.LeapCache(home / "full" / "leapcache")
+    key = cache.getKey("setup.leap")
+    # Outputs from a previous build don't change the key
+    copyfile(home / "full" / "1_opt" / "water.prmtop", "water.prmtop")
+    sameKey = cache.getKey("setup.leap")
+    with open("sol.frcmod", "a") as f:
+        f.write("\n")
+    frcmodKey = cache.getKey("setup.leap")
+    os.chdir("..")
+    rmtree("leap")
+    rmtree("leapcache")
+    assert key == sameKey
+    assert key != frcmodKey
+
+
+def test_runTleap(monkeypatch):
+    calls = []
+    monkeypatch.setattr(os, "system", getFakeTleap(calls))
+    setupFolder("leap")
+    cache = leapcache.LeapCache(home / "full" / "leapcache")
+    leapcache.runTleap("setup.leap", cache)
+    os.chdir("..")
+    setupFolder("leap2")
+    leapcache.runTleap("setup.leap", cache)
+    files = sorted(os.listdir())
+    with open("water.prmtop", "r") as f:
+        prmtop = f.read()
+    # Symbols of the cached prmtop are known without reading it
+    loads = []
+    loadElements = utils.loadElements
+    monkeypatch.setattr(
+        utils, "loadElements", lambda: loads.append(1) or loadElements()
+    )
+    symbols = utils.getSymbolsFromPrmtop("water.prmtop")
+    nloads = len(loads)
+    with open("conf.pdb", "a") as f:
+        f.write("\n")
+    leapcache.runTleap("setup.leap", cache)
+    os.chdir("..")
+    rmtree("leap")
+    rmtree("leap2")
+    rmtree("leapcache")
+    with open(home / "full" / "1_opt" / "water.prmtop", "r") as f:
+        assert prmtop == f.read()
+    assert len(calls) == 2
+    assert cache.hits == 1
+    assert cache.misses == 2
+    assert "water.prmtop" in files
+    assert "water.inpcrd" in files
+    assert "leap.out" in files
+    assert symbols[:3] == ["O", "H", "H"]
+    assert nloads == 0
+
+
+def test_runTleapFailed(monkeypatch):
+    calls = []
+
+    def failedTleap(command):
+        calls.append(command)
+        with open("leap.out", "w") as f:
+            f.write("Exiting LEaP: Errors = 1\n")
+        return 256
+
+    setupFolder("leap")
+    cache = leapcache.LeapCache(home / "full" / "leapcache")
+    # Stale build of a previous force field
+    copyfile(home / "full" / "1_opt" / "water.prmtop", "water.prmtop")
+    copyfile(home / "full" / "1_opt" / "water.inpcrd", "water.inpcrd")
+    monkeypatch.setattr(os, "system", failedTleap)
+    leapcache.runTleap("setup.leap", cache)
+    files = os.listdir()
+    monkeypatch.setattr(os, "system", getFakeTleap(calls))
+    leapcache.runTleap("setup.leap", cache)
+    os.chdir("..")
+    rmtree("leap")
+    rmtree("leapcache")
+    assert "water.prmtop" not in files
+    assert len(calls) == 2
+    assert cache.hits == 0
+    assert cache.misses == 2
+
+
+def test_runTleapNoCache(monkeypatch):
+    calls = []
+    monkeypatch.setattr(os, "system", getFakeTleap(calls))
+    setupFolder("leap")
+    leapcache.runTleap()
+    files = os.listdir()
+    os.chdir("..")
+    rmtree("leap")
+    assert calls == ["tleap -f setup.leap > leap.out"]
+    assert "water.prmtop" in files
@@ -1,6 +1,9 @@
 import os
 from pathlib import Path
-from shutil import copyfile, rmtree
+from shutil import copyfile, copytree, rmtree
+
+import pytest
+from parmed.amber import AmberParm
 
 from ff_optimizer import mmengine, utils
 
@@ -8,6 +11,15 @@ from . import checkUtils
 from .test_inputs import getDefaults
 
 
+@pytest.fixture(autouse=True)
+def removeXYZIndex():
+    # MMEngine caches frame indices next to the tracked coordinate files
+    yield
+    for xyz in ["coors.xyz", "coors2.xyz"]:
+        path = Path(__file__).parent / "mmengine" / xyz
+        utils.getXYZIndexPath(path).unlink(missing_ok=True)
+
+
 def monkeyGetIndices(self):
     return 1, 2, 3
 
@@ -295,6 +307,11 @@ def test_restart2(monkeypatch):
         os.remove(os.path.join("valid_1", "sample.txt"))
     else:
         passTest = False
+    # The rerun folder is marked finished so its QM calculations can start
+    if os.path.isfile(os.path.join("valid_1", "MMFinished.txt")):
+        os.remove(os.path.join("valid_1", "MMFinished.txt"))
+    else:
+        passTest = False
 
     try:
         os.mkdir("valid_1")
@@ -409,3 +426,92 @@ def test_getMMsamples2(monkeypatch):
     assert trainCrds == ["0\n", "1\n", "2\n"]
     assert validCrds[0] == ["3\n", "4\n", "5\n"]
     assert validCrds[1] == ["6\n", "7\n", "8\n"]
+
+
+def monkeyRunTrajectory(self, frame, mdin):
+    with open(f"{frame}.nc", "w") as f:
+        f.write(mdin)
+
+
+def monkeyConvertTrajectories(self, frames):
+    with open("frames.txt", "w") as f:
+        for frame in frames:
+            f.write(f"{frame}\n")
+
+
+def test_getMMsamplesParallel(monkeypatch):
+    options = getDefaults()
+    options.conformersperset = 3
+    options.nvalids = 2
+    options.mmworkers = 4
+    os.chdir(os.path.join(os.path.dirname(__file__), "mmengine"))
+    options.dynamicsdir = Path(".").absolute()
+    if os.path.isdir("testSetup"):
+        rmtree("testSetup")
+    os.mkdir("testSetup")
+    os.chdir("testSetup")
+
+    monkeypatch.setattr(mmengine.MMEngine, "getFrame", monkeyGetFrame)
+    monkeypatch.setattr(mmengine.MMEngine, "getFrames", monkeyGetFrames)
+    monkeypatch.setattr(mmengine.MMEngine, "setup", monkeySetup)
+    monkeypatch.setattr(mmengine.MMEngine, "runTrajectory", monkeyRunTrajectory)
+    monkeypatch.setattr(
+        mmengine.MMEngine, "convertTrajectories", monkeyConvertTrajectories
+    )
+    mmEngine = mmengine.MMEngine(options)
+    mmEngine.getMMSamples()
+
+    folders = ["train", "valid_1", "valid_2"]
+    passTest = True
+    for i, f in enumerate(folders):
+        with open(os.path.join(f, "frames.txt"), "r") as g:
+            frames = [int(line) for line in g.readlines()]
+        if frames != [3 * i, 3 * i + 1, 3 * i + 2]:
+            passTest = False
+        for frame in frames:
+            if not os.path.isfile(os.path.join(f, f"{frame}.nc")):
+                passTest = False
+        if not os.path.isfile(os.path.join(f, "MMFinished.txt")):
+            passTest = False
+    os.chdir("..")
+    rmtree("testSetup")
+    assert passTest
+
+
+def test_buildPrmtop(monkeypatch):
+    calls = []
+    patchDir = Path(__file__).parent.absolute() / "prmtoppatch"
+
+    def fakeTleap(command):
+        calls.append(command)
+        copyfile(patchDir / "template" / "water.prmtop", "water.prmtop")
+        copyfile(patchDir / "template" / "water.inpcrd", "water.inpcrd")
+
+    monkeypatch.setattr(os, "system", fakeTleap)
+    options = getDefaults()
+    options.patchprmtop = True
+    os.chdir(os.path.join(os.path.dirname(__file__), "mmengine"))
+    options.dynamicsdir = Path(".").absolute()
+    mmEngine = mmengine.MMEngine(options)
+    os.chdir(patchDir)
+    for name in ["t", "n"]:
+        if os.path.isdir(name):
+            rmtree(name)
+    copytree("template", "t")
+    copytree("new", "n")
+    os.remove(os.path.join("t", "water.prmtop"))
+    os.chdir("t")
+    mmEngine.buildPrmtop()
+    os.chdir(patchDir / "n")
+    mmEngine.buildPrmtop()
+    patchedCharge = AmberParm("water.prmtop").atoms[0].charge
+    # A new molecule can't be patched
+    copyfile(patchDir.parent / "full" / "1_opt" / "conf.pdb", "conf.pdb")
+    with open("conf.pdb", "a") as f:
+        f.write("\n")
+    mmEngine.buildPrmtop()
+    os.chdir(patchDir)
+    rmtree("t")
+    rmtree("n")
+    assert len(calls) == 2
+    assert checkUtils.checkFloats(patchedCharge, -0.6416524368493549, 1e-6)
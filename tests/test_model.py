@@ -3,6 +3,8 @@ from pathlib import Path
 from shutil import copyfile, rmtree
 
 from ff_optimizer import model, optengine
+from ff_optimizer.journal import CycleJournal
+from ff_optimizer.targetcache import TargetCache
 
 from . import checkUtils
 from .test_inputs import getDefaults
@@ -190,7 +192,7 @@ def monkeyForceBalanceSimple(inp, out, err):
 def clean():
     os.chdir("1_optimization")
     for f in os.listdir():
-        if f.endswith(".out"):
+        if f.endswith(".out") or f == "journal.jsonl":
             os.remove(f)
     if os.path.isdir("targets"):
         os.chdir("targets")
@@ -562,3 +564,78 @@ def test_initialCycle2(monkeypatch):
         copied = False
     cleanOptDir(m.optdir, True)
     assert copied
+
+
+class PipelineMMEngine:
+    def getMMSamples(self):
+        for f in ["train", "valid_1", "valid_2"]:
+            os.mkdir(f)
+            with open(os.path.join(f, "1.xyz"), "w") as g:
+                g.write(f"{f}\n")
+            with open(os.path.join(f, "MMFinished.txt"), "w") as g:
+                g.write("MM sampling finished\n")
+
+
+class PipelineQMEngine:
+    def getQMRefData(self, xyzs):
+        for f in ["qdata.txt", "all.mdcrd"]:
+            with open(f, "w") as g:
+                g.write(f"{Path.cwd().name} {[xyz.name for xyz in xyzs]}\n")
+
+
+class PipelineOptEngine(optengine.OptEngine):
+    def __init__(self, optdir):
+        self.validPrevious = [1.0]
+        self.journal = CycleJournal(optdir / "journal.jsonl")
+        self.targetCache = TargetCache(optdir / "targetcache.jsonl")
+        self.setups = []
+
+    def copyResults(self, i):
+        pass
+
+    def setupInputFiles(self, i):
+        self.setups.append((i, os.getpid()))
+
+    def evaluateValidPrevious(self, i):
+        with open(os.path.join("targets", f"valid_{i}_1", "qdata.txt"), "r") as f:
+            assert f.read() == "valid_2 ['1.xyz']\n"
+        self.targetCache.store(f"valid_{i}", 0.5)
+        return 0.5, 1.0
+
+
+def test_doPipelinedSampling(monkeypatch):
+    folder = home / "model" / "pipeline_tmp"
+    rmdir(folder)
+    (folder / "sampledir").mkdir(parents=True)
+    (folder / "optdir").mkdir()
+    os.chdir(folder)
+    monkeypatch.setattr(model.Model, "copySamplingFiles", lambda self, i, p: None)
+    monkeypatch.setattr(model.Model, "copyLeapFiles", lambda self, dest: None)
+    inp = getDefaults()
+    inp.nvalids = 2
+    m = model.Model.__new__(model.Model)
+    m.inp = inp
+    m.home = folder
+    m.sampledir = Path("sampledir")
+    m.optdir = Path("optdir")
+    m.restartCycle = -1
+    m.mmEngine = PipelineMMEngine()
+    m.qmEngine = PipelineQMEngine()
+    m.optEngine = PipelineOptEngine(folder / "optdir")
+    m.doPipelinedSampling(2)
+    qdata = {}
+    for f in ["train", "valid_1", "valid_2"]:
+        with open(folder / "sampledir" / "2_cycle_2" / f / "qdata.txt", "r") as g:
+            qdata[f] = g.read()
+    targets = sorted(os.listdir(folder / "optdir" / "targets"))
+    os.chdir(home)
+    rmdir(folder)
+    assert qdata["train"] == "train ['1.xyz']\n"
+    assert qdata["valid_2"] == "valid_2 ['1.xyz']\n"
+    assert targets == ["train_2", "valid_2", "valid_2_1"]
+    # Inputs are set up once, in this process, and the result recorded here
+    assert m.optEngine.setups == [(2, os.getpid())]
+    assert m.optEngine.validPrevious == [1.0, 0.5]
+    assert m.optEngine.journal.get(2, "validPrevious")["obj"] == 0.5
+    assert m.optEngine.targetCache.entries == {"valid_2": 0.5}
+    assert m.mmTime > 0
@@ -0,0 +1,278 @@
+import os
+from multiprocessing import Pool
+from pathlib import Path
+from shutil import copyfile
+
+from ff_optimizer import mmengine, model, multi_system, optengine, targetcache
+from ff_optimizer.journal import CycleJournal
+
+from .test_inputs import getDefaults
+
+home = Path(__file__).parent.absolute()
+
+
+def monkeyInit(self, inp):
+    self.setVariables(inp)
+    self.readFileNames()
+    self.determineRestart()
+    self.readTargetLines()
+
+
+def getTargetNames(inputFile):
+    return [name for name, lines in targetcache.readFBInput(inputFile)[1]]
+
+
+def test_sharedOptEngine(monkeypatch, tmp_path):
+    monkeypatch.setattr(optengine.OptEngine, "__init__", monkeyInit)
+    copyfile(home / "optengine" / "opt_0_test1.in", tmp_path / "opt_0.in")
+    with open(tmp_path / "valid_0.in", "w") as f:
+        f.write("$options\njobtype single\n$end\n")
+    os.chdir(tmp_path)
+    options = getDefaults()
+    options.optdir = tmp_path
+    options.systems = [tmp_path / "a", tmp_path / "b"]
+    options.initialtraining = True
+    optEngine = multi_system.SharedOptEngine(options)
+    optEngine.editOpt0()
+    assert optEngine.initialTarget == "dynamics"
+    assert getTargetNames("opt_0.in") == ["a_dynamics", "b_dynamics"]
+
+    # On restart, the copied targets are recognized and left alone
+    optEngine = multi_system.SharedOptEngine(options)
+    assert optEngine.expanded
+    assert optEngine.initialTarget == "dynamics"
+    assert [line.split()[0] for line in optEngine.targetLines].count("$end") == 1
+    optEngine.editOpt0()
+    assert getTargetNames("opt_0.in") == ["a_dynamics", "b_dynamics"]
+
+    copyfile("opt_0.in", "opt_1.in")
+    copyfile("valid_0.in", "valid_1.in")
+    optEngine.setupInputFiles(2)
+    os.chdir(home)
+    assert getTargetNames(tmp_path / "opt_2.in") == [
+        "a_dynamics",
+        "b_dynamics",
+        "a_train_2",
+        "b_train_2",
+    ]
+    assert getTargetNames(tmp_path / "valid_2.in") == ["a_valid_2", "b_valid_2"]
+    with open(tmp_path / "opt_2.in", "r") as f:
+        assert "name                b_train_2\n" in f.readlines()
+
+
+class SharedMMEngine:
+    def __init__(self, name):
+        self.name = name
+
+    def useWorkers(self):
+        return True
+
+    def createPool(self, ntasks):
+        return Pool(2)
+
+    def getSamplingJobs(self):
+        jobs = [("train", [0, 1], "md.in"), ("valid_1", [2], "md.in")]
+        for f, frames, mdin in jobs:
+            os.mkdir(f)
+        return jobs
+
+    def runTrajectory(self, frame, mdin):
+        with open(f"{frame}.txt", "w") as f:
+            f.write(f"{self.name} {mdin}\n")
+
+    def convertTrajectories(self, frames):
+        with open("frames.txt", "w") as f:
+            f.write(f"{self.name} {sorted(frames)}\n")
+
+    def writeMMFinished(self):
+        with open("MMFinished.txt", "w") as f:
+            f.write("MM sampling finished\n")
+
+
+def makeSystems(folder, names):
+    systems = []
+    for name in names:
+        system = multi_system.SystemModel.__new__(multi_system.SystemModel)
+        system.name = name
+        system.sampledir = folder / name / "sampledir"
+        system.sampledir.mkdir(parents=True)
+        system.optdir = folder / name / "optdir"
+        system.sharedOptdir = folder / "optdir"
+        systems.append(system)
+    return systems
+
+
+def test_doMMSampling(monkeypatch, tmp_path):
+    monkeypatch.setattr(model.Model, "copySamplingFiles", lambda self, i, p: None)
+    os.chdir(tmp_path)
+    m = multi_system.MultiSystemModel.__new__(multi_system.MultiSystemModel)
+    m.home = tmp_path
+    m.restartCycle = -1
+    m.systems = makeSystems(tmp_path, ["a", "b"])
+    for system in m.systems:
+        system.restartCycle = -1
+        system.mmEngine = SharedMMEngine(system.name)
+    m.doMMSampling(3)
+    cwd = Path.cwd()
+    os.chdir(home)
+    assert cwd == tmp_path
+    for name in ["a", "b"]:
+        samplePath = tmp_path / name / "sampledir" / "3_cycle_3"
+        with open(samplePath / "train" / "frames.txt", "r") as f:
+            assert f.read() == f"{name} [0, 1]\n"
+        with open(samplePath / "valid_1" / "frames.txt", "r") as f:
+            assert f.read() == f"{name} [2]\n"
+        with open(samplePath / "valid_1" / "2.txt", "r") as f:
+            assert f.read() == f"{name} md.in\n"
+        assert (samplePath / "train" / "MMFinished.txt").is_file()
+
+
+class PipelineMMEngine:
+    def useWorkers(self):
+        return False
+
+    def getMMSamples(self):
+        for f in ["train", "valid_1"]:
+            os.mkdir(f)
+            with open(os.path.join(f, "1.xyz"), "w") as g:
+                g.write(f"{f}\n")
+            with open(os.path.join(f, "MMFinished.txt"), "w") as g:
+                g.write("MM sampling finished\n")
+
+
+class PipelineQMEngine:
+    def getQMRefData(self, xyzs):
+        system = Path.cwd().parent.parent.parent.name
+        for f in ["qdata.txt", "all.mdcrd"]:
+            with open(f, "w") as g:
+                g.write(f"{system} {Path.cwd().name}\n")
+
+
+class PipelineOptEngine(optengine.OptEngine):
+    def __init__(self, optdir):
+        self.validPrevious = [1.0]
+        self.journal = CycleJournal(optdir / "journal.jsonl")
+        self.targetCache = None
+        self.setups = []
+
+    def copyResults(self, i):
+        pass
+
+    def setupInputFiles(self, i):
+        self.setups.append((i, os.getpid()))
+
+    def evaluateValidPrevious(self, i):
+        for system in ["a", "b"]:
+            path = os.path.join("targets", f"{system}_valid_{i}", "qdata.txt")
+            with open(path, "r") as f:
+                assert f.read() == f"{system} valid_1\n"
+        return 0.5, 1.0
+
+
+def test_doPipelinedSampling(monkeypatch, tmp_path):
+    monkeypatch.setattr(model.Model, "copySamplingFiles", lambda self, i, p: None)
+    monkeypatch.setattr(model.Model, "copyLeapFiles", lambda self, dest: None)
+    os.chdir(tmp_path)
+    inp = getDefaults()
+    inp.nvalids = 1
+    m = multi_system.MultiSystemModel.__new__(multi_system.MultiSystemModel)
+    m.inp = inp
+    m.home = tmp_path
+    m.optdir = tmp_path / "optdir"
+    m.optdir.mkdir()
+    m.restartCycle = -1
+    m.optEngine = PipelineOptEngine(m.optdir)
+    m.systems = makeSystems(tmp_path, ["a", "b"])
+    for system in m.systems:
+        system.inp = inp
+        system.restartCycle = -1
+        system.mmEngine = PipelineMMEngine()
+        system.qmEngine = PipelineQMEngine()
+    m.doPipelinedSampling(2)
+    os.chdir(home)
+    for name in ["a", "b"]:
+        path = tmp_path / name / "sampledir" / "2_cycle_2" / "train" / "qdata.txt"
+        with open(path, "r") as f:
+            assert f.read() == f"{name} train\n"
+    targets = sorted(os.listdir(tmp_path / "optdir" / "targets"))
+    assert targets == ["a_train_2", "a_valid_2", "b_train_2", "b_valid_2"]
+    assert m.optEngine.setups == [(2, os.getpid())]
+    assert m.optEngine.validPrevious == [1.0, 0.5]
+    assert m.optEngine.journal.get(2, "validPrevious")["obj"] == 0.5
+    assert m.mmTime > 0
+
+
+class RestartMMEngine(mmengine.MMEngine):
+    def __init__(self, inp):
+        self.inp = inp
+
+    def setup(self):
+        return "setup.prmtop"
+
+    def sample(self, frames, mdin):
+        with open("1.xyz", "w") as f:
+            f.write(f"{sorted(frames)}\n")
+
+    def getMMSamples(self):
+        pass
+
+
+class RestartQMEngine(PipelineQMEngine):
+    def restart(self):
+        self.getQMRefData(None)
+
+
+def test_doPipelinedSamplingRestart(monkeypatch, tmp_path):
+    monkeypatch.setattr(model.Model, "copySamplingFiles", lambda self, i, p: None)
+    monkeypatch.setattr(model.Model, "copyLeapFiles", lambda self, dest: None)
+    os.chdir(tmp_path)
+    inp = getDefaults()
+    inp.nvalids = 1
+    inp.conformersperset = 2
+    m = multi_system.MultiSystemModel.__new__(multi_system.MultiSystemModel)
+    m.inp = inp
+    m.home = tmp_path
+    m.optdir = tmp_path / "optdir"
+    m.optdir.mkdir()
+    m.restartCycle = 2
+    m.optEngine = PipelineOptEngine(m.optdir)
+    m.systems = makeSystems(tmp_path, ["a", "b"])
+    for system in m.systems:
+        system.inp = inp
+        system.restartCycle = 2
+        system.mmEngine = RestartMMEngine(inp)
+        system.qmEngine = RestartQMEngine()
+        # Train folder finished, valid folder with one trajectory left to run
+        samplePath = system.sampledir / "2_cycle_2"
+        for f in ["train", "valid_1"]:
+            (samplePath / f).mkdir(parents=True)
+            for frame in [3, 4]:
+                (samplePath / f / f"{frame}.rst7").touch()
+        (samplePath / "train" / "1.xyz").touch()
+        system.mmEngine.writeMMFinished(samplePath / "train")
+        (samplePath / "valid_1" / "3.nc").touch()
+    m.doPipelinedSampling(2)
+    os.chdir(home)
+    for name in ["a", "b"]:
+        path = tmp_path / name / "sampledir" / "2_cycle_2" / "valid_1"
+        with open(path / "1.xyz", "r") as f:
+            assert f.read() == "[4]\n"
+        assert (path / "MMFinished.txt").is_file()
+        with open(path / "qdata.txt", "r") as f:
+            assert f.read() == f"{name} valid_1\n"
+    assert m.optEngine.validPrevious == [1.0, 0.5]
+
+
+def test_getSystemInput(tmp_path):
+    inp = getDefaults()
+    inp.optdir = tmp_path / "optdir"
+    inp.sampledir = tmp_path / "sampledir"
+    inp.dynamicsdir = tmp_path / "dynamicsdir"
+    inp.systems = [tmp_path / "a", tmp_path / "b"]
+    inp.skipchecks = True
+    systemInp = inp.getSystemInput(tmp_path / "b")
+    assert systemInp.systems is None
+    assert systemInp.optdir == tmp_path / "b" / "optdir"
+    assert systemInp.sampledir == tmp_path / "b" / "sampledir"
+    assert systemInp.dynamicsdir == tmp_path / "b" / "dynamicsdir"
+    assert inp.optdir == tmp_path / "optdir"
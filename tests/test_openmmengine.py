@@ -1,4 +1,5 @@
 import os
+from shutil import copyfile
 
 from numpy import loadtxt
 
@@ -16,6 +17,8 @@ def clean():
     for f in os.listdir():
         if f.endswith(".xyz") or f.endswith(".nc") or f.endswith(".out"):
             os.remove(f)
+        elif f == utils.getGeometryStorePath().name:
+            os.remove(f)
 
 
 def test_sample(monkeypatch):
@@ -29,10 +32,73 @@ def test_sample(monkeypatch):
     mmEngine.symbols = utils.getSymbolsFromPrmtop(mmEngine.prmtop)
     mmEngine.sample([12345], "md.py")
     passTest = True
+    geometries, _ = utils.readGeometries()
     for i in range(1, 9):
-        testXYZ = loadtxt(f"{i}.xyz", usecols=(1, 2, 3), skiprows=2)
+        testXYZ = geometries[str(i)].reshape(-1, 3)
         refXYZ = loadtxt(os.path.join("ref", f"{i}.xyz"), usecols=(1, 2, 3), skiprows=2)
         if not checkUtils.checkArrays(testXYZ, refXYZ, 1e-2):
             passTest = False
     clean()
     assert passTest
+
+
+def test_sampleInProcess(monkeypatch):
+    options = getDefaults()
+    options.openmmplatform = "Reference"
+    monkeypatch.setattr(mmengine.MMEngine, "getIndices", monkeyGetIndices)
+    os.chdir(os.path.join(os.path.dirname(__file__), "mmengine"))
+    mmEngine = mmengine.InProcessOpenMMEngine(options)
+    mmEngine.prmtop = os.path.join("sample_openmm", "bicarb_cluster.prmtop")
+    os.chdir("sample_openmm")
+    clean()
+    copyfile("12345.rst7", "12346.rst7")
+    mmEngine.symbols = utils.getSymbolsFromPrmtop("bicarb_cluster.prmtop")
+    mmEngine.sample([12345, 12346], "md_inprocess.py")
+    geometries, symbols = utils.readGeometries()
+    ncs = [f for f in os.listdir() if f.endswith(".nc")]
+    os.remove("12346.rst7")
+    clean()
+    # The system is built once and reused for both conformers
+    assert len(mmEngine.simulations) == 1
+    script, simulation = list(mmEngine.simulations.values())[0]
+    assert script.created == ["Reference"]
+    assert len(geometries) == 16
+    # Dummy atoms are dropped
+    assert list(symbols) == [s for s in mmEngine.symbols if s != "X"]
+    assert len(ncs) == 0
+    # Both conformers start from the same positions with zero velocities, so
+    # resetting the context must reproduce the first trajectory exactly
+    for i in range(1, 9):
+        assert checkUtils.checkArrays(geometries[str(i)], geometries[str(i + 8)])
+    assert not checkUtils.checkArrays(geometries["1"], geometries["8"])
+
+
+def test_sampleReplicas(monkeypatch):
+    options = getDefaults()
+    options.openmmplatform = "Reference"
+    options.openmmreplicas = 2
+    monkeypatch.setattr(mmengine.MMEngine, "getIndices", monkeyGetIndices)
+    os.chdir(os.path.join(os.path.dirname(__file__), "mmengine"))
+    mmEngine = mmengine.InProcessOpenMMEngine(options)
+    mmEngine.prmtop = os.path.join("sample_openmm", "bicarb_cluster.prmtop")
+    os.chdir("sample_openmm")
+    clean()
+    frames = [12345, 12346, 12347]
+    for frame in frames[1:]:
+        copyfile("12345.rst7", f"{frame}.rst7")
+    mmEngine.symbols = utils.getSymbolsFromPrmtop("bicarb_cluster.prmtop")
+    mmEngine.sample(frames, "md_inprocess.py")
+    geometries, _ = utils.readGeometries()
+    for frame in frames[1:]:
+        os.remove(f"{frame}.rst7")
+    clean()
+    script, replicas = mmEngine.getReplicas(os.path.join("..", "md_inprocess.py"), 2)
+    # Replicas are cloned from a single simulation
+    assert script.created == ["Reference"]
+    assert len(replicas) == 2
+    assert replicas[0].context is not replicas[1].context
+    assert len(geometries) == 24
+    # Every conformer was sampled in full and in order
+    for i in range(1, 9):
+        assert checkUtils.checkArrays(geometries[str(i)], geometries[str(i + 8)])
+        assert checkUtils.checkArrays(geometries[str(i)], geometries[str(i + 16)])
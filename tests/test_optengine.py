@@ -1,5 +1,6 @@
 import errno
 import os
+import threading
 from pathlib import Path
 from shutil import copyfile, rmtree
 
@@ -50,6 +51,7 @@ def cleanOptDir(optdir, removeResult=False):
             or f.endswith(".prmtop")
             or f == "leap.out"
             or f == "leap.log"
+            or f == "journal.jsonl"
             or f.endswith(".png")
         ):
             os.remove(os.path.join(optdir, f))
@@ -595,6 +597,36 @@ def test_determineRestart3(monkeypatch):
     assert optEngine.restartCycle == 3
 
 
+def test_determineRestartJournal(monkeypatch, tmp_path):
+    monkeypatch.setattr(optengine.OptEngine, "__init__", monkeyInit2)
+    os.chdir(os.path.join(os.path.dirname(__file__), "optengine"))
+    for f in os.listdir("restart1"):
+        if "4" in f:
+            os.remove(os.path.join("restart1", f))
+    options = getDefaults()
+    options.optdir = "restart1"
+    options.restart = True
+    options.validinitial = True
+    options.initialtraining = True
+    optEngine = optengine.OptEngine(options)
+    copyfile(os.path.join("restart1", "journal.jsonl"), tmp_path / "journal.jsonl")
+    cleanOptDir(options.optdir)
+    assert optEngine.journal.isImported()
+    assert optEngine.journal.get(3, "validInitial") is not None
+    # Restarting from the journal doesn't need the ForceBalance outputs
+    monkeypatch.setattr(optengine.OptEngine, "__init__", monkeyInit)
+    options.optdir = tmp_path
+    journalEngine = optengine.OptEngine(options)
+    journalEngine.journal.record(4, "validPrevious", obj=1.5)
+    journalEngine.determineRestart()
+    assert journalEngine.restartCycle == 4
+    assert journalEngine.train == optEngine.train
+    assert journalEngine.valid == optEngine.valid
+    assert journalEngine.validPrevious == optEngine.validPrevious + [1.5]
+    assert journalEngine.labels == optEngine.labels
+    assert checkUtils.checkArrays(journalEngine.params, optEngine.params)
+
+
 def test_sortParams1(monkeypatch):
     monkeypatch.setattr(optengine.OptEngine, "__init__", monkeyInit2)
     os.chdir(os.path.join(os.path.dirname(__file__), "optengine"))
@@ -1237,3 +1269,57 @@ def test_runfb():
     utils.rmrf("valid_3.tmp")
     assert out
     assert err
+
+
+def test_runValidConcurrent(monkeypatch):
+    monkeypatch.setattr(optengine.OptEngine, "__init__", monkeyInit)
+    monkeypatch.setattr(optengine.OptEngine, "readValid", monkeyReadValid)
+    options = getDefaults()
+    options.nvalids = 3
+    options.fbworkers = 3
+    options.validinitial = True
+    optEngine = optengine.OptEngine(options)
+    optEngine.valid = [1]
+    optEngine.validInitial = [1]
+    # Three evaluations must be running at once to get past the barrier
+    barrier = threading.Barrier(3, timeout=10)
+    jobs = []
+
+    def monkeyFB(inp, out, err=None):
+        barrier.wait()
+        jobs.append((inp, out, err))
+
+    monkeypatch.setattr(optengine, "runForceBalance", monkeyFB)
+    optEngine.runValid(2)
+    optEngine.runValidInitial(2)
+    assert sorted(jobs) == [
+        ("valid_2.in", "valid_2.out", "valid_2.err"),
+        ("valid_2_1.in", "valid_2_1.out", "valid_2_1.err"),
+        ("valid_2_1_initial.in", "valid_2_1_initial.out", "valid_2_1_initial.err"),
+        ("valid_2_2.in", "valid_2_2.out", "valid_2_2.err"),
+        ("valid_2_2_initial.in", "valid_2_2_initial.out", "valid_2_2_initial.err"),
+        ("valid_2_initial.in", "valid_2_initial.out", "valid_2_initial.err"),
+    ]
+    assert optEngine.valid == [1, 1]
+    assert optEngine.validInitial == [1, 1]
+
+
+def test_runValidPreviousSerial(monkeypatch):
+    monkeypatch.setattr(optengine.OptEngine, "__init__", monkeyInit)
+    monkeypatch.setattr(optengine.OptEngine, "readValid", monkeyReadValid)
+    options = getDefaults()
+    options.nvalids = 2
+    optEngine = optengine.OptEngine(options)
+    optEngine.validPrevious = []
+    jobs = []
+
+    def monkeyFB(inp, out, err=None):
+        jobs.append((inp, out))
+
+    monkeypatch.setattr(optengine, "runForceBalance", monkeyFB)
+    optEngine.runValidPrevious(1)
+    assert jobs == [
+        ("valid_1.in", "valid_1_previous.out"),
+        ("valid_1_1.in", "valid_1_1_previous.out"),
+    ]
+    assert optEngine.validPrevious == [1]
@@ -0,0 +1,82 @@
+from pathlib import Path
+from shutil import rmtree
+from time import sleep
+
+import pytest
+
+from ff_optimizer.pipeline import Pipeline
+
+home = Path(__file__).parent.absolute()
+
+
+def square(x):
+    return x * x
+
+
+def add(x, y):
+    return x + y
+
+
+def fail():
+    raise ValueError("oh no!")
+
+
+def writeMarker(folder):
+    # Record whether the marker that makes this task ready already existed
+    return (Path(folder) / "ready.txt").is_file()
+
+
+def test_run():
+    pipeline = Pipeline(2, interval=0.01)
+    pipeline.addTask("a", square, (3,))
+    pipeline.addTask("b", square, (4,))
+    pipeline.addTask("c", add, (1, 2), deps=["a", "b"])
+    results = pipeline.run()
+    assert results == {"a": 9, "b": 16, "c": 3}
+
+
+def test_runForeground():
+    folder = home / "pipeline_tmp"
+    rmtree(folder, ignore_errors=True)
+    folder.mkdir()
+    pipeline = Pipeline(2, interval=0.01)
+    pipeline.addTask(
+        "wait", writeMarker, (folder,), ready=(folder / "ready.txt").is_file
+    )
+    order = []
+
+    def foreground():
+        sleep(0.1)
+        order.append("foreground")
+        with open(folder / "ready.txt", "w") as f:
+            f.write("ready\n")
+
+    results = pipeline.run(foreground)
+    rmtree(folder)
+    assert order == ["foreground"]
+    assert results == {"wait": True}
+
+
+def test_runFail():
+    pipeline = Pipeline(2, interval=0.01)
+    pipeline.addTask("bad", fail)
+    pipeline.addTask("after", square, (2,), deps=["bad"])
+    with pytest.raises(RuntimeError, match="Pipeline task bad failed"):
+        pipeline.run()
+
+
+def test_runNeverReady():
+    pipeline = Pipeline(1, interval=0.01)
+    pipeline.addTask("a", square, (2,))
+    pipeline.addTask("never", square, (2,), ready=lambda: False)
+    with pytest.raises(RuntimeError, match=r"\['never'\] never became ready"):
+        pipeline.run()
+
+
+def test_addTask():
+    pipeline = Pipeline(1)
+    pipeline.addTask("a", square, (2,))
+    with pytest.raises(ValueError):
+        pipeline.addTask("a", square, (2,))
+    with pytest.raises(ValueError):
+        pipeline.addTask("b", square, (2,), deps=["c"])
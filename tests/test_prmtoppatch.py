@@ -0,0 +1,144 @@
+import os
+from pathlib import Path
+from shutil import copyfile, copytree, rmtree
+
+import numpy as np
+import pytest
+from parmed.amber import AmberParm
+
+from ff_optimizer import prmtoppatch
+
+home = Path(__file__).parent.absolute() / "prmtoppatch"
+demo = Path(__file__).parent.parent.absolute() / "examples" / "demo" / "1_opt"
+
+
+def setupFolders():
+    os.chdir(home)
+    for name in ["t", "n"]:
+        if os.path.isdir(name):
+            rmtree(name)
+    copytree("template", "t")
+    copytree("new", "n")
+
+
+def cleanFolders():
+    os.chdir(home)
+    rmtree("t")
+    rmtree("n")
+
+
+def test_readFrcmods():
+    params = prmtoppatch.readFrcmods([demo / "butadiene.frcmod"])
+    assert params["BOND"][("c2", "ce")] == [424.30, 1.346]
+    assert params["ANGL"][("c2", "ce", "ce")] == [62.4, 123.23]
+    assert params["DIHE"][("c2", "ce", "ce", "ha")] == [(1.0, 180.0, 2.0)]
+    assert params["IMPR"][("ce", "ha", "c2", "ha")] == [(1.1, 180.0, 2.0)]
+    assert params["NONB"]["ha"] == [1.4735, 0.0161]
+    assert ("ha", "c2", "ce") not in params["ANGL"]
+
+
+def test_readFrcmodsMultiterm(tmp_path):
+    frcmod = tmp_path / "multi.frcmod"
+    with open(frcmod, "w") as f:
+        f.write("Remark\nDIHE\n")
+        f.write("c2-ce-ce-c2   1    0.740         0.000          -3.000\n")
+        f.write("c2-ce-ce-c2   1    1.500       180.000           1.000\n")
+    params = prmtoppatch.readFrcmods([demo / "butadiene.frcmod", frcmod])
+    assert params["DIHE"][("c2", "ce", "ce", "c2")] == [
+        (0.74, 0.0, 3.0),
+        (1.5, 180.0, 1.0),
+    ]
+
+
+def test_readMol2s():
+    atoms, bonds, charges = prmtoppatch.readMol2s([home / "template" / "sol.mol2"])
+    assert atoms == [("SOL", "OW", "OW"), ("SOL", "HW1", "HW"), ("SOL", "HW2", "HW")]
+    assert bonds == [("1", "2", "1"), ("1", "3", "1")]
+    assert charges[("SOL", "OW")] == -9.482387708701e-01
+
+
+def test_getImproperKeys():
+    keys = prmtoppatch.getImproperKeys(("ce", "ha", "c2", "ha"))
+    assert keys[0] == ("ce", "ha", "c2", "ha")
+    assert ("ha", "ce", "c2", "ha") in keys
+    assert ("X", "ce", "c2", "ha") in keys
+    assert ("X", "X", "c2", "ha") in keys
+
+
+def test_getTopologySignature():
+    setupFolders()
+    os.chdir("t")
+    signature = prmtoppatch.getTopologySignature("setup.leap")
+    os.chdir(home / "n")
+    newSignature = prmtoppatch.getTopologySignature("setup.leap")
+    with open("sol.frcmod", "r") as f:
+        frcmod = f.read()
+    with open("sol.frcmod", "w") as f:
+        f.write(frcmod.replace("BOND\n", "BOND\nHW-HW   553.0     1.5136\n"))
+    bondSignature = prmtoppatch.getTopologySignature("setup.leap")
+    cleanFolders()
+    assert signature == newSignature
+    assert signature != bondSignature
+
+
+def test_apply():
+    setupFolders()
+    os.chdir("t")
+    template = prmtoppatch.PrmtopTemplate("setup.leap")
+    os.chdir(home / "n")
+    template.apply("setup.leap")
+    files = os.listdir()
+    patched = AmberParm("water.prmtop")
+    cleanFolders()
+    # water.prmtop was built by tleap from the files in new/
+    ref = AmberParm(str(home / "water.prmtop"))
+    assert "water.inpcrd" in files
+    assert "leap.out" in files
+    for key in ["CHARGE", "LENNARD_JONES_ACOEF", "LENNARD_JONES_BCOEF"]:
+        assert np.allclose(
+            patched.parm_data[key], ref.parm_data[key], rtol=1e-6, atol=1e-6
+        )
+    for key in ["ATOM_TYPE_INDEX", "NONBONDED_PARM_INDEX", "BONDS_WITHOUT_HYDROGEN"]:
+        assert patched.parm_data[key] == ref.parm_data[key]
+    assert patched.parm_data["BOND_FORCE_CONSTANT"] == [553.0]
+
+
+def test_applyBond():
+    setupFolders()
+    os.chdir("t")
+    template = prmtoppatch.PrmtopTemplate("setup.leap")
+    os.chdir(home / "n")
+    with open("sol.frcmod", "r") as f:
+        frcmod = f.read()
+    with open("sol.frcmod", "w") as f:
+        f.write(frcmod.replace("OW-HW   553.0     0.9572", "OW-HW   500.0     0.9600"))
+    template.apply("setup.leap")
+    patched = AmberParm("water.prmtop")
+    cleanFolders()
+    assert patched.parm_data["BOND_FORCE_CONSTANT"] == [500.0]
+    assert patched.parm_data["BOND_EQUIL_VALUE"] == [0.96]
+
+
+def test_applyTopologyChange():
+    setupFolders()
+    os.chdir("t")
+    template = prmtoppatch.PrmtopTemplate("setup.leap")
+    os.chdir(home / "n")
+    copyfile(demo / "conf.pdb", "conf.pdb")
+    with pytest.raises(RuntimeError):
+        template.apply("setup.leap")
+    files = os.listdir()
+    cleanFolders()
+    assert "water.prmtop" not in files
+
+
+def test_applyMismatch():
+    setupFolders()
+    os.chdir("t")
+    # The template's prmtop wasn't built from its frcmod
+    copyfile(home / "water.prmtop", "water.prmtop")
+    template = prmtoppatch.PrmtopTemplate("setup.leap")
+    os.chdir(home / "n")
+    with pytest.raises(RuntimeError):
+        template.apply("setup.leap")
+    cleanFolders()
@@ -0,0 +1,108 @@
+import os
+from pathlib import Path
+from shutil import copyfile, rmtree
+
+import numpy as np
+
+from ff_optimizer import qmengine, utils
+from ff_optimizer.qmcache import QMCache
+
+from .test_inputs import getDefaults
+
+home = Path(__file__).parent.absolute()
+settings = [["method", "hf"], ["basis", "sto-3g"], ["charge", "0"]]
+
+
+def setupFolder(name, xyzs):
+    os.chdir(home / "qmengine")
+    if os.path.isdir(name):
+        rmtree(name)
+    os.mkdir(name)
+    for i in xyzs:
+        copyfile(os.path.join("test", f"{i}.xyz"), os.path.join(name, f"{i}.xyz"))
+    os.chdir(name)
+
+
+def fillCache(cache, xyzs):
+    os.chdir(home / "qmengine" / "test")
+    geometries, symbols = utils.readGeometries()
+    for i in xyzs:
+        cache.store(geometries[str(i)], symbols, str(i))
+
+
+def test_getKey():
+    os.chdir(home / "qmengine")
+    cache = QMCache("cache", settings, 1.0)
+    reordered = QMCache("cache", settings[::-1], 1.0)
+    otherBasis = QMCache("cache", [["method", "hf"], ["basis", "6-31g"]], 1.0)
+    rmtree("cache")
+    coords, symbols = utils.readXYZ(os.path.join("test", "1.xyz"), readSymbols=True)
+    key = cache.getKey(coords, symbols)
+    assert key == reordered.getKey(coords, symbols)
+    assert key == cache.getKey(coords + 1e-7, symbols)
+    assert key != cache.getKey(coords + 1e-4, symbols)
+    assert key != otherBasis.getKey(coords, symbols)
+    zeros = np.zeros(6)
+    assert cache.getKey(zeros, ["H", "H"]) == cache.getKey(-zeros, ["H", "H"])
+
+
+def test_storeLoad():
+    os.chdir(home / "qmengine")
+    cache = QMCache("cache", settings, 1.0, doResp=True)
+    fillCache(cache, range(1, 4))
+    setupFolder("cached", range(1, 6))
+    geometries, symbols = utils.readGeometries()
+    loaded = [cache.load(geometries[str(i)], symbols, str(i)) for i in range(1, 6)]
+    files = sorted(os.listdir())
+    os.chdir("..")
+    rmtree("cached")
+    rmtree("cache")
+    assert loaded == [True, True, True, False, False]
+    assert cache.hits == 3
+    assert cache.misses == 2
+    assert cache.stored == 3
+    for i in range(1, 4):
+        assert f"tc_{i}.out" in files
+        assert f"esp_{i}.xyz" in files
+    assert "tc_4.out" not in files
+
+
+def test_evict():
+    os.chdir(home / "qmengine")
+    cache = QMCache("cache", settings, 1.0)
+    fillCache(cache, range(1, 6))
+    os.chdir(home / "qmengine" / "test")
+    geometries, symbols = utils.readGeometries()
+    # Make 5.xyz the least recently used, then shrink the cache to two entries
+    entries = [
+        cache.getEntry(cache.getKey(geometries[str(i)], symbols)) for i in range(1, 6)
+    ]
+    for i, entry in enumerate(entries):
+        os.utime(entry, (1000 + i, 1000 + i))
+    os.utime(entries[4], (1, 1))
+    sizes = [cache.getSize(entry) for entry in entries]
+    cache.maxSize = sizes[2] + sizes[3]
+    cache.evict()
+    exists = [entry.is_dir() for entry in entries]
+    rmtree(home / "qmengine" / "cache")
+    assert exists == [False, False, True, True, False]
+    assert cache.evicted == 3
+
+
+def test_loadCachedResults():
+    os.chdir(home)
+    inp = getDefaults()
+    inp.tctemplate = "qmengine/tc.in"
+    inp.tctemplate_backup = "qmengine/tc_backup.in"
+    inp.sampledir = Path("")
+    inp.qmcache = home / "qmengine" / "cache"
+    qmEngine = qmengine.QMEngine(inp)
+    fillCache(qmEngine.cache, [2, 4])
+    setupFolder("cached", range(1, 6))
+    misses = qmEngine.loadCachedResults(utils.getXYZs())
+    tcOuts = sorted([f for f in os.listdir() if f.startswith("tc_")])
+    os.chdir("..")
+    rmtree("cached")
+    rmtree("cache")
+    assert [xyz.name for xyz in misses] == ["1.xyz", "3.xyz", "5.xyz"]
+    assert tcOuts == ["tc_2.out", "tc_4.out"]
@@ -1,7 +1,9 @@
 import os
 from pathlib import Path
+from shutil import copytree
 
 import numpy as np
+from qcparse import parse
 
 from ff_optimizer import qmengine, utils
 
@@ -250,6 +252,47 @@ class TestQMEngine:
         os.remove("all.mdcrd")
         assert check
 
+    def test_readQMRefData(self, tmp_path):
+        testdir = Path(__file__).parent / "qmengine"
+        copytree(testdir / "test", tmp_path / "test")
+        inp = getDefaults()
+        inp.tctemplate = testdir / "tc.in"
+        inp.tctemplate_backup = testdir / "tc_backup.in"
+        inp.sampledir = Path("")
+        inp.resp = 1.0
+        os.chdir(tmp_path / "test")
+        qdata = []
+        for qmworkers in [1, 2]:
+            inp.qmworkers = qmworkers
+            qmEngine = qmengine.QMEngine(inp)
+            energies, grads, coords, espXYZs, esps = qmEngine.readQMRefData()
+            for i, xyz in enumerate(utils.getXYZs()):
+                name = utils.getName(xyz)
+                energy, grad = utils.readGradFromTCout(f"tc_{name}.out")
+                espXYZ, esp = utils.readEsp(f"esp_{name}.xyz")
+                assert energies[i] == energy
+                assert checkUtils.checkArrays(grads[i], grad)
+                assert np.array_equal(coords[i], utils.readXYZ(xyz))
+                assert np.array_equal(espXYZs[i], np.asarray(espXYZ, dtype=float))
+                assert np.array_equal(esps[i], np.asarray(esp, dtype=float))
+            qmEngine.writeFBdata(energies, grads, coords, espXYZs, esps)
+            with open("qdata.txt", "r") as f:
+                qdata.append(f.read())
+        assert qdata[0] == qdata[1]
+
+    def test_readTCResult(self):
+        os.chdir(Path(__file__).parent / "qmengine" / "restart")
+        energy, grad = qmengine.readTCResult("tc_1.out")
+        ref = parse("tc_1.out", "terachem")
+        assert energy == ref.energy
+        assert np.array_equal(grad, ref.gradient.flatten())
+        assert not qmengine.checkTCResult("tc_3.out")
+        assert not qmengine.checkTCResult("tc_11.out")
+        # Unfinished outputs are read by qcparse
+        resp = Path(__file__).parent / "resp" / "sample" / "1_cycle_1" / "train_007"
+        energy, grad = qmengine.readTCResult(resp / "tc_0.out")
+        assert energy == parse(resp / "tc_0.out", "terachem").energy
+
     """
     def test_writeResult(self):
         qmEngine = qmengine.QMEngine("qmengine/tc.in", "qmengine/tc_backup.in")
@@ -1,10 +1,12 @@
 import os
 from pathlib import Path
-from shutil import copyfile
+from shutil import copyfile, copytree
 
+import numpy as np
 from numpy import loadtxt
+from scipy.stats import norm
 
-from ff_optimizer import resp_prior
+from ff_optimizer import resp_prior, utils
 
 from . import checkUtils
 from .test_inputs import getDefaults
@@ -187,6 +189,59 @@ def test_computeChargeDistribution():
     assert checkUtils.checkFloats(respPriors.espStdevs[5], 0.01762259)
 
 
+def test_computeChargeDistributionIncremental():
+    os.chdir(os.path.join(os.path.dirname(__file__), "resp"))
+    options = getDefaults()
+    options.resppriors = 1
+    options.sampledir = Path("sample")
+    mol2 = "dasa.mol2"
+    prmtop = "dasa.prmtop"
+    respPriors = resp_prior.RespPriors(options, mol2, prmtop)
+    for i in range(1, 5):
+        respPriors.getCharges(i)
+        # Directories which were already read are skipped
+        respPriors.getCharges(i)
+        respPriors.computeChargeDistributions()
+        natoms = respPriors.allEsp.shape[1]
+        unitLength = len(respPriors.repeats)
+        for j, idxs in enumerate(respPriors.repeats):
+            if len(idxs) == 0:
+                assert respPriors.espMeans[j] == 0
+                assert respPriors.respStdevs[j] == -1
+                continue
+            if len(idxs) == 1:
+                idxs = [j]
+            columns = [np.arange(idx, natoms, unitLength) for idx in idxs]
+            columns = np.concatenate(columns)
+            espMean, espStdev = norm.fit(respPriors.allEsp[:, columns].flatten())
+            respMean, respStdev = norm.fit(respPriors.allResp[:, columns].flatten())
+            assert checkUtils.checkFloats(respPriors.espMeans[j], espMean, 0.00001)
+            assert checkUtils.checkFloats(respPriors.espStdevs[j], espStdev, 0.00001)
+            assert checkUtils.checkFloats(respPriors.respMeans[j], respMean, 0.00001)
+            assert checkUtils.checkFloats(respPriors.respStdevs[j], respStdev, 0.00001)
+    assert respPriors.allEsp.shape[0] == 12
+
+
+def test_getChargesStore(tmp_path):
+    os.chdir(os.path.join(os.path.dirname(__file__), "resp"))
+    copytree("sample/1_cycle_1", tmp_path / "1_cycle_1")
+    trainDir = tmp_path / "1_cycle_1" / "train_007"
+    options = getDefaults()
+    options.resppriors = 1
+    options.sampledir = Path("sample")
+    mol2 = "dasa.mol2"
+    prmtop = "dasa.prmtop"
+    respPriors = resp_prior.RespPriors(options, mol2, prmtop)
+    respPriors.getCharges(1)
+    # Charges in the store are used instead of the TeraChem outputs
+    utils.writeCharges(respPriors.allEsp + 1, respPriors.allResp + 1, trainDir)
+    options.sampledir = tmp_path
+    storePriors = resp_prior.RespPriors(options, mol2, prmtop)
+    storePriors.getCharges(1)
+    assert np.array_equal(storePriors.allEsp, respPriors.allEsp + 1)
+    assert np.array_equal(storePriors.allResp, respPriors.allResp + 1)
+
+
 def test_computePriors():
     os.chdir(os.path.join(os.path.dirname(__file__), "resp"))
     options = getDefaults()
@@ -0,0 +1,94 @@
+import os
+import random
+
+import numpy as np
+import pytest
+
+from ff_optimizer import selection
+
+from . import checkUtils
+
+
+def readData(nmodels=3):
+    os.chdir(
+        os.path.join(os.path.dirname(__file__), "active_learning", "chooseGeometries")
+    )
+    energies = [np.loadtxt(f"{i}_energy.txt") for i in range(nmodels)]
+    forces = [np.loadtxt(f"{i}_force.txt") for i in range(nmodels)]
+    energies = np.asarray(energies, dtype=np.float32)
+    forces = np.asarray(forces, dtype=np.float32)
+    return energies, forces
+
+
+def test_mixed():
+    energies, forces = readData()
+    random.seed(404)
+    newGeoms = selection.getStrategy("mixed").choose(energies, forces, 8)
+    assert newGeoms == [6, 14, 18, 20, 7, 12, 15, 16]
+
+
+def test_force():
+    energies, forces = readData()
+    newGeoms = selection.getStrategy("force").choose(energies, forces, 4)
+    assert newGeoms == [6, 14, 18, 20]
+
+
+def test_energy():
+    energies, forces = readData()
+    newGeoms = selection.getStrategy("energy").choose(energies, forces, 5)
+    ref = np.argsort(np.std(energies, axis=0))[::-1][:5]
+    assert newGeoms == list(ref)
+
+
+def test_atom():
+    # Geometry 1 has a large deviation on a single atom, geometry 2 a
+    # larger total deviation spread over all atoms
+    forces = np.zeros((3, 3, 12), dtype=np.float32)
+    forces[:, 1, 0] = [-1, 0, 1]
+    forces[:, 2, :] = np.asarray([-0.4, 0, 0.4])[:, None]
+    energies = np.zeros((3, 3))
+    assert selection.getStrategy("atom").choose(energies, forces, 1) == [1]
+    assert selection.getStrategy("force").choose(energies, forces, 1) == [2]
+
+
+def test_forceSpread():
+    energies, forces = readData(2)
+    spread = selection.getForceSpread(forces)
+    ref = np.linalg.norm(forces[0] - forces[1], axis=1)
+    assert checkUtils.checkArrays(spread, ref)
+
+
+def test_kcenter():
+    rng = np.random.default_rng(0)
+    base = rng.normal(0, 1.5, 18)
+    # Three near-copies of one geometry have the largest spreads
+    geometries = [base + rng.normal(0, 0.5, 18) for i in range(8)]
+    for i in range(3):
+        geometries[i] = base + rng.normal(0, 1e-4, 18)
+    spread = np.asarray([10, 9.9, 9.8, 5, 4, 3, 2, 1], dtype=np.float32)
+    forces = np.zeros((2, 8, 18), dtype=np.float32)
+    forces[1, :, 0] = spread
+    energies = np.zeros((2, 8))
+    strategy = selection.getStrategy("kcenter")
+    newGeoms = strategy.choose(energies, forces, 3, geometries)
+    assert newGeoms[0] == 0
+    assert 1 not in newGeoms
+    assert 2 not in newGeoms
+    assert len(set(newGeoms)) == 3
+    assert selection.getStrategy("force").choose(energies, forces, 3) == [0, 1, 2]
+    with pytest.raises(ValueError):
+        strategy.choose(energies, forces, 3)
+
+
+def test_kcenterAll():
+    rng = np.random.default_rng(1)
+    geometries = list(rng.normal(0, 1.5, (4, 18)))
+    forces = rng.normal(0, 1, (3, 4, 18))
+    energies = np.zeros((3, 4))
+    newGeoms = selection.getStrategy("kcenter").choose(energies, forces, 6, geometries)
+    assert sorted(newGeoms) == [0, 1, 2, 3]
+
+
+def test_getStrategy():
+    with pytest.raises(ValueError):
+        selection.getStrategy("random")
@@ -164,3 +164,85 @@ def test_writeFiles(monkeypatch):
     os.remove(backup)
     os.remove("tc_11.in")
     assert backup == backupInScript
+
+
+def cleanArray():
+    clean()
+    for f in Path(".").iterdir():
+        if f.name.startswith(".fakeslurm") or f.name.startswith("jobs_"):
+            os.remove(f)
+        if f.name in ["sbatch_array.sh", "sbatch_backup.sh"]:
+            os.remove(f)
+
+
+def setupArray(monkeypatch, retries=1):
+    os.chdir(os.path.dirname(__file__))
+    inp = getDefaults()
+    inp.sampledir = Path("slurmengine")
+    inp.tctemplate = "tc.in"
+    inp.tctemplate_backup = "tc_backup.in"
+    inp.sbatchtemplate = "sbatch_array_template.sh"
+    inp.slurmarray = True
+    inp.retries = retries
+    slurmEngine = qmengine.SlurmEngine(inp)
+    fakeSlurm = os.path.abspath(os.path.join("slurmengine", "fakeslurm"))
+    monkeypatch.setenv("PATH", fakeSlurm + os.pathsep + os.environ["PATH"])
+    monkeypatch.setenv("FAKE_TC_FAIL", "3,7")
+    monkeypatch.setattr(qmengine, "sleep", lambda t: None)
+    os.chdir("slurmengine")
+    cleanArray()
+    return slurmEngine
+
+
+def test_writeArrayFile():
+    os.chdir(os.path.dirname(__file__))
+    inp = getDefaults()
+    inp.sampledir = Path("slurmengine")
+    inp.tctemplate = "tc.in"
+    inp.tctemplate_backup = "tc_backup.in"
+    slurmEngine = qmengine.SlurmEngine(inp)
+    slurmEngine.writeArrayFile("sbatch_array.sh", "jobs_array.txt", useBackup=True)
+    with open("sbatch_array.sh", "r") as f:
+        lines = f.readlines()
+    os.remove("sbatch_array.sh")
+    assert lines[3] == "#SBATCH -J FB_ref_gradient_array\n"
+    assert lines[8] == 'NAME=$(sed -n "${SLURM_ARRAY_TASK_ID}p" jobs_array.txt)\n'
+    assert (
+        lines[9]
+        == "cp ${NAME}.xyz tc_backup_${NAME}.in tc_backup_${NAME}.in $SCRATCH/.\n"
+    )
+
+
+def test_getQMRefDataArray(monkeypatch):
+    slurmEngine = setupArray(monkeypatch)
+    xyzs = [Path(f"{i}.xyz") for i in range(1, 26)]
+    slurmEngine.getQMRefData(xyzs)
+    with open("jobs_array.txt", "r") as f:
+        arrayNames = f.read().split()
+    with open("jobs_backup.txt", "r") as f:
+        backupNames = f.read().split()
+    with open(".fakeslurm_squeue", "r") as f:
+        queries = f.readlines()
+    checkQdata = checkUtils.checkFiles("qdata.txt", "ref/qdata.txt")
+    cleanArray()
+    assert sorted(arrayNames, key=int) == [str(i) for i in range(1, 26)]
+    assert backupNames == ["3", "7"]
+    assert queries == [
+        "--noheader --format=%F --jobs=1000\n",
+        "--noheader --format=%F --jobs=1001\n",
+    ]
+    assert checkQdata
+
+
+def test_getQMRefDataArrayNoRetries(monkeypatch):
+    slurmEngine = setupArray(monkeypatch, retries=0)
+    xyzs = [Path(f"{i}.xyz") for i in range(1, 26)]
+    crash = ""
+    try:
+        slurmEngine.getQMRefData(xyzs)
+    except RuntimeError as e:
+        crash = str(e)
+    backup = os.path.isfile("jobs_backup.txt")
+    cleanArray()
+    assert crash.startswith("Terachem job tc_3.out")
+    assert not backup
@@ -0,0 +1,216 @@
+import os
+from pathlib import Path
+from shutil import copyfile
+
+from ff_optimizer import fbdriver, optengine, targetcache
+
+from . import checkUtils
+from .test_inputs import getDefaults
+
+home = Path(__file__).parent.absolute() / "optengine"
+
+objectives = {
+    "valid_1": 1.44936,
+    "valid_2": 1.40895,
+    "valid_3": 1.34377,
+    "valid_4": 1.39271,
+}
+
+
+def test_readWriteFBInput(tmp_path):
+    optionLines, targets = targetcache.readFBInput(home / "ref_inputs" / "opt_8.in")
+    assert [name for name, lines in targets] == ["dynamics"] + [
+        f"train_{i}" for i in range(1, 9)
+    ]
+    assert optionLines[0].strip() == "$options"
+    assert optionLines[-1].strip() == "$end"
+    assert targetcache.getOption(optionLines, "forcefield") == [
+        "dasa.frcmod",
+        "dasa.mol2",
+    ]
+    assert targetcache.getOption(targets[1][1], "w_resp") == ["0.5"]
+    assert targetcache.getOption(targets[1][1], "weight", "1.0") == ["1.0"]
+    targetcache.writeFBInput(tmp_path / "opt_8.in", optionLines, targets)
+    with open(tmp_path / "opt_8.in", "r") as f:
+        test = f.readlines()
+    with open(home / "ref_inputs" / "opt_8.in", "r") as f:
+        ref = f.readlines()
+    checkUtils.checkLists(test, ref)
+
+
+def test_readObjectives():
+    objs, regularization = targetcache.readObjectives(home / "valid.out")
+    assert objs == objectives
+    assert regularization == 0.0
+
+
+def test_writeObjectives(tmp_path):
+    out = tmp_path / "valid_4.out"
+    total = targetcache.writeObjectives(
+        out, [(name, obj, 0.25) for name, obj in objectives.items()], 0.0
+    )
+    assert checkUtils.checkFloats(total, 1.39869922, 0.00001)
+    parser = fbdriver.ValidParser()
+    with open(out, "r") as f:
+        for line in f:
+            parser.feed(line)
+    assert checkUtils.checkFloats(parser.obj, total, 0.000000001)
+
+
+def test_targetCache(tmp_path):
+    cache = targetcache.TargetCache(tmp_path / "targetcache.jsonl")
+    assert cache.get("a") is None
+    cache.store("a", 1.5)
+    cache.store("b", 2.5)
+    with open(tmp_path / "targetcache.jsonl", "a") as f:
+        f.write('{"key": "c", "va')
+    cache = targetcache.TargetCache(tmp_path / "targetcache.jsonl")
+    assert cache.get("a") == 1.5
+    assert cache.get("b") == 2.5
+    assert cache.get("c") is None
+    assert cache.hits == 2
+    assert cache.misses == 1
+
+
+def setupValidDir(optdir):
+    (optdir / "forcefield").mkdir()
+    for f in ["dasa.frcmod", "dasa.mol2"]:
+        with open(optdir / "forcefield" / f, "w") as fh:
+            fh.write(f"{f}\n")
+    with open(optdir / "setup.leap", "w") as f:
+        f.write("quit\n")
+    optionLines = [
+        "$options\n",
+        "jobtype single\n",
+        "forcefield dasa.frcmod dasa.mol2\n",
+    ]
+    optionLines.append("$end\n")
+    targets = []
+    for name in objectives.keys():
+        (optdir / "targets" / name).mkdir(parents=True)
+        with open(optdir / "targets" / name / "qdata.txt", "w") as f:
+            f.write(f"{name}\n")
+        lines = [
+            "$target\n",
+            "type abinitio_amber\n",
+            f"name {name}\n",
+            "amber_leapcmd setup.leap\n",
+            "$end\n",
+        ]
+        targets.append((name, lines))
+    return optionLines, targets
+
+
+def test_runCachedJobs(monkeypatch, tmp_path):
+    calls = []
+
+    def fakeForceBalance(inp, out, err=None):
+        calls.append((inp, [name for name, lines in targetcache.readFBInput(inp)[1]]))
+        copyfile(home / "valid.out", out)
+
+    monkeypatch.setattr(optengine, "runForceBalance", fakeForceBalance)
+    monkeypatch.setattr(
+        optengine.OptEngine, "__init__", lambda self, inp: self.setVariables(inp)
+    )
+    options = getDefaults()
+    options.optdir = tmp_path
+    options.targetcache = True
+    optEngine = optengine.OptEngine(options)
+    os.chdir(tmp_path)
+    optionLines, targets = setupValidDir(tmp_path)
+    targetcache.writeFBInput("valid_4.in", optionLines, targets)
+    targetcache.writeFBInput("valid_3.in", optionLines, targets[:3])
+
+    # Nothing is cached yet, so every target is evaluated
+    optEngine.runValidJobs([("valid_4.in", "valid_4.out", "valid_4.err")])
+    assert calls == [("valid_4_uncached.in", list(objectives.keys()))]
+    assert checkUtils.checkFloats(
+        optEngine.readValid("valid_4.out"), 1.39869922, 0.00001
+    )
+
+    # The same targets with the same parameters are read from the cache
+    optEngine.runValidJobs([("valid_3.in", "valid_3.out", "valid_3.err")])
+    assert len(calls) == 1
+    ref = sum(list(objectives.values())[:3]) / 3
+    assert checkUtils.checkFloats(optEngine.readValid("valid_3.out"), ref, 0.000001)
+
+    # The cache persists, and changing the parameters invalidates it
+    optEngine = optengine.OptEngine(options)
+    with open(tmp_path / "forcefield" / "dasa.frcmod", "a") as f:
+        f.write("changed\n")
+    optEngine.runValidJobs([("valid_3.in", "valid_3.out", "valid_3.err")])
+    assert calls[1] == ("valid_3_uncached.in", ["valid_1", "valid_2", "valid_3"])
+    assert optEngine.targetCache.misses == 3
+
+
+def test_runCachedJobsFail(monkeypatch, tmp_path):
+    def fakeForceBalance(inp, out, err=None):
+        copyfile(home / "validFail.out", out)
+
+    monkeypatch.setattr(optengine, "runForceBalance", fakeForceBalance)
+    monkeypatch.setattr(
+        optengine.OptEngine, "__init__", lambda self, inp: self.setVariables(inp)
+    )
+    options = getDefaults()
+    options.optdir = tmp_path
+    options.targetcache = True
+    optEngine = optengine.OptEngine(options)
+    os.chdir(tmp_path)
+    optionLines, targets = setupValidDir(tmp_path)
+    targetcache.writeFBInput("valid_4.in", optionLines, targets)
+    optEngine.runValidJobs([("valid_4.in", "valid_4.out", "valid_4.err")])
+    assert optEngine.readValidOrNone("valid_4.out") is None
+    assert len(optEngine.targetCache.entries) == 0
+
+
+def test_selectTrainTargets(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        optengine.OptEngine, "__init__", lambda self, inp: self.setVariables(inp)
+    )
+    options = getDefaults()
+    options.targetwindow = 2
+    options.targetsample = 1
+    optEngine = optengine.OptEngine(options)
+    optionLines, targets = targetcache.readFBInput(home / "ref_inputs" / "opt_8.in")
+    optEngine.initialTarget = "train_1"
+    optEngine.targetLines = targets[1][1]
+    # train_8 was aged out of the previous cycle
+    targetcache.writeFBInput(tmp_path / "opt_9.in", optionLines, targets[:8])
+    optEngine.selectTrainTargets(tmp_path / "opt_9.in", 9)
+    testOptions, testTargets = targetcache.readFBInput(tmp_path / "opt_9.in")
+    names = [name for name, lines in testTargets]
+    assert testOptions == optionLines
+    assert len(names) == 4
+    assert names[0] == "dynamics"
+    assert names[1] in [f"train_{i}" for i in range(1, 8)]
+    assert names[2:] == ["train_8", "train_9"]
+    for name, lines in testTargets[1:]:
+        assert lines == [line.replace("train_1", name) for line in targets[1][1]]
+
+
+def test_setupInputFilesOnce(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        optengine.OptEngine, "__init__", lambda self, inp: self.setVariables(inp)
+    )
+    selections = []
+    monkeypatch.setattr(
+        optengine.OptEngine,
+        "selectTrainTargets",
+        lambda self, inputFile, i: selections.append((inputFile, i)),
+    )
+    options = getDefaults()
+    options.optdir = tmp_path
+    options.targetwindow = 2
+    optEngine = optengine.OptEngine(options)
+    optionLines, targets = targetcache.readFBInput(home / "ref_inputs" / "opt_8.in")
+    optEngine.initialTarget = "train_1"
+    optEngine.targetLines = targets[1][1]
+    optEngine.validTargetLines = targets[1][1]
+    os.chdir(tmp_path)
+    targetcache.writeFBInput("opt_8.in", optionLines, targets)
+    targetcache.writeFBInput("valid_8.in", optionLines, targets[:1])
+    # Set up while sampling, then again by optimizeForcefield
+    optEngine.setupInputFiles(9)
+    optEngine.setupInputFiles(9)
+    os.chdir(home)
+    assert selections == [("opt_9.in", 9)]
@@ -0,0 +1,144 @@
+import os
+import pickle
+import socket
+import sys
+from multiprocessing import Pool
+from pathlib import Path
+from shutil import copyfile
+
+import pytest
+
+from ff_optimizer import qmengine, utils
+
+from . import tcserver_stub
+from .test_inputs import getDefaults
+
+home = Path(__file__).parent.absolute()
+outputs = home / "qmengine" / "restart"
+
+
+def getFreePort():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def getInput(devices="0"):
+    inp = getDefaults()
+    inp.tctemplate = home / "qmengine" / "tc.in"
+    inp.tctemplate_backup = home / "qmengine" / "tc_backup.in"
+    inp.sampledir = Path("")
+    inp.tcdevices = devices
+    inp.tcport = getFreePort()
+    inp.tcservercommand = (
+        f"{sys.executable} {home / 'tcserver_stub.py'} {{port}} {outputs}"
+    )
+    return inp
+
+
+def readLog(server):
+    with open(server.log, "r") as f:
+        return f.readlines()
+
+
+def test_getQMRefData(monkeypatch, tmp_path):
+    monkeypatch.setattr(qmengine, "connectTCServer", tcserver_stub.connectStub)
+    os.chdir(tmp_path)
+    engine = qmengine.TCServerEngine(getInput("2,3"))
+    try:
+        pids = [server.process.pid for server in engine.servers]
+        for i, server in enumerate(engine.servers):
+            assert server.port == engine.servers[0].port + i
+            assert readLog(server)[0] == f"device {i + 2}\n"
+        (tmp_path / "qm").mkdir()
+        for i in range(1, 11):
+            copyfile(outputs / f"{i}.xyz", tmp_path / "qm" / f"{i}.xyz")
+        os.chdir(tmp_path / "qm")
+        engine.getQMRefData(utils.getXYZs())
+        # Failed jobs were retried with the backup settings on the same servers
+        assert [server.process.pid for server in engine.servers] == pids
+        jobs = readLog(engine.servers[0])[1:] + readLog(engine.servers[1])[1:]
+        assert len(jobs) == 13
+        assert sorted(job for job in jobs if "backup" in job) == [
+            "job 3 backup\n",
+            "job 6 backup\n",
+            "job 9 backup\n",
+        ]
+        for i in range(1, 11):
+            assert qmengine.checkTCResult(f"tc_{i}.out")
+        with open("qdata.txt", "r") as f:
+            assert f.read().count("JOB") == 10
+    finally:
+        engine.stopServers()
+    for server in engine.servers:
+        assert server.process is None
+        assert not server.isListening()
+
+
+def test_restartServer(monkeypatch, tmp_path):
+    monkeypatch.setattr(qmengine, "connectTCServer", tcserver_stub.connectStub)
+    os.chdir(tmp_path)
+    engine = qmengine.TCServerEngine(getInput())
+    try:
+        programInput = engine.createProgramInputs([outputs / "1.xyz"])[0]
+        server = engine.servers[0]
+        pid = server.compute(programInput).pid
+        server.release()
+        # Another server object on the same port uses the running server
+        other = qmengine.TCServer(server.command, "0", server.port)
+        other.start()
+        assert other.process is None
+        assert other.compute(programInput).pid == pid
+        other.stop()
+        assert server.isListening()
+        # The server is restarted if it dies
+        server.process.kill()
+        server.process.wait()
+        assert server.compute(programInput).pid != pid
+    finally:
+        engine.stopServers()
+
+
+def getQMRefDataParallel(engine, folder):
+    qmengine.connectTCServer = tcserver_stub.connectStub
+    os.chdir(folder)
+    engine.getQMRefData(utils.getXYZs())
+
+
+def test_getQMRefDataProcesses(monkeypatch, tmp_path):
+    monkeypatch.setattr(qmengine, "connectTCServer", tcserver_stub.connectStub)
+    os.chdir(tmp_path)
+    engine = qmengine.TCServerEngine(getInput("0,1"))
+    try:
+        folders = [tmp_path / "qm1", tmp_path / "qm2"]
+        for folder in folders:
+            folder.mkdir()
+            for i in range(1, 11):
+                copyfile(outputs / f"{i}.xyz", folder / f"{i}.xyz")
+        # Copies of the engine in pool workers lease the servers, so while
+        # this process holds the first one, every job runs on the second
+        busy = pickle.loads(pickle.dumps(engine.servers[0]))
+        assert busy.lease()
+        with Pool(2) as p:
+            results = p.starmap_async(
+                getQMRefDataParallel, [(engine, folder) for folder in folders], 1
+            )
+            results.get(timeout=60)
+        assert len(readLog(engine.servers[0])[1:]) == 0
+        assert len(readLog(engine.servers[1])[1:]) == 26
+        for folder in folders:
+            with open(folder / "qdata.txt", "r") as f:
+                assert f.read().count("JOB") == 10
+        assert not engine.servers[0].lease()
+        busy.release()
+        assert engine.servers[0].lease()
+        engine.servers[0].release()
+    finally:
+        engine.stopServers()
+
+
+def test_serverFails(tmp_path):
+    os.chdir(tmp_path)
+    server = qmengine.TCServer(f"{sys.executable} -c 'exit(3)' {{port}}", "0", 1)
+    with pytest.raises(RuntimeError, match="exited with code 3"):
+        server.start()
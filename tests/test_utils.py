@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+from shutil import rmtree
 
 import numpy as np
 
@@ -41,6 +42,26 @@ def test_readGradFromTCout_TCCloud():
     assert checkUtils.checkArrays(grads, testGrads)
 
 
+def test_parseTCOutput():
+    os.chdir(home)
+    testEnergy, testGrads = utils.parseTCOutput(os.path.join("qmengine", "test.out"))
+    energy = np.loadtxt(os.path.join("qmengine", "energy.txt"))
+    grads = np.loadtxt(os.path.join("qmengine", "grads.txt")).flatten()
+    assert checkUtils.checkFloats(energy, testEnergy)
+    assert checkUtils.checkArrays(grads, testGrads)
+    assert utils.parseTCOutput(os.path.join("qmengine", "restart", "tc_3.out")) is None
+
+
+def test_readEsp():
+    espXYZ, esp = utils.readEsp(home / "qmengine" / "test" / "esp_1.xyz")
+    ref = np.loadtxt(
+        home / "qmengine" / "test" / "esp_1.xyz", skiprows=2, usecols=(1, 2, 3, 4)
+    )
+    assert espXYZ.shape == (3 * ref.shape[0],)
+    assert np.array_equal(espXYZ, ref[:, :3].flatten())
+    assert np.array_equal(esp, ref[:, 3])
+
+
 def test_convertTCtoFB():
     os.chdir(home / "utils" / "dynamics")
     utils.convertTCtoFB("tc.out", "coors.xyz", 100)
@@ -198,3 +219,91 @@ def test_getSymbolsFromPrmtop():
     _, refSymbols = utils.readXYZ("prmtop_test.xyz", readSymbols=True)
     testSymbols = utils.getSymbolsFromPrmtop("test.prmtop")
     assert checkUtils.checkLists(list(refSymbols), testSymbols)
+
+
+def test_indexXYZ():
+    index = utils.indexXYZ(home / "mmengine" / "coors.xyz")
+    assert index["natoms"] == 18
+    assert len(index["offsets"]) == 1000
+    assert index["frames"][0] == 0
+    assert np.all(np.diff(index["frames"]) > 0)
+    frame = utils.readXYZFrame(
+        home / "mmengine" / "coors.xyz", index["offsets"][23], index["natoms"]
+    )
+    refCoords = utils.readXYZ(home / "mmengine" / "23.xyz")
+    testCoords = np.asarray(frame, dtype=np.float32).flatten()
+    assert checkUtils.checkArrays(testCoords, refCoords)
+
+
+def test_loadXYZIndex():
+    os.chdir(os.path.join(home, "utils"))
+    with open(home / "mmengine" / "coors2.xyz", "r") as f:
+        lines = f.readlines()
+    with open("temp_coors.xyz", "w") as f:
+        f.writelines(lines[:40])
+    index = utils.loadXYZIndex("temp_coors.xyz")
+    indexPath = utils.getXYZIndexPath("temp_coors.xyz")
+    assert indexPath.is_file()
+    assert len(index["offsets"]) == 2
+    assert list(index["frames"]) == [0, 1]
+    # Cached index should be invalidated when the file changes
+    with open("temp_coors.xyz", "a") as f:
+        f.writelines(lines[40:])
+    index = utils.loadXYZIndex("temp_coors.xyz")
+    os.remove("temp_coors.xyz")
+    os.remove(indexPath)
+    assert len(index["offsets"]) == 3
+    assert index["offsets"][2] == len("".join(lines[:40]))
+
+
+def test_geometryStore():
+    os.chdir(os.path.join(home, "utils", "test_nc"))
+    _, symbols = utils.readXYZ("ref_1.xyz", readSymbols=True)
+    coords = utils.readNCGeometries("test.nc", symbols)
+    assert coords.shape == (10, 3 * len(symbols))
+    os.mkdir("store")
+    utils.writeGeometries(coords, symbols, "store")
+    xyzs = utils.getXYZs("store")
+    geometries, testSymbols = utils.readGeometries("store")
+    utils.writeXYZs(["3.xyz"], "store")
+    written = os.listdir("store")
+    testCoords = utils.readXYZ(os.path.join("store", "3.xyz"))
+    rmtree("store")
+    assert len(xyzs) == 10
+    assert xyzs[0] == Path("store") / "1.xyz"
+    assert checkUtils.checkLists(list(symbols), list(testSymbols))
+    assert sorted(written) == ["3.xyz", "geometries.npz"]
+    for i in range(1, 11):
+        refCoords = utils.readXYZ(f"ref_{i}.xyz")
+        assert checkUtils.checkArrays(geometries[str(i)], refCoords)
+    assert checkUtils.checkArrays(testCoords, utils.readXYZ("ref_3.xyz"))
+
+
+def test_formatFloats():
+    rng = np.random.default_rng(404)
+    for ndigits in [5, 6, 7, 8]:
+        # include exact ties, tiny and huge values, and signed zeros
+        ties = (rng.integers(-(10**6), 10**6, 1000) + 0.5) / 10**ndigits
+        values = np.concatenate(
+            [rng.normal(0, 3, 1000), ties, [0.0, -0.0, 1e-9, -4e-5, 1e17, 2.5]]
+        )
+        refLine = ""
+        for value in values:
+            refLine = refLine + str(round(float(value), ndigits)) + " "
+        assert utils.formatFloats(values, ndigits) == refLine
+    assert utils.formatFloats(["1.2345678", "-0.5"], 6) == "1.234568 -0.5 "
+    assert utils.formatFloats([], 6) == ""
+
+
+def test_writeMdcrd():
+    os.chdir(os.path.join(home, "utils"))
+    coords = [np.arange(12, dtype=np.float32) / 3, np.arange(12) - 5.5]
+    utils.writeMdcrd(coords, "temp.mdcrd", "test")
+    with open("temp.mdcrd", "r") as f:
+        lines = f.readlines()
+    os.remove("temp.mdcrd")
+    assert lines[0] == "test\n"
+    assert len(lines) == 5
+    assert lines[1] == "".join(["%8.3f" % (i / 3) for i in range(10)]) + "\n"
+    assert lines[2] == "%8.3f%8.3f\n" % (10 / 3, 11 / 3)
+    assert lines[4] == "%8.3f%8.3f\n" % (4.5, 5.5)